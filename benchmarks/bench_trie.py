@@ -0,0 +1,324 @@
+"""
+Benchmarks for the core trie operations.
+
+Every combination of trie size, mode (secure or not) and key length is built
+with `update` and then measured. The read operations and the proofs run on a
+sample of the keys, so large tries don't take much longer than the build.
+
+Results are written as JSON. A result file can be saved as a baseline and
+passed to a later run with `--baseline`, operations that got slower than
+the threshold are reported and make the script exit with status 1.
+
+Examples
+--------
+    python benchmarks/bench_trie.py --sizes 1000 100000 --output baseline.json
+    python benchmarks/bench_trie.py --sizes 1000 100000 --baseline baseline.json
+"""
+import sys, os
+
+#Following lines are for assigning parent directory dynamically.
+dir_path = os.path.dirname(os.path.realpath(__file__))
+parent_dir_path = os.path.abspath(os.path.join(dir_path, os.pardir))
+sys.path.insert(0, parent_dir_path)
+from src.mpt.mpt import MerklePatriciaTrie
+from src.mpt.mmpt import ModifiedMerklePatriciaTrie
+from src.mpt.proof import Proof
+from src.mpt import verify as verification
+import argparse
+import datetime
+import gc
+import json
+import platform
+import random
+import time
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+# Key lengths in bytes.
+KEY_LENGTHS = {"short": 8, "long": 64}
+VALUE_LENGTH = 32
+
+
+def random_keys(count, length, seed):
+    """Return `count` distinct random keys of `length` bytes."""
+    generator = random.Random(seed)
+    keys = set()
+    while len(keys) < count:
+        keys.add(generator.getrandbits(length * 8).to_bytes(length, "big"))
+    return sorted(keys)
+
+
+def measure(function, repeat=1):
+    """
+    Run the function and return the time of the fastest run in seconds.
+
+    The garbage collector is disabled while the function runs, like `timeit` does.
+    """
+    best = None
+    for _ in range(repeat):
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            function()
+            seconds = time.perf_counter() - start
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def bench_case(size, secure, key_kind, samples, repeat):
+    """
+    Measure all operations on one trie.
+
+    Parameters
+    ----------
+    size : int
+        Number of keys in the trie.
+    secure : bool
+        Use a secure trie (keys are hashed).
+    key_kind : str
+        Name of the key length in `KEY_LENGTHS`.
+    samples : int
+        Number of keys used for the read operations and the proofs.
+    repeat : int
+        Number of runs of the read operations, the fastest run is reported.
+
+    Returns
+    -------
+    list of dict
+        One result per operation.
+    """
+    length = KEY_LENGTHS[key_kind]
+    keys = random_keys(size, length, seed="keys-{}".format(size))
+    generator = random.Random("values-{}".format(size))
+    generator.shuffle(keys)
+    values = [
+        generator.getrandbits(VALUE_LENGTH * 8).to_bytes(VALUE_LENGTH, "big")
+        for _ in keys
+    ]
+
+    sample = keys[: min(samples, size)]
+    key_set = set(keys)
+    missing = [
+        key
+        for key in random_keys(len(sample), length, seed="missing-{}".format(size))
+        if key not in key_set
+    ]
+
+    results = []
+
+    def record(name, operations, seconds):
+        results.append(
+            {
+                "name": name,
+                "size": size,
+                "secure": secure,
+                "keys": key_kind,
+                "operations": operations,
+                "seconds": seconds,
+                "us_per_operation": seconds / operations * 1e6,
+            }
+        )
+
+    trie = MerklePatriciaTrie({}, secure=secure)
+
+    def update():
+        for key, value in zip(keys, values):
+            trie.update(key, value)
+
+    record("update", size, measure(update))
+
+    def get():
+        for key in sample:
+            trie.get(key)
+
+    record("get", len(sample), measure(get, repeat))
+
+    def contains():
+        for key in sample:
+            trie.contains(key)
+
+    record("contains", len(sample), measure(contains, repeat))
+
+    inclusion_proofs = []
+    exclusion_proofs = []
+
+    def prove_inclusion():
+        inclusion_proofs[:] = [trie.get_proof_of_inclusion(key) for key in sample]
+
+    def prove_exclusion():
+        exclusion_proofs[:] = [trie.get_proof_of_exclusion(key) for key in missing]
+
+    record("proof_of_inclusion", len(sample), measure(prove_inclusion, repeat))
+    record("proof_of_exclusion", len(missing), measure(prove_exclusion, repeat))
+
+    def verify_inclusion():
+        for key, proof in zip(sample, inclusion_proofs):
+            assert trie.verify_proof_of_inclusion(key, proof)
+
+    def verify_exclusion():
+        for key, proof in zip(missing, exclusion_proofs):
+            assert trie.verify_proof_of_exclusion(key, proof)
+
+    record("verify_inclusion", len(sample), measure(verify_inclusion, repeat))
+    record("verify_exclusion", len(missing), measure(verify_exclusion, repeat))
+
+    # The same proofs verified one by one and as one batch that shares the nodes.
+    root_hash = trie.root_hash()
+    proofs = [Proof(key, root_hash, proof, "POI") for key, proof in zip(sample, inclusion_proofs)]
+    proofs += [Proof(key, root_hash, proof, "POE") for key, proof in zip(missing, exclusion_proofs)]
+
+    def verify_separately():
+        for proof in proofs:
+            if proof.type == "POI":
+                assert verification.verify_inclusion(root_hash, proof.target, proof.proof, secure)
+            else:
+                assert verification.verify_exclusion(root_hash, proof.target, proof.proof, secure)
+
+    def verify_batch():
+        assert all(verification.verify_proofs(proofs, root_hash, secure))
+
+    record("verify_separately", len(proofs), measure(verify_separately, repeat))
+    record("verify_proofs", len(proofs), measure(verify_batch, repeat))
+
+    # Pickling is implemented by the MMPT, it stores the nodes as they are.
+    saved_trie = ModifiedMerklePatriciaTrie(trie._storage, trie.root())
+    pickled = []
+
+    def to_pickle():
+        pickled[:] = [saved_trie.to_pickle()]
+
+    def from_pickle():
+        ModifiedMerklePatriciaTrie({}).from_pickle(pickled[0])
+
+    record("to_pickle", 1, measure(to_pickle, repeat))
+    record("from_pickle", 1, measure(from_pickle, repeat))
+
+    # Deferred mode hashes all nodes when the root hash is requested.
+    deferred_trie = MerklePatriciaTrie({}, secure=secure, deferred=True)
+    deferred_trie.update_batch(zip(keys, values))
+    record("root_hash", 1, measure(deferred_trie.root_hash))
+
+    def delete():
+        for key in sample:
+            trie.delete(key)
+
+    record("delete", len(sample), measure(delete))
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with a baseline.
+
+    Parameters
+    ----------
+    results : list of dict
+        Results of this run.
+    baseline : list of dict
+        Results of the baseline run.
+    threshold : float
+        Ratio of the time per operation above which a result is a regression.
+
+    Returns
+    -------
+    list of dict
+        The results that are in the baseline, with the baseline time and ratio
+        added and a `regression` flag.
+    """
+    def identify(result):
+        return (result["name"], result["size"], result["secure"], result["keys"])
+
+    baseline = {identify(result): result for result in baseline}
+    compared = []
+    for result in results:
+        old = baseline.get(identify(result))
+        if old is None:
+            continue
+        ratio = result["us_per_operation"] / old["us_per_operation"]
+        compared.append(
+            dict(
+                result,
+                baseline_us_per_operation=old["us_per_operation"],
+                ratio=ratio,
+                regression=ratio > threshold,
+            )
+        )
+    return compared
+
+
+def main(arguments=None):
+    """Run the benchmarks, return the exit status."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="numbers of keys in the trie (default: %(default)s)")
+    parser.add_argument("--modes", nargs="+", choices=["plain", "secure"], default=["plain", "secure"],
+                        help="trie modes (default: %(default)s)")
+    parser.add_argument("--keys", nargs="+", choices=sorted(KEY_LENGTHS), default=sorted(KEY_LENGTHS),
+                        help="key lengths (default: %(default)s)")
+    parser.add_argument("--samples", type=int, default=1000,
+                        help="keys used for reads and proofs (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs of the read operations, the fastest counts (default: %(default)s)")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.1,
+                        help="slowdown ratio reported as a regression (default: %(default)s)")
+    arguments = parser.parse_args(arguments)
+
+    results = []
+    for size in arguments.sizes:
+        for mode in arguments.modes:
+            for key_kind in arguments.keys:
+                print("Running {} keys, {}, {} keys".format(size, mode, key_kind), file=sys.stderr)
+                results.extend(
+                    bench_case(size, mode == "secure", key_kind, arguments.samples, arguments.repeat)
+                )
+
+    report = {
+        "meta": {
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "samples": arguments.samples,
+            "repeat": arguments.repeat,
+        },
+        "results": results,
+    }
+
+    status = 0
+    if arguments.baseline:
+        with open(arguments.baseline) as fileobj:
+            baseline = json.load(fileobj)["results"]
+        report["comparison"] = compare(results, baseline, arguments.threshold)
+        for result in report["comparison"]:
+            if result["regression"]:
+                status = 1
+                print(
+                    "REGRESSION {name} {size} {mode} {keys}: {us:.1f} us -> {new:.1f} us ({ratio:.2f}x)".format(
+                        name=result["name"],
+                        size=result["size"],
+                        mode="secure" if result["secure"] else "plain",
+                        keys=result["keys"],
+                        us=result["baseline_us_per_operation"],
+                        new=result["us_per_operation"],
+                        ratio=result["ratio"],
+                    ),
+                    file=sys.stderr,
+                )
+
+    output = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as fileobj:
+            fileobj.write(output + "\n")
+    else:
+        print(output)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+from .verify import verify_inclusion, verify_exclusion, verify_proofs
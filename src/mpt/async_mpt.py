@@ -0,0 +1,507 @@
+from collections.abc import MutableMapping
+from .hash import keccak_hash_many
+from .mpt import MerklePatriciaTrie
+from .nibble_path import NibblePath
+from .node import Node, Extension, Branch, _is_empty_reference
+from typing import List, Optional, Tuple
+import asyncio
+
+
+class _NodeNotLoaded(Exception):
+    """Raised by the overlay when the trie needs a node that isn't fetched yet."""
+
+    def __init__(self, reference):
+        super().__init__(reference)
+        self.reference = reference
+
+
+class _NodeOverlay(MutableMapping):
+    """
+    Synchronous storage of the wrapped trie.
+
+    Holds the nodes fetched for the running operation and the nodes written
+    since the last commit. Reading any other node raises `_NodeNotLoaded`, so
+    the async trie can fetch it and run the operation again.
+    """
+
+    def __init__(self):
+        self.loaded = {}
+        self.pending = {}
+
+    def __getitem__(self, key):
+        try:
+            return self.pending[key]
+        except KeyError:
+            pass
+
+        try:
+            value = self.loaded[key]
+        except KeyError:
+            raise _NodeNotLoaded(key) from None
+        if value is None:
+            # The async storage doesn't have the node.
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.pending[key] = value
+
+    def __delitem__(self, key):
+        del self.pending[key]
+
+    def __iter__(self):
+        return iter(self.pending)
+
+    def __len__(self):
+        return len(self.pending)
+
+
+class AsyncMerklePatriciaTrie:
+    """
+    This class represents a trie whose nodes live in an async storage.
+
+    The storage must implement two coroutines (see `AsyncDictStorage`):
+    `get_many(keys)` returns the encoded nodes for a list of keys (None for
+    missing keys) and `set_many(items)` stores (key, encoded node) pairs.
+
+    Before an operation runs, the nodes on the paths of its keys are fetched
+    level by level, one request per level for all keys together. Nodes that
+    concurrent operations need at the same time go into the same request and
+    fetches that are in flight are shared. Large requests are split in
+    `get_many` calls of `fetch_size` keys that are sent concurrently. The trie
+    algorithms are those of `MerklePatriciaTrie` in deferred mode, modified
+    nodes are kept in memory and `commit` writes them with one `set_many`.
+
+    Methods
+    -------
+    get(encoded_key)
+        This method gets a value associtated with provided key.
+    get_many(encoded_keys)
+        This method gets the values of many keys.
+    contains(encoded_key)
+        This method checks if the key is in the trie.
+    update(encoded_key, encoded_value)
+        This method updates a provided key-value pair into the trie.
+    update_batch(items)
+        This method updates many key-value pairs with one root recomputation.
+    delete(encoded_key)
+        This method removes a value associtated with provided key.
+    delete_batch(encoded_keys)
+        This method removes many keys with one root recomputation.
+    commit()
+        This method writes the modified nodes to the storage.
+    root()
+        Return the root node of the trie.
+    root_hash()
+        Return the hash of the root node of the trie.
+    get_proof_of_inclusion(encoded_key)
+        This method returns a proof of inclusion for a key.
+    get_proof_of_exclusion(encoded_key)
+        This method returns a proof of exclusion for a key.
+    """
+
+    def __init__(
+        self,
+        storage,
+        root: Optional[bytes] = None,
+        secure: bool = False,
+        cache_size: int = 1024,
+        fetch_size: int = 256,
+    ) -> ...:
+        """
+        Create a new instance of the async MPT.
+
+        Parameters
+        ----------
+        storage: async storage
+            Storage with `get_many` and `set_many` coroutines, like `AsyncDictStorage`.
+        root: bytes
+            (Optional) Root node (not root hash!) of the trie, empty if not provided.
+        secure: bool
+            (Optional) In secure mode all the keys are hashed using keccak256 internally.
+        cache_size: int
+            (Optional) Maximum number of decoded nodes that are cached, 0 disables the cache.
+        fetch_size: int
+            (Optional) Maximum number of nodes requested with one `get_many` call.
+        """
+        if fetch_size < 1:
+            raise ValueError("The fetch size must be at least 1")
+
+        self._storage = storage
+        self._secure = secure
+        self._fetch_size = fetch_size
+        self._overlay = _NodeOverlay()
+        self._trie = MerklePatriciaTrie(
+            self._overlay, root, secure=secure, deferred=True, cache_size=cache_size
+        )
+        # Futures of the requests in flight by node reference.
+        self._in_flight = {}
+        # References queued for the next request and the future of its result.
+        self._batch = None
+        self._tasks = set()
+
+    async def get(self, encoded_key: bytes) -> bytes:
+        """
+        This method gets a value associtated with provided key.
+
+        See `MerklePatriciaTrie.get`.
+
+        Parameters
+        ----------
+        encoded_key: bytes
+            Key or RLP-encoded key.
+
+        Returns
+        -------
+        bytes
+            Stored value associated with provided key.
+        """
+        return await self._run([encoded_key], lambda: self._trie.get(encoded_key))
+
+    async def get_many(self, encoded_keys: List[bytes]) -> List[bytes]:
+        """
+        This method gets the values of many keys.
+
+        The nodes of all keys are fetched together, so the number of storage
+        requests depends on the depth of the trie, not on the number of keys.
+
+        Parameters
+        ----------
+        encoded_keys: list of bytes
+            Keys or RLP-encoded keys.
+
+        Returns
+        -------
+        list of bytes
+            Stored values in the order of the keys.
+        """
+        encoded_keys = list(encoded_keys)
+        return await self._run(
+            encoded_keys, lambda: [self._trie.get(key) for key in encoded_keys]
+        )
+
+    async def contains(self, encoded_key: bytes) -> bool:
+        """
+        This method checks if the key is in the trie.
+
+        Parameters
+        ----------
+        encoded_key: bytes
+            Key or RLP-encoded key.
+
+        Returns
+        -------
+        bool
+            True if the key is in the trie.
+        """
+        return await self._run([encoded_key], lambda: self._trie.contains(encoded_key))
+
+    async def update(self, encoded_key: bytes, encoded_value: bytes) -> ...:
+        """
+        This method updates a provided key-value pair into the trie.
+
+        The modified nodes are kept in memory until `commit` is called.
+
+        Parameters
+        ----------
+        encoded_key: bytes
+            Key or RLP-encoded key.
+        encoded_value: bytes
+            Value or RLP-encoded value.
+        """
+        await self._run(
+            [encoded_key], lambda: self._trie.update(encoded_key, encoded_value)
+        )
+
+    async def update_batch(self, items: List[Tuple[bytes, bytes]]) -> ...:
+        """
+        This method updates many key-value pairs with one root recomputation.
+
+        See `MerklePatriciaTrie.update_batch`.
+
+        Parameters
+        ----------
+        items: iterable of (bytes, bytes)
+            Pairs of key (or RLP-encoded key) and value (or RLP-encoded value).
+        """
+        items = list(items)
+        await self._run(
+            [key for key, _ in items], lambda: self._trie.update_batch(items)
+        )
+
+    async def delete(self, encoded_key: bytes) -> ...:
+        """
+        This method removes a value associtated with provided key.
+
+        See `MerklePatriciaTrie.delete`.
+
+        Parameters
+        ----------
+        encoded_key: bytes
+            Key or RLP-encoded key.
+        """
+        await self._run([encoded_key], lambda: self._trie.delete(encoded_key))
+
+    async def delete_batch(self, encoded_keys: List[bytes]) -> ...:
+        """
+        This method removes many keys with one root recomputation.
+
+        See `MerklePatriciaTrie.delete_batch`.
+
+        Parameters
+        ----------
+        encoded_keys: iterable of bytes
+            Keys or RLP-encoded keys.
+        """
+        encoded_keys = list(encoded_keys)
+        await self._run(encoded_keys, lambda: self._trie.delete_batch(encoded_keys))
+
+    async def commit(self) -> ...:
+        """
+        This method writes the modified nodes to the storage.
+
+        Every modified node is encoded and hashed once and all of them are
+        written with one `set_many` request. Until the request is done the
+        nodes are still read from memory.
+        """
+        self._trie.commit()
+        pending = dict(self._overlay.pending)
+        if not pending:
+            return
+
+        await self._storage.set_many(list(pending.items()))
+        for key in pending:
+            self._overlay.pending.pop(key, None)
+
+    def root(self) -> Optional[bytes]:
+        """
+        Return the root node of the trie.
+
+        The root is computed without writing to the storage, call `commit`
+        to store the nodes.
+
+        Returns
+        -------
+        bytes or None
+            Root node of the trie, None if the trie is empty.
+        """
+        return self._trie.root()
+
+    def root_hash(self) -> bytes:
+        """
+        Return the hash of the root node of the trie.
+
+        See `root`.
+
+        Returns
+        -------
+        bytes
+            Hash of the root node.
+        """
+        return self._trie.root_hash()
+
+    async def get_proof_of_inclusion(self, encoded_key: bytes) -> List[bytes]:
+        """
+        This method returns a proof of inclusion for a key.
+
+        See `MerklePatriciaTrie.get_proof_of_inclusion`, proofs are verified
+        with `mpt.verify_inclusion`.
+
+        Parameters
+        ----------
+        encoded_key: bytes
+            Key or RLP-encoded key.
+
+        Returns
+        -------
+        list of bytes
+            The encoded nodes of the proof.
+        """
+        return await self._run(
+            [encoded_key], lambda: self._trie.get_proof_of_inclusion(encoded_key)
+        )
+
+    async def get_proof_of_exclusion(self, encoded_key: bytes) -> List[bytes]:
+        """
+        This method returns a proof of exclusion for a key.
+
+        See `MerklePatriciaTrie.get_proof_of_exclusion`, proofs are verified
+        with `mpt.verify_exclusion`.
+
+        Parameters
+        ----------
+        encoded_key: bytes
+            Key or RLP-encoded key.
+
+        Returns
+        -------
+        list of bytes
+            The encoded nodes of the proof.
+        """
+        return await self._run(
+            [encoded_key], lambda: self._trie.get_proof_of_exclusion(encoded_key)
+        )
+
+    async def _run(self, encoded_keys, operation):
+        """
+        Fetch the nodes on the paths of the keys and run the operation.
+
+        Some operations read nodes beside the paths (like deletes that merge
+        a branch with its last child) and concurrent writes can move the root
+        while the nodes are fetched. In that case the missing node is fetched
+        and the operation runs again, it doesn't change the trie before it is
+        done.
+        """
+        if self._secure:
+            encoded_keys = keccak_hash_many(encoded_keys)
+        paths = [NibblePath(key) for key in encoded_keys]
+        loaded = await self._load(paths)
+        while True:
+            self._overlay.loaded = loaded
+            try:
+                return operation()
+            except _NodeNotLoaded as missing:
+                reference = missing.reference
+            finally:
+                self._overlay.loaded = {}
+            await self._fetch([reference], loaded)
+
+    async def _load(self, paths):
+        """
+        Fetch the nodes on the paths, one level of the trie at a time.
+
+        Parameters
+        ----------
+        paths: list of NibblePath
+            Paths of the keys.
+
+        Returns
+        -------
+        dict
+            Fetched encoded nodes by reference, None for missing nodes.
+        """
+        loaded = {}
+        root = self._trie._root
+        level = [(root, path) for path in paths] if root else []
+        while level:
+            await self._fetch([node_ref for node_ref, _ in level], loaded)
+            self._overlay.loaded = loaded
+            try:
+                level = [
+                    step
+                    for step in (self._child_on_path(*item) for item in level)
+                    if step is not None
+                ]
+            finally:
+                self._overlay.loaded = {}
+
+        return loaded
+
+    def _child_on_path(self, node_ref, path):
+        """Return the child reference and rest of the path, None at the end of the path."""
+        try:
+            node = self._trie._get_node(node_ref)
+        except KeyError:
+            # Missing node, the operation raises the error.
+            return None
+
+        if type(node) is Extension:
+            if path.starts_with(node.path):
+                return node.next_ref, path.consume(len(node.path))
+        elif type(node) is Branch and len(path) > 0:
+            child_ref = node.branches[path.at(0)]
+            if not _is_empty_reference(child_ref):
+                return child_ref, path.consume(1)
+        return None
+
+    async def _fetch(self, references, loaded):
+        """
+        Fetch the stored nodes that are not loaded or cached yet.
+
+        Nodes that are in flight are awaited, the others are queued for the
+        next request.
+
+        Parameters
+        ----------
+        references: list
+            References to nodes, inline nodes and in-memory nodes are skipped.
+        loaded: dict
+            Fetched encoded nodes by reference, updated in place.
+        """
+        futures = {}
+        queued = []
+        for node_ref in references:
+            if isinstance(node_ref, Node) or len(node_ref) != 32:
+                continue
+            if (
+                node_ref in loaded
+                or node_ref in futures
+                or node_ref in self._overlay.pending
+                or node_ref in self._trie._node_cache
+            ):
+                continue
+            future = self._in_flight.get(node_ref)
+            if future is None:
+                queued.append(node_ref)
+            else:
+                futures[node_ref] = future
+
+        if queued:
+            future = self._queue(queued)
+            for node_ref in queued:
+                futures[node_ref] = future
+
+        for node_ref, future in futures.items():
+            loaded[node_ref] = (await future)[node_ref]
+
+    def _queue(self, references):
+        """
+        Add references to the next request and return the future of its result.
+
+        The request is sent once the event loop has run the other ready
+        operations, so the nodes that concurrent operations need at the same
+        time are fetched together.
+        """
+        if self._batch is None:
+            loop = asyncio.get_running_loop()
+            self._batch = ({}, loop.create_future())
+            loop.call_soon(self._dispatch)
+
+        batch, future = self._batch
+        for node_ref in references:
+            batch[node_ref] = None
+            self._in_flight[node_ref] = future
+        return future
+
+    def _dispatch(self):
+        """Send the queued references."""
+        batch, future = self._batch
+        self._batch = None
+        task = asyncio.ensure_future(self._send(list(batch), future))
+        # The loop only keeps weak references to tasks.
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, references, future):
+        """Request the nodes in chunks of `fetch_size` and publish the result."""
+        chunks = [
+            references[start : start + self._fetch_size]
+            for start in range(0, len(references), self._fetch_size)
+        ]
+        try:
+            responses = await asyncio.gather(
+                *(self._storage.get_many(chunk) for chunk in chunks)
+            )
+            result = {}
+            for chunk, encoded_nodes in zip(chunks, responses):
+                result.update(zip(chunk, encoded_nodes))
+            future.set_result(result)
+        except Exception as error:
+            # Raised in the operations waiting for the future.
+            future.set_exception(error)
+        finally:
+            if not future.done():
+                future.cancel()
+            for node_ref in references:
+                if self._in_flight.get(node_ref) is future:
+                    del self._in_flight[node_ref]
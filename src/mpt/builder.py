@@ -0,0 +1,170 @@
+from .nibble_path import NibblePath
+from .node import Leaf, Extension, Branch
+
+
+class _Frame:
+    """
+    Branch node of the builder that still gets children.
+
+    Attributes
+    ----------
+    depth : int
+        Number of nibbles above the branch.
+    path : NibblePath
+        Path of a key below the branch, its first `depth` nibbles lead to the branch.
+    branches : list
+        References to the children of the branch.
+    value : bytes
+        Value stored in the branch.
+
+    """
+
+    __slots__ = ("depth", "path", "branches", "value")
+
+    def __init__(self, depth, path):
+        self.depth = depth
+        self.path = path
+        self.branches = [b""] * 16
+        self.value = b""
+
+
+class SortedTrieBuilder:
+    """
+    Builds a trie from key-value pairs that are ordered by key.
+
+    The builder keeps the branches of the current key on a stack. When the next
+    key leaves a subtree, the subtree is finished and its nodes are written, so
+    every node is encoded, hashed and stored exactly once and the memory use only
+    depends on the length of the keys.
+
+    Methods
+    -------
+    add(key, value)
+        Add the next key-value pair.
+    finish()
+        Finish all pending nodes and return the root reference.
+
+    """
+
+    def __init__(self, write_node, offset=0):
+        """
+        Initialize the builder.
+
+        Parameters
+        ----------
+        write_node : callable
+            Function that stores a node and returns its reference.
+        offset : int
+            Number of nibbles skipped at the beginning of every key, used to
+            build a subtree whose keys share these nibbles.
+
+        """
+        self._write_node = write_node
+        self._offset = offset
+        self._stack = []
+        self._key = None
+        self._path = None
+        self._value = None
+
+    def add(self, key, value):
+        """
+        Add the next key-value pair.
+
+        Parameters
+        ----------
+        key : bytes
+            Key as stored in the trie. Keys must not decrease, for equal keys the
+            last value wins.
+        value : bytes
+            Value stored under the key.
+
+        Raises
+        ------
+        ValueError
+            If the key is smaller than the previous key.
+
+        """
+        if self._key is not None:
+            if key == self._key:
+                self._value = value
+                return
+            if key < self._key:
+                raise ValueError("Keys must be sorted, got {} after {}".format(
+                    key.hex(), self._key.hex()
+                ))
+
+        path = NibblePath(key, self._offset)
+        if self._key is not None:
+            self._push_previous(path.common_prefix_length(self._path))
+
+        self._key = key
+        self._path = path
+        self._value = value
+
+    def finish(self):
+        """
+        Finish all pending nodes and return the root reference.
+
+        Returns
+        -------
+        bytes or None
+            Reference to the root node, None if no pair was added.
+
+        """
+        if self._key is None:
+            return None
+
+        if not self._stack:
+            return self._write_node(Leaf(self._path, self._value))
+
+        self._add_leaf(self._stack[-1], self._path, self._value)
+        while len(self._stack) > 1:
+            frame = self._stack.pop()
+            self._add_child(self._stack[-1], frame)
+
+        frame = self._stack.pop()
+        reference = self._write_node(Branch(frame.branches, frame.value))
+        if frame.depth > 0:
+            reference = self._write_node(Extension(frame.path.prefix(frame.depth), reference))
+        return reference
+
+    def _push_previous(self, common_length):
+        """
+        Add the previous pair and finish the subtrees the next key doesn't enter.
+
+        Parameters
+        ----------
+        common_length : int
+            Length of the common prefix of the previous and the next key.
+
+        """
+        stack = self._stack
+        if not stack or stack[-1].depth < common_length:
+            stack.append(_Frame(common_length, self._path))
+        self._add_leaf(stack[-1], self._path, self._value)
+
+        while stack[-1].depth > common_length:
+            frame = stack.pop()
+            if not stack or stack[-1].depth < common_length:
+                stack.append(_Frame(common_length, frame.path))
+            self._add_child(stack[-1], frame)
+
+    def _add_leaf(self, parent, path, value):
+        """Store the value under the parent branch."""
+        if len(path) == parent.depth:
+            parent.value = value
+            return
+
+        leaf = Leaf(path.consume(parent.depth + 1), value)
+        parent.branches[path.at(parent.depth)] = self._write_node(leaf)
+
+    def _add_child(self, parent, frame):
+        """Write a finished branch and reference it from the parent branch."""
+        reference = self._write_node(Branch(frame.branches, frame.value))
+
+        extension_length = frame.depth - parent.depth - 1
+        if extension_length > 0:
+            extension_path = frame.path.consume(parent.depth + 1).prefix(extension_length)
+            reference = self._write_node(Extension(extension_path, reference))
+
+        parent.branches[frame.path.at(parent.depth)] = reference
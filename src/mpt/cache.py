@@ -0,0 +1,146 @@
+from collections import OrderedDict
+import threading
+
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used entry.
+
+    The cache is used to keep decoded nodes around so hot nodes (like the
+    nodes near the root) don't have to be decoded on every visit. The entries
+    are guarded by a lock so the cache can be shared by several threads.
+
+    Attributes
+    ----------
+    max_size : int
+        Maximum number of entries, 0 disables the cache.
+    hits : int
+        Number of lookups that found an entry.
+    misses : int
+        Number of lookups that did not find an entry.
+
+    Methods
+    -------
+    get(key)
+        Return the entry for the key or None.
+    put(key, value)
+        Add or replace the entry for the key.
+    invalidate(key)
+        Remove the entry for the key if present.
+    clear()
+        Remove all entries.
+    info()
+        Return the counters and the size of the cache.
+
+    """
+
+    def __init__(self, max_size):
+        """
+        Initialize the cache.
+
+        Parameters
+        ----------
+        max_size : int
+            Maximum number of entries, 0 disables the cache.
+
+        """
+        if max_size < 0:
+            raise ValueError("Cache size cannot be negative")
+
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of entries in the cache."""
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """Check if the key is in the cache without counting a hit or miss."""
+        return key in self._entries
+
+    def get(self, key):
+        """
+        Return the entry for the key and mark it as most recently used.
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the entry.
+
+        Returns
+        -------
+        object or None
+            The cached value, None if the key is not in the cache.
+
+        """
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Add or replace the entry for the key.
+
+        The least recently used entry is evicted if the cache is full.
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the entry.
+        value : object
+            Value to cache.
+
+        """
+        if self.max_size == 0:
+            return
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """
+        Remove the entry for the key if present.
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the entry.
+
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all entries, the counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        """
+        Return the counters and the size of the cache.
+
+        Returns
+        -------
+        dict
+            Dictionary with hits, misses, size and max_size.
+
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
@@ -55,3 +55,10 @@ class PoiError(Exception):
 
     def __init__(self, message):
         super().__init__(message)
+
+
+class ReadOnlyError(Exception):
+    """Exception raised when a read-only snapshot of a trie is modified."""
+
+    def __init__(self, message):
+        super().__init__(message)
@@ -1,20 +1,129 @@
-from Crypto.Hash import keccak
-from typing import Tuple, List
-from typeguard import typechecked
+"""
+Keccak256 hashing.
 
+The fastest installed keccak256 implementation is chosen at import time. The
+`MPT_KECCAK_BACKEND` environment variable selects one by name instead, see
+`BACKENDS` for the names. The name of the chosen implementation is `BACKEND`.
+"""
+import os
+from typing import List
 
-@typechecked
-def keccak_hash(data : bytes) -> bytes:
-    """Hash data with keccak256 algorithm."""
-    keccak_hash = keccak.new(digest_bits=256)
-    keccak_hash.update(data)
-    return keccak_hash.digest()
+# keccak256 of the empty string, used to check a backend is keccak and not sha3.
+_EMPTY_KECCAK = bytes.fromhex("c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470")
 
 
-@typechecked
-def keccak_hash_list(data :List[bytes]) -> bytes:
+def _pysha3():
+    """Return the hash functions of pysha3 (or safe-pysha3)."""
+    from sha3 import keccak_256
+
+    def keccak_hash(data):
+        """Hash data with keccak256 algorithm."""
+        return keccak_256(data).digest()
+
+    def keccak_hash_many(items):
+        """Hash every item with keccak256 algorithm, return the list of hashes."""
+        return [keccak_256(item).digest() for item in items]
+
+    return keccak_hash, keccak_hash_many
+
+
+def _pycryptodome(module):
+    """Return the hash functions of the keccak module of pycryptodome(x)."""
+    new = module.new
+
+    def keccak_hash(data):
+        """Hash data with keccak256 algorithm."""
+        return new(data=data, digest_bits=256).digest()
+
+    def keccak_hash_many(items):
+        """Hash every item with keccak256 algorithm, return the list of hashes."""
+        return [new(data=item, digest_bits=256).digest() for item in items]
+
+    return keccak_hash, keccak_hash_many
+
+
+def _crypto():
+    """Return the hash functions of pycryptodome."""
+    from Crypto.Hash import keccak
+    return _pycryptodome(keccak)
+
+
+def _cryptodome():
+    """Return the hash functions of pycryptodomex."""
+    from Cryptodome.Hash import keccak
+    return _pycryptodome(keccak)
+
+
+def _eth_hash():
+    """Return the hash functions of eth-hash, which picks its own backend."""
+    from eth_hash.auto import keccak
+
+    # The first call loads the backend of eth-hash (and raises ImportError if
+    # there is none), then `hasher` is the function of that backend.
+    keccak.hasher(b"")
+    hasher = keccak.hasher
+
+    def keccak_hash_many(items):
+        """Hash every item with keccak256 algorithm, return the list of hashes."""
+        return [hasher(item) for item in items]
+
+    return hasher, keccak_hash_many
+
+
+# Backends by name, fastest first.
+BACKENDS = {
+    "pysha3": _pysha3,
+    "pycryptodome": _crypto,
+    "pycryptodomex": _cryptodome,
+    "eth-hash": _eth_hash,
+}
+
+
+def _select_backend(name=None):
+    """
+    Return the name and the hash functions of a backend.
+
+    Parameters
+    ----------
+    name: str or None
+        Name of the backend, the fastest installed backend if None or empty.
+
+    Raises
+    ------
+    ValueError
+        Raised if there is no backend with that name.
+    ImportError
+        Raised if the backend (or, without name, any backend) is not installed.
+    """
+    if name:
+        if name not in BACKENDS:
+            raise ValueError(
+                "Unknown keccak backend {!r}, choose from {}".format(name, ", ".join(BACKENDS))
+            )
+        names = [name]
+    else:
+        names = list(BACKENDS)
+
+    for candidate in names:
+        try:
+            functions = BACKENDS[candidate]()
+        except ImportError:
+            if name:
+                raise
+            continue
+        if functions[0](b"") != _EMPTY_KECCAK:
+            # Old versions of pysha3 named the sha3 variant keccak.
+            if name:
+                raise ImportError("The {} backend does not compute keccak256".format(name))
+            continue
+        return (candidate,) + functions
+
+    raise ImportError("No keccak256 implementation found, install pycryptodome")
+
+
+BACKEND, keccak_hash, keccak_hash_many = _select_backend(os.environ.get("MPT_KECCAK_BACKEND"))
+
+
+def keccak_hash_list(data: List[bytes]) -> bytes:
     """Hash list of data with keccak256 algorithm."""
-    keccak_hash = keccak.new(digest_bits=256)
-    for item in data:
-        keccak_hash.update(item)
-    return keccak_hash.digest()
\ No newline at end of file
+    return keccak_hash(b"".join(data))
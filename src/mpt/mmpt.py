@@ -1,42 +1,148 @@
-from .mpt import MerklePatriciaTrie
+from .mpt import MerklePatriciaTrie, _exclusive
 from .hash import keccak_hash
 from .nibble_path import NibblePath
 from .node import Node, _prepare_reference_for_encoding, _prepare_reference_for_usage
 from .proof import Proof
+from .serialization import write_snapshot, read_snapshots
+from .exceptions import InvalidNodeError
 import rlp
 import pickle
+import random
 from typeguard import typechecked
-from typing import Union
+from typing import Union, Optional, MutableMapping
 
 
 class ModifiedMerklePatriciaTrie(MerklePatriciaTrie):
     """The MMPT class is a child of the MPT class and used to store and verify data."""
 
     @typechecked
-    def __init__(self, storage: dict = {}, root: bytes=...) -> ...:
+    def __init__(
+        self,
+        storage: MutableMapping = {},
+        root: bytes = ...,
+        deferred: bool = False,
+        cache_size: int = 1024,
+        auto_prune: int = 0,
+        keep_versions: int = 0,
+        collect_stats: bool = False,
+    ) -> ...:
         """
         Initialize the MMPT class.
 
         Parameters
         ----------
-        storage : dict
-            The storage of the trie.
+        storage : dict-like
+            The storage of the trie, for example a dict or `SQLiteStorage`.
         root : bytes
             The root of the trie. If None, the root is set to the empty node.
             If not None, the root is set to the given root.
+        deferred : bool
+            Keep modified nodes in memory until `commit` is called.
+        cache_size : int
+            Maximum number of decoded nodes that are cached, 0 disables the cache.
+        auto_prune : int
+            Number of write operations after which unreachable nodes are removed,
+            0 disables automatic pruning.
+        keep_versions : int
+            Number of most recent versions that pruning keeps readable.
+        collect_stats : bool
+            Count the work done by the trie, see `stats`.
         """
         self._type = "FULL MMPT"
-        super().__init__(storage, root, secure=True)
+        super().__init__(
+            storage,
+            root,
+            secure=True,
+            deferred=deferred,
+            cache_size=cache_size,
+            auto_prune=auto_prune,
+            keep_versions=keep_versions,
+            collect_stats=collect_stats,
+        )
+
+    @classmethod
+    def from_sorted_items(
+        cls, items, storage: Optional[MutableMapping] = None
+    ) -> "ModifiedMerklePatriciaTrie":
+        """
+        Build a trie from key-value pairs ordered by their hashed key.
+
+        The keys are hashed by the builder, so the pairs must be ordered by
+        the keccak256 hash of the key. See `MerklePatriciaTrie.from_sorted_items`.
+
+        Parameters
+        ----------
+        items : iterable of (bytes, bytes)
+            Pairs of key and value ordered by the hashed key.
+        storage : dict-like
+            Storage for the nodes, a new dict if not provided.
+
+        Returns
+        -------
+        ModifiedMerklePatriciaTrie
+            Trie with all the pairs.
+
+        Raises
+        ------
+        ValueError
+            If the hashed keys are not sorted.
+        """
+        trie = cls({} if storage is None else storage)
+        trie._root = trie._build_sorted(items)
+        return trie
+
+    @classmethod
+    def parallel_build(
+        cls,
+        items,
+        storage: Optional[MutableMapping] = None,
+        workers: Optional[int] = None,
+    ) -> "ModifiedMerklePatriciaTrie":
+        """
+        Build a trie from unsorted pairs in several processes.
+
+        See `MerklePatriciaTrie.parallel_build`.
+
+        Parameters
+        ----------
+        items : iterable of (bytes, bytes)
+            Pairs of key and value in any order.
+        storage : dict-like
+            Storage for the nodes, a new dict if not provided.
+        workers : int
+            Number of worker processes, the number of CPUs if not provided.
+
+        Returns
+        -------
+        ModifiedMerklePatriciaTrie
+            Trie with all the pairs.
+        """
+        trie = cls({} if storage is None else storage)
+        trie._root = trie._build_parallel(items, workers)
+        return trie
 
     # SAVING AND LOADING
     @typechecked
     def to_pickle(self) -> bytes:
-        """Convert the trie to a pickle byte string."""
+        """
+        Convert the trie to a pickle byte string.
+
+        The keys of the nodes are stored next to the nodes so loading
+        doesn't have to hash every node again.
+        """
+        self.commit()
         if self._type == "FULL MMPT":
-            storage_list = [
-                _prepare_reference_for_encoding(node) for node in self._storage.values()
-            ]
-            content = {"root": self._root, "type": self._type, "storage": storage_list}
+            key_list = []
+            storage_list = []
+            for key, node in self._storage.items():
+                key_list.append(key)
+                storage_list.append(_prepare_reference_for_encoding(node))
+            content = {
+                "root": self._root,
+                "type": self._type,
+                "storage": storage_list,
+                "keys": key_list,
+            }
         else:
             raise NotImplementedError(
                 "Saving a {} trie to json is not implemented".format(self.state)
@@ -44,16 +150,30 @@ class ModifiedMerklePatriciaTrie(MerklePatriciaTrie):
 
         return pickle.dumps(content)
 
+    @_exclusive
     @typechecked
-    def from_pickle(self, pickle_data: bytes) -> ...:
+    def from_pickle(self, pickle_data: bytes, verify_sample: float = 0.0) -> ...:
         """
         Initialize the trie from a pickle object.
 
+        Pickles with stored keys are bulk-inserted without hashing the nodes,
+        older pickles without keys are hashed node by node.
+
         Parameters
         ----------
         pickle_data : bytes
             The pickle object.
+        verify_sample : float
+            Fraction of the stored keys that is checked against the hash of
+            its node while loading (1.0 checks every node). Use `verify_storage`
+            to check the loaded trie later or in the background.
+
+        Raises
+        ------
+        InvalidNodeError
+            If a checked key doesn't match the hash of its node.
         """
+        self._check_writable()
         # Unpickle the object
         data = pickle.loads(pickle_data)
         storage_list = data["storage"]
@@ -61,15 +181,23 @@ class ModifiedMerklePatriciaTrie(MerklePatriciaTrie):
         # Load the storage
         if data["type"] == "FULL MMPT":
             storage = {}
-            for encoded_node in storage_list:
-                # Nodes are stored as the RPL encoded version of the full node
-                storage[keccak_hash(encoded_node)] = _prepare_reference_for_usage(
-                    encoded_node
-                )  # Decode the node from RLP
+            # Nodes are stored as the RPL encoded version of the full node
+            storage_list = map(_prepare_reference_for_usage, storage_list)
+            key_list = data.get("keys")
+            if key_list is None:
+                pairs = ((None, encoded_node) for encoded_node in storage_list)
+            else:
+                pairs = zip(key_list, storage_list)
+            storage.update(self._keyed_nodes(pairs, verify_sample))
 
             self._storage = storage
+            self._node_cache.clear()
             self._root = data["root"]
             self._type = data["type"]
+            # The nodes of the last snapshot are not in this storage.
+            self._journal = None
+            self._versions.clear()
+            self._record_version()
         else:
             raise NotImplementedError(
                 "Loading a {} trie from a json object is not implemented".format(
@@ -77,6 +205,154 @@ class ModifiedMerklePatriciaTrie(MerklePatriciaTrie):
                 )
             )
 
+    @_exclusive
+    def to_stream(self, fileobj, incremental: bool = False) -> int:
+        """
+        Write the trie to a binary file object as a stream of node records.
+
+        The snapshot starts with a header (type and root) followed by one
+        length-prefixed RLP record per node. Nodes are written one at a time
+        so saving does not build a copy of the storage in memory.
+        Snapshots can be appended to the same file object, `from_stream`
+        loads them in order.
+
+        Parameters
+        ----------
+        fileobj : file-like
+            Binary file object opened for writing.
+        incremental : bool
+            Only write the nodes added since the previous `to_stream` call
+            (or since the trie was loaded with `from_stream`).
+
+        Returns
+        -------
+        int
+            Number of written nodes.
+
+        Raises
+        ------
+        ValueError
+            If an incremental snapshot is requested without a previous snapshot.
+        """
+        self.commit()
+        if self._type != "FULL MMPT":
+            raise NotImplementedError(
+                "Saving a {} trie to a stream is not implemented".format(self._type)
+            )
+
+        if incremental:
+            if self._journal is None:
+                raise ValueError("An incremental snapshot needs a previous snapshot")
+            # Nodes pruned since the last snapshot are skipped.
+            nodes = (
+                (ref, self._storage[ref])
+                for ref in sorted(self._journal)
+                if ref in self._storage
+            )
+        else:
+            nodes = self._storage.items()
+
+        count = write_snapshot(fileobj, self._type, self._root, nodes, incremental)
+        self._journal = set()
+        return count
+
+    @_exclusive
+    def from_stream(
+        self,
+        fileobj,
+        storage: Optional[MutableMapping] = None,
+        verify_sample: float = 0.0,
+    ) -> ...:
+        """
+        Initialize the trie from a stream written by `to_stream`.
+
+        The snapshots are read lazily, one node record at a time. A full
+        snapshot followed by incremental snapshots is loaded in order and
+        the root of the last snapshot is used.
+
+        Parameters
+        ----------
+        fileobj : file-like
+            Binary file object opened for reading.
+        storage : dict-like
+            (Optional) Storage the nodes are loaded into, a new dict by default.
+        verify_sample : float
+            (Optional) Fraction of the stored keys that is checked against the
+            hash of its node (1.0 checks every node).
+
+        Raises
+        ------
+        ValueError
+            If the stream holds no snapshot, starts with an incremental
+            snapshot or is cut off.
+        InvalidNodeError
+            If a checked key doesn't match the hash of its node.
+        """
+        self._check_writable()
+        if storage is None:
+            storage = {}
+
+        loaded = False
+        root = None
+        for header, nodes in read_snapshots(fileobj):
+            if header["type"] != "FULL MMPT":
+                raise NotImplementedError(
+                    "Loading a {} trie from a stream is not implemented".format(
+                        header["type"]
+                    )
+                )
+            if header["incremental"] and not loaded:
+                raise ValueError("Incremental snapshot without a full snapshot")
+
+            storage.update(self._keyed_nodes(nodes, verify_sample))
+            root = header["root"]
+            loaded = True
+
+        if not loaded:
+            raise ValueError("The stream holds no snapshot")
+
+        self._storage = storage
+        self._node_cache.clear()
+        self._root = root
+        self._journal = set()
+        self._versions.clear()
+        self._record_version()
+
+    def _keyed_nodes(self, pairs, verify_sample):
+        """
+        Yield (key, node) pairs for loading, hashing only where it is needed.
+
+        Nodes without a stored key are hashed, stored keys are trusted except
+        for the sampled fraction that is checked against the node hash.
+
+        Parameters
+        ----------
+        pairs : iterable of (bytes or None, bytes)
+            Stored key (None if unknown) and encoded node.
+        verify_sample : float
+            Fraction of the stored keys that is checked.
+
+        Raises
+        ------
+        InvalidNodeError
+            If a checked key doesn't match the hash of its node.
+        """
+        if verify_sample <= 0:
+            for key, encoded_node in pairs:
+                yield (keccak_hash(encoded_node) if key is None else key), encoded_node
+            return
+
+        sampler = random.Random()
+        for key, encoded_node in pairs:
+            if key is None:
+                key = keccak_hash(encoded_node)
+            elif verify_sample >= 1 or sampler.random() < verify_sample:
+                if keccak_hash(encoded_node) != key:
+                    raise InvalidNodeError(
+                        "Stored key {} does not match the node hash".format(key.hex())
+                    )
+            yield key, encoded_node
+
     def create_skeleton(self) -> ...:
         """
         Create a skeleton of the trie.
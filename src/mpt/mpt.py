@@ -1,14 +1,26 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
 from enum import Enum
-from .hash import keccak_hash, keccak_hash_list
+from functools import wraps
+from itertools import islice
+from .builder import SortedTrieBuilder
+from .cache import LRUCache
+from .hash import keccak_hash, keccak_hash_many
 from .nibble_path import NibblePath
+from .serialization import write_mapped_snapshot
+from .stats import TrieStats
+from .storage import MappedStorage
 from .node import (
     Node,
     Leaf,
     Extension,
     Branch,
+    _is_empty_reference,
     _prepare_reference_for_encoding,
     _prepare_reference_for_usage,
 )
+from .verify import verify_inclusion, verify_exclusion, _INVALID_PROOF_ERRORS
 from .exceptions import (
     KeyNotFoundError,
     ExtensionPathError,
@@ -17,9 +29,129 @@ from .exceptions import (
     PoeError,
     PoiError,
     InvalidNodeError,
+    ReadOnlyError,
 )
-from typing import Dict, Tuple, List, Union, Optional
+from typing import Callable, Dict, Iterator, Tuple, List, Union, Optional
 from typeguard import typechecked
+import os
+import random
+import threading
+import time
+import weakref
+
+# Number of pairs written per storage batch when a trie is built from sorted pairs.
+_BUILD_BATCH_SIZE = 4096
+
+# Paths of the branch slots, used to extend a path while iterating.
+_SLOT_PATHS = [NibblePath._from_nibbles(bytes((idx,))) for idx in range(16)]
+
+
+def _same_reference(ref_a, ref_b) -> bool:
+    """Check if two references point to the same subtree without reading it."""
+    if _is_empty_reference(ref_a):
+        return _is_empty_reference(ref_b)
+    return ref_a is ref_b or (isinstance(ref_a, bytes) and ref_a == ref_b)
+
+
+def _compare_to_bound(path: NibblePath, bound: NibblePath) -> int:
+    """
+    Compare the keys below a path with a bound.
+
+    Parameters
+    ----------
+    path: NibblePath
+        Path to a subtree, every key of the subtree starts with it.
+    bound: NibblePath
+        Path of the bound.
+
+    Returns
+    -------
+    int
+        -1 if all keys are smaller than the bound, 1 if all keys are greater or
+        equal and 0 if the path is a prefix of the bound (keys on both sides).
+    """
+    length = path.common_prefix_length(bound)
+    if length == len(path):
+        return 0
+    if length == len(bound):
+        return 1
+    return -1 if path.at(length) < bound.at(length) else 1
+
+
+def _exclusive(method):
+    """Run a method that changes the trie while holding the write lock."""
+
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._write_lock:
+            return method(self, *args, **kwargs)
+
+    return locked
+
+
+def _traced(name: str, path_operation: bool = False):
+    """
+    Count the operation and report its duration to the span hook of the trie.
+
+    Parameters
+    ----------
+    name: str
+        Name of the operation passed to the span hook.
+    path_operation: bool
+        The operation follows the path of one key, its node visits are
+        counted as its traversal depth.
+    """
+
+    def decorate(method):
+        @wraps(method)
+        def traced(self, *args, **kwargs):
+            stats = self._stats
+            span_hook = self._span_hook
+            if stats is None and span_hook is None:
+                return method(self, *args, **kwargs)
+
+            if stats is not None:
+                stats.operations += 1
+                visits = stats.node_visits
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                if stats is not None and path_operation:
+                    stats.record_traversal(stats.node_visits - visits)
+                if span_hook is not None:
+                    span_hook(name, time.perf_counter() - start)
+
+        return traced
+
+    return decorate
+
+
+def _build_partition(pairs: List[Tuple[bytes, bytes]]) -> Tuple[bytes, dict]:
+    """
+    Build the subtree of one root branch slot, used by `parallel_build` workers.
+
+    All keys share their first nibble, which is skipped, so the returned
+    reference is the one stored in the root branch.
+
+    Parameters
+    ----------
+    pairs: list of (bytes, bytes)
+        Pairs of key (already hashed in secure mode) and value, in any order.
+
+    Returns
+    -------
+    tuple
+        Reference to the subtree and a dict with its nodes.
+    """
+    # The sort is stable so the last value for a duplicate key wins.
+    pairs.sort(key=lambda item: item[0])
+
+    trie = MerklePatriciaTrie({}, cache_size=0)
+    builder = SortedTrieBuilder(trie._write_node, offset=1)
+    for encoded_key, encoded_value in pairs:
+        builder.add(encoded_key, encoded_value)
+    return builder.finish(), trie._storage
 
 
 class MerklePatriciaTrie:
@@ -29,6 +161,7 @@ class MerklePatriciaTrie:
     MerklePatriciaTrie works like a wrapper over provided storage.
     Storage must implement dict-like interface. Any data structure
     that implements `__getitem__` and `__setitem__` should be OK.
+    For tries that don't fit in memory `SQLiteStorage` keeps the nodes on disk.
 
     IMPORTANT: MPT's use the terms path, node_ref, node value a lot
     and it can cause some confusion.
@@ -40,17 +173,87 @@ class MerklePatriciaTrie:
         an extension or a branch. How many values are stored in a node depends on
         the node type.
 
+    One writer and many reader threads can share a trie. Stored and in-memory
+    nodes are never changed, updates build new nodes (copy-on-write) and then
+    swap the root, which is atomic. Write methods hold a lock so writers run
+    one at a time. Readers that take a `snapshot` keep reading the same
+    version while the writer goes on, pruning included.
+
     Methods
     -------
+    from_sorted_items(items, storage, secure)
+        This class method builds a trie from key-value pairs ordered by key.
+    parallel_build(items, storage, secure, workers)
+        This class method builds a trie from unsorted pairs in several processes.
     get(encoded_key)
         This method gets a value associtated with provided key.
+    items()
+        This method iterates over the key-value pairs in key order.
+    keys()
+        This method iterates over the keys in key order.
+    values()
+        This method iterates over the values in key order.
+    iter_prefix(prefix)
+        This method iterates over the pairs whose key starts with the prefix.
+    iter_range(start, end)
+        This method iterates over the pairs with start <= key < end.
+    diff(root_a, root_b)
+        This method iterates over the changes between two roots.
     update(encoded_key, encoded_value)
         This method updates a provided key-value pair into the trie.
+    update_batch(items)
+        This method updates many key-value pairs with one root recomputation.
     delete(encoded_key)
         This method removes a value associtated with provided key.
+    delete_batch(encoded_keys)
+        This method removes many keys with one root recomputation.
+    get_multiproof(encoded_keys)
+        This method returns one proof of inclusion for many keys.
+    verify_multiproof(encoded_keys, proof, root_hash)
+        This method verifies a proof of inclusion for many keys.
+    get_range_proof(start_key, end_key)
+        This method returns the pairs in a key range and a proof that they are complete.
+    verify_range_proof(start_key, end_key, pairs, proof, root_hash)
+        This method verifies a range proof.
+    commit()
+        This method stores the nodes that are kept in memory in deferred mode.
+    prune(keep_roots)
+        This method removes the nodes that are not reachable from the kept roots.
+    verify_storage(sample, background)
+        This method checks that the stored nodes are stored under their hash.
+    cache_info()
+        This method returns the counters of the decoded node cache.
+    clear_cache()
+        This method removes all nodes from the decoded node cache.
+    snapshot()
+        This method returns a read-only view of the current version.
+    at(root)
+        This method returns a read-only view of the version with the given root.
+    versions()
+        This method returns the roots of the retained versions.
+    stats()
+        This method returns the counters of the work done by the trie.
+    reset_stats()
+        This method sets the counters of the work done by the trie to zero.
+    set_span_hook(span_hook)
+        This method sets a function that gets the duration of every operation.
+    to_mapped(path)
+        This method writes the trie to a snapshot file that can be memory-mapped.
+    from_mapped(path)
+        This method opens a memory-mapped snapshot file as the storage of the trie.
     """
 
-    def __init__(self, storage: dict, root: bytes = ..., secure: bool = False) -> ...:
+    def __init__(
+        self,
+        storage: dict,
+        root: bytes = ...,
+        secure: bool = False,
+        deferred: bool = False,
+        cache_size: int = 1024,
+        auto_prune: int = 0,
+        keep_versions: int = 0,
+        collect_stats: bool = False,
+    ) -> ...:
         """
         Create a new instance of MPT.
 
@@ -63,6 +266,19 @@ class MerklePatriciaTrie:
             If not provided, tree will be considered empty.
         secure: bool
             (Optional) In secure mode all the keys are hashed using keccak256 internally.
+        deferred: bool
+            (Optional) In deferred mode modified nodes are kept in memory and are
+            only encoded, hashed and stored when `commit` (or `root_hash`) is called.
+        cache_size: int
+            (Optional) Maximum number of decoded nodes that are cached, 0 disables the cache.
+        auto_prune: int
+            (Optional) Number of write operations after which `prune` is called
+            automatically, 0 disables automatic pruning.
+        keep_versions: int
+            (Optional) Number of most recent versions (roots) that `prune` keeps
+            readable, 0 only keeps the current version.
+        collect_stats: bool
+            (Optional) Count the work done by the trie, see `stats`.
         """
         self._storage = storage
         if root == ...:
@@ -70,22 +286,124 @@ class MerklePatriciaTrie:
         else:
             self._root = root
         self._secure = secure
+        # When set, modified nodes are kept in memory instead of being stored.
+        self._deferred = deferred
+        # Decoded nodes by reference. Nodes are content addressed so an entry
+        # only becomes invalid when the node is removed from the storage.
+        self._node_cache = LRUCache(cache_size)
+        self._auto_prune = auto_prune
+        self._writes_since_prune = 0
+        # References written since the last snapshot, None until the first snapshot.
+        self._journal = None
+        # Roots of the most recent versions, the current root is the last one.
+        self._versions = deque(maxlen=keep_versions)
+        # Read-only views handed out by `snapshot` and `at`, their roots survive pruning.
+        self._views = weakref.WeakSet()
+        self._views_lock = threading.Lock()
+        # Held by the write methods, reentrant because writes commit and prune.
+        self._write_lock = threading.RLock()
+        self._read_only = False
+        self._stats = TrieStats() if collect_stats else None
+        self._span_hook = None
 
     # SPECIAL METHODS
     def __len__(self) -> int:
         """Return the number of nodes in the trie."""
-        return len(self._storage.keys())
+        return len(self._storage)
+
+    @classmethod
+    def from_sorted_items(
+        cls, items, storage: Optional[dict] = None, secure: bool = False
+    ) -> "MerklePatriciaTrie":
+        """
+        This class method builds a trie from key-value pairs ordered by key.
+
+        The pairs are consumed one by one and every node is written once, when
+        the following keys can't change it anymore. Memory use is bounded by the
+        key length, not by the number of pairs, so `items` can be a generator.
+        The resulting root is identical to calling `update` for every pair.
+
+        This method does not RLP-encode the keys and values.
+        If you use encoded keys and values, you should encode them yourself.
+
+        Parameters
+        ----------
+        items: iterable of (bytes, bytes)
+            Pairs of key and value. Keys must not decrease, for equal keys the
+            last value wins. In secure mode the keys are hashed by the builder and
+            the pairs must be ordered by the hashed key.
+        storage: dict-like
+            (Optional) Storage for the nodes, a new dict if not provided.
+        secure: bool
+            (Optional) In secure mode all the keys are hashed using keccak256 internally.
+
+        Returns
+        -------
+        MerklePatriciaTrie
+            Trie with all the pairs.
+
+        Raises
+        ------
+        ValueError
+            If the keys are not sorted.
+        """
+        trie = cls({} if storage is None else storage, secure=secure)
+        trie._root = trie._build_sorted(items)
+        return trie
+
+    @classmethod
+    def parallel_build(
+        cls,
+        items,
+        storage: Optional[dict] = None,
+        secure: bool = False,
+        workers: Optional[int] = None,
+    ) -> "MerklePatriciaTrie":
+        """
+        This class method builds a trie from unsorted pairs in several processes.
+
+        The pairs are split by the first nibble of the (hashed) key, every part
+        is built like in `from_sorted_items` in a worker process and the parts are
+        joined under one root branch. The resulting root is identical to calling
+        `update` for every pair in the given order (the last value for a key wins).
+        Unlike `from_sorted_items` all the pairs are kept in memory.
+
+        This method does not RLP-encode the keys and values.
+        If you use encoded keys and values, you should encode them yourself.
+
+        Parameters
+        ----------
+        items: iterable of (bytes, bytes)
+            Pairs of key and value in any order.
+        storage: dict-like
+            (Optional) Storage for the nodes, a new dict if not provided.
+        secure: bool
+            (Optional) In secure mode all the keys are hashed using keccak256 internally.
+        workers: int
+            (Optional) Number of worker processes, the number of CPUs if not provided.
+
+        Returns
+        -------
+        MerklePatriciaTrie
+            Trie with all the pairs.
+        """
+        trie = cls({} if storage is None else storage, secure=secure)
+        trie._root = trie._build_parallel(items, workers)
+        return trie
 
     # TREE FUNCTIONS
     def root(self) -> Union[bytes, None]:
         """
         Return a root node of the trie.
 
+        In deferred mode the pending nodes are committed first.
+
         Returns
         -------
         Node
             Root node of the trie. Type is `bytes` if trie isn't empty and `None` otherwise.
         """
+        self.commit()
         return self._root
 
     def root_hash(self) -> bytes:
@@ -93,12 +411,14 @@ class MerklePatriciaTrie:
         Returns a hash of the trie's root node.
 
         For empty trie it's the hash of the RLP-encoded empty string.
+        In deferred mode the pending nodes are committed first.
 
         Returns
         -------
         bytes
             Hash of the trie's root node.
         """
+        self.commit()
         if not self._root:
             return Node.EMPTY_HASH
         elif len(self._root) == 32:  # Root is already a hash
@@ -106,7 +426,286 @@ class MerklePatriciaTrie:
         else:
             return keccak_hash(self._root)
 
-    def get(self, encoded_key: bytes) -> bytes:
+    def commit(self) -> ...:
+        """
+        This method stores the nodes that are kept in memory in deferred mode.
+
+        Every modified node is encoded, hashed and written to the storage once,
+        no matter how many updates touched it since the last commit.
+        Outside deferred mode there is nothing to commit and this is a no-op.
+        """
+        # Checked before locking so readers don't wait for the writer.
+        if not isinstance(self._root, Node):
+            return
+
+        with self._write_lock:
+            if isinstance(self._root, Node):
+                with self._storage_batch():
+                    self._root = self._commit_node(self._root)
+                self._record_version()
+
+    @_exclusive
+    def prune(self, keep_roots: Optional[List[bytes]] = None) -> int:
+        """
+        This method removes the nodes that are not reachable from the kept roots.
+
+        Nodes replaced by `update` and `delete` are never removed from the storage,
+        pruning does a mark-and-sweep from the current root (and the given roots)
+        and deletes every other entry. The retained versions (see `keep_versions`)
+        and the roots of live snapshots are kept as well. Don't share the storage
+        with data that should survive unless its roots are passed in `keep_roots`.
+        In deferred mode the pending nodes are committed first.
+
+        Parameters
+        ----------
+        keep_roots: list of bytes
+            (Optional) Roots (as returned by `root`) of older versions that
+            should stay readable.
+
+        Returns
+        -------
+        int
+            Number of removed nodes.
+        """
+        self._check_writable()
+        self.commit()
+        self._writes_since_prune = 0
+
+        # Views register under the same lock, a snapshot taken now is either
+        # in the views or pinned to the current root.
+        with self._views_lock:
+            roots = [self._root]
+            roots.extend(view._root for view in self._views)
+        if keep_roots is not None:
+            roots.extend(keep_roots)
+        roots.extend(self._versions)
+        reachable = self._reachable_references(roots)
+
+        stale = [ref for ref in self._storage.keys() if ref not in reachable]
+        with self._storage_batch():
+            for ref in stale:
+                del self._storage[ref]
+                self._node_cache.invalidate(ref)
+
+        return len(stale)
+
+    def snapshot(self) -> "MerklePatriciaTrie":
+        """
+        This method returns a read-only view of the current version.
+
+        See `at`, in deferred mode the pending nodes are committed first.
+
+        Returns
+        -------
+        MerklePatriciaTrie
+            Read-only trie pinned to the current root.
+        """
+        while True:
+            self.commit()
+            # The root is read and the view registered without a `prune` in between.
+            with self._views_lock:
+                if not isinstance(self._root, Node):
+                    return self._add_view(self._root)
+
+    def at(self, root: Optional[bytes]) -> "MerklePatriciaTrie":
+        """
+        This method returns a read-only view of the version with the given root.
+
+        Nothing is copied, the view shares the storage and the node cache
+        with this trie. Stored nodes are never changed, so the view keeps
+        returning the data of its version while this trie is updated, and
+        `prune` keeps the nodes of the view as long as the view is alive.
+
+        Parameters
+        ----------
+        root: bytes or None
+            Root (as returned by `root`) of the version, None for an empty trie.
+
+        Returns
+        -------
+        MerklePatriciaTrie
+            Read-only trie pinned to the root.
+        """
+        with self._views_lock:
+            return self._add_view(root)
+
+    def versions(self) -> List[Optional[bytes]]:
+        """
+        This method returns the roots of the retained versions.
+
+        Returns
+        -------
+        list of bytes
+            Roots of the last `keep_versions` versions, oldest first. The last
+            one is the current root.
+        """
+        return list(self._versions)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """
+        This method returns the counters of the work done by the trie.
+
+        The counters break down the cost of the operations: storage reads and
+        writes, decoded and encoded nodes, keccak256 hashes and hashed bytes,
+        node visits and decoded node cache hits, and the traversal depth of
+        operations that follow the path of one key. See `TrieStats`.
+
+        Returns
+        -------
+        dict
+            The counters by name.
+
+        Raises
+        ------
+        ValueError
+            If the trie was created without `collect_stats`.
+        """
+        if self._stats is None:
+            raise ValueError("Statistics are only collected with collect_stats=True")
+        return self._stats.as_dict()
+
+    def reset_stats(self) -> ...:
+        """
+        This method sets the counters of the work done by the trie to zero.
+
+        Raises
+        ------
+        ValueError
+            If the trie was created without `collect_stats`.
+        """
+        if self._stats is None:
+            raise ValueError("Statistics are only collected with collect_stats=True")
+        self._stats.reset()
+
+    def set_span_hook(self, span_hook: Optional[Callable[[str, float], None]]) -> ...:
+        """
+        This method sets a function that gets the duration of every operation.
+
+        The function is called after `get`, `update`, `delete`, their batch
+        versions and the proof methods with the name of the operation and its
+        duration in seconds, also if the operation raised an error.
+
+        Parameters
+        ----------
+        span_hook: callable or None
+            Function called as `span_hook(name, seconds)`, None removes the hook.
+        """
+        self._span_hook = span_hook
+
+    def to_mapped(self, path: str) -> int:
+        """
+        This method writes the trie to a snapshot file that can be memory-mapped.
+
+        See `write_mapped_snapshot` for the format, `from_mapped` opens the file.
+        In deferred mode the pending nodes are committed first.
+
+        Parameters
+        ----------
+        path: str
+            Path of the file, an existing file is replaced.
+
+        Returns
+        -------
+        int
+            Number of written nodes.
+        """
+        self.commit()
+        return write_mapped_snapshot(path, self._root, self._storage.items())
+
+    @_exclusive
+    def from_mapped(self, path: str) -> ...:
+        """
+        This method opens a memory-mapped snapshot file as the storage of the trie.
+
+        Nothing is loaded, nodes are looked up in the mapped file when they
+        are visited, so opening takes the same time for any size. The storage
+        is read-only (see `MappedStorage`), updates raise a TypeError.
+
+        Parameters
+        ----------
+        path: str
+            Path of a file written by `to_mapped`.
+
+        Raises
+        ------
+        ValueError
+            If the file is not a snapshot file or is cut off.
+        """
+        self._check_writable()
+        storage = MappedStorage(path)
+        self._storage = storage
+        self._node_cache.clear()
+        self._root = storage.root
+        # The next stream snapshot has to be a full one.
+        self._journal = None
+        self._versions.clear()
+        self._record_version()
+
+    def verify_storage(self, sample: float = 1.0, background: bool = False):
+        """
+        This method checks that the stored nodes are stored under their hash.
+
+        Loading a trie with stored keys skips hashing the nodes, this method
+        does the integrity check afterwards, for all nodes or a random sample.
+
+        Parameters
+        ----------
+        sample: float
+            (Optional) Fraction of the nodes that is checked, 1.0 checks every node.
+        background: bool
+            (Optional) Run the check in a background thread. The storage must
+            be usable from another thread, a dict and `SQLiteStorage` are.
+
+        Returns
+        -------
+        list of bytes or Future
+            Keys whose node doesn't match, or a `concurrent.futures.Future`
+            resolving to that list when running in the background.
+        """
+        if background:
+            executor = ThreadPoolExecutor(max_workers=1)
+            future = executor.submit(self.verify_storage, sample)
+            executor.shutdown(wait=False)
+            return future
+
+        sampler = random.Random()
+        corrupted = []
+        # Copy the keys so writes during a background check don't break the loop.
+        for key in list(self._storage.keys()):
+            if sample < 1 and sampler.random() >= sample:
+                continue
+            try:
+                encoded_node = self._storage[key]
+            except KeyError:
+                # Pruned while checking.
+                continue
+            if keccak_hash(encoded_node) != key:
+                corrupted.append(key)
+
+        return corrupted
+
+    def cache_info(self) -> Dict[str, int]:
+        """
+        This method returns the counters of the decoded node cache.
+
+        Returns
+        -------
+        dict
+            Dictionary with the hits, misses, size and max_size of the cache.
+        """
+        return self._node_cache.info()
+
+    def clear_cache(self) -> ...:
+        """
+        This method removes all nodes from the decoded node cache.
+
+        Call this when nodes are removed from or replaced in the storage
+        outside of the trie.
+        """
+        self._node_cache.clear()
+
+    @_traced("get", path_operation=True)
+    def get(self, encoded_key: bytes, root: Optional[bytes] = ...) -> bytes:
         """
         This method gets a value associtated with provided key.
 
@@ -117,6 +716,9 @@ class MerklePatriciaTrie:
         ----------
         encoded_key: bytes
             Key or RLP-encoded key.
+        root: bytes or None
+            (Optional) Root of an older version to read from (as returned by
+            `root`), the current root if not provided. See `at`.
 
         Returns
         -------
@@ -128,16 +730,164 @@ class MerklePatriciaTrie:
         KeyError
             KeyError is raised if there is no value assotiated with provided key.
         """
-        if not self._root:
+        if root is ...:
+            root = self._root
+        if not root:
             raise ValueError("Trie is empty")
 
         if self._secure:
-            encoded_key = keccak_hash(encoded_key)
+            encoded_key = self._hash_key(encoded_key)
 
         path = NibblePath(encoded_key)
-        result_node = self._get(self._root, path)
+        result_node = self._get(root, path)
         return result_node.data
 
+    def items(self) -> Iterator[Tuple[bytes, bytes]]:
+        """
+        This method iterates over the key-value pairs in key order.
+
+        The trie is walked depth-first and nodes are read when the walk reaches
+        them, so memory use depends on the depth of the trie, not its size.
+        The walk starts at the root the trie has when the iteration starts.
+        Updates never change nodes in place (copy-on-write), so the iteration
+        returns the pairs of that version even if the trie is updated in the
+        meantime, in deferred mode too. Only `prune` removes nodes, iterate
+        over a `snapshot` to keep the nodes while the trie may be pruned.
+
+        In secure mode the keys are the keccak256 hashes of the original keys
+        and the pairs are ordered by these hashes.
+
+        Yields
+        ------
+        tuple of (bytes, bytes)
+            Key (or hashed key in secure mode) and value.
+        """
+        if not self._root:
+            return
+
+        for path, value in self._iterate(self._root, NibblePath([])):
+            yield path.to_bytes(), value
+
+    def keys(self) -> Iterator[bytes]:
+        """
+        This method iterates over the keys in key order.
+
+        See `items`, in secure mode the keys are the hashed keys.
+
+        Yields
+        ------
+        bytes
+            Key (or hashed key in secure mode).
+        """
+        for key, _ in self.items():
+            yield key
+
+    def values(self) -> Iterator[bytes]:
+        """
+        This method iterates over the values in key order.
+
+        See `items`.
+
+        Yields
+        ------
+        bytes
+            Value.
+        """
+        if not self._root:
+            return
+
+        for _, value in self._iterate(self._root, NibblePath([])):
+            yield value
+
+    def iter_prefix(self, prefix: bytes) -> Iterator[Tuple[bytes, bytes]]:
+        """
+        This method iterates over the pairs whose key starts with the prefix.
+
+        The walk goes straight down to the subtree of the prefix and only reads
+        that subtree, so the cost depends on the number of matching pairs.
+        In secure mode the prefix is matched against the hashed keys.
+
+        Parameters
+        ----------
+        prefix: bytes
+            Prefix of the keys.
+
+        Yields
+        ------
+        tuple of (bytes, bytes)
+            Key (or hashed key in secure mode) and value, ordered by key.
+        """
+        if not self._root:
+            return
+
+        subtree = self._seek(self._root, NibblePath(prefix))
+        if subtree is None:
+            return
+
+        for path, value in self._iterate(*subtree):
+            yield path.to_bytes(), value
+
+    def iter_range(
+        self, start: Optional[bytes] = None, end: Optional[bytes] = None
+    ) -> Iterator[Tuple[bytes, bytes]]:
+        """
+        This method iterates over the pairs with start <= key < end.
+
+        Subtrees outside the range are skipped without being read, so the cost
+        depends on the number of pairs in the range and the depth of the trie.
+        In secure mode the bounds are compared with the hashed keys.
+
+        Parameters
+        ----------
+        start: bytes
+            (Optional) Smallest key to return, no lower bound if not provided.
+        end: bytes
+            (Optional) Key after the last key to return, no upper bound if not provided.
+
+        Yields
+        ------
+        tuple of (bytes, bytes)
+            Key (or hashed key in secure mode) and value, ordered by key.
+        """
+        if not self._root:
+            return
+
+        start_path = None if start is None else NibblePath(start)
+        end_path = None if end is None else NibblePath(end)
+        for path, value in self._iterate(self._root, NibblePath([]), start_path, end_path):
+            yield path.to_bytes(), value
+
+    def diff(
+        self, root_a: Optional[bytes], root_b: Optional[bytes]
+    ) -> Iterator[Tuple[bytes, Optional[bytes], Optional[bytes]]]:
+        """
+        This method iterates over the changes between two roots.
+
+        Both tries are walked together and subtrees that have the same
+        reference in both tries are skipped without being read, so the cost
+        depends on the size of the change, not on the size of the tries. Both
+        roots must be stored in the storage of this trie.
+
+        In secure mode the keys are the hashed keys.
+
+        Parameters
+        ----------
+        root_a: bytes or None
+            Old root (as returned by `root`), None for an empty trie.
+        root_b: bytes or None
+            New root (as returned by `root`), None for an empty trie.
+
+        Yields
+        ------
+        tuple of (bytes, bytes or None, bytes or None)
+            Key, old value and new value, ordered by key. The old value is None
+            for added keys and the new value is None for removed keys.
+        """
+        for path, old_value, new_value in self._diff(root_a, root_b):
+            yield path.to_bytes(), old_value, new_value
+
+    @_traced("update", path_operation=True)
+    @_exclusive
     def update(self, encoded_key: bytes, encoded_value: bytes) -> ...:
         """
         This method updates a provided key-value pair into the trie.
@@ -155,12 +905,61 @@ class MerklePatriciaTrie:
         encoded_value: bytes
             Value or RLP-encoded value.
         """
+        self._check_writable()
         if self._secure:
-            encoded_key = keccak_hash(encoded_key)
+            encoded_key = self._hash_key(encoded_key)
 
         path = NibblePath(encoded_key)
-        result = self._update(self._root, path, encoded_value)
+        with self._storage_batch():
+            result = self._update(self._root, path, encoded_value)
         self._root = result
+        self._after_write()
+
+    @_traced("update_batch")
+    @_exclusive
+    def update_batch(self, items: List[Tuple[bytes, bytes]]) -> ...:
+        """
+        This method updates many key-value pairs with one root recomputation.
+
+        The pairs are grouped by nibble at every node on their paths, so each
+        subtree is visited and rebuilt once for all the pairs below it instead of
+        once per pair. Every modified node is encoded, hashed and stored only
+        once, after all pairs are applied (in deferred mode on the next `commit`).
+        The resulting root is identical to calling `update` for every pair in the
+        given order (the last value for a key wins).
+
+        This method does not RLP-encode the keys and values.
+        If you use encoded keys and values, you should encode them yourself.
+
+        Parameters
+        ----------
+        items: iterable of (bytes, bytes)
+            Pairs of key (or RLP-encoded key) and value (or RLP-encoded value).
+        """
+        self._check_writable()
+        items = list(items)
+        if self._secure:
+            keys = self._hash_keys([key for key, _ in items])
+            items = [(key, value) for key, (_, value) in zip(keys, items)]
+
+        # The last value for a key wins.
+        pairs = [(NibblePath(key), value) for key, value in dict(items).items()]
+
+        deferred = self._deferred
+        self._deferred = True
+        try:
+            root = self._root
+            if pairs:
+                root = self._update_many(root, pairs)
+        finally:
+            self._deferred = deferred
+
+        if not self._deferred:
+            # Commit before publishing, readers never see in-memory nodes.
+            with self._storage_batch():
+                root = self._commit_node(root)
+        self._root = root
+        self._after_write()
 
     # Find out if the key is in the trie
     def contains(self, key: bytes, hash_key: bool = True) -> bool:
@@ -174,10 +973,10 @@ class MerklePatriciaTrie:
             return False
 
         if self._secure and hash_key:
-            key = keccak_hash(key)
+            key = self._hash_key(key)
 
         path = NibblePath(key)
-        node = self._contains(self._root, path)
+        node, path = self._contains(self._root, path)
 
         # If the node is a branch check if it has a value
         if isinstance(node, Branch):
@@ -203,6 +1002,8 @@ class MerklePatriciaTrie:
 
         raise Exception("This should never happen")
 
+    @_traced("delete", path_operation=True)
+    @_exclusive
     def delete(self, encoded_key: bytes) -> ...:
         """
         This method removes a value associtated with provided key.
@@ -220,40 +1021,84 @@ class MerklePatriciaTrie:
         KeyError
             KeyError is raised if there is no value assotiated with provided key.
         """
-
+        self._check_writable()
         if self._root is None:
             raise ValueError("Trie is empty")
 
         if self._secure:
-            encoded_key = keccak_hash(encoded_key)
+            encoded_key = self._hash_key(encoded_key)
 
         path = NibblePath(encoded_key)
-        action, info = self._delete(self._root, path)
+        with self._storage_batch():
+            self._root = self._delete_from_root(self._root, path)
+        self._after_write()
 
-        if action == MerklePatriciaTrie._DeleteAction.DELETED:
-            # Trie is empty
-            self._root = None
-        elif action == MerklePatriciaTrie._DeleteAction.UPDATED:
-            new_root = info
-            self._root = new_root
-        elif action == MerklePatriciaTrie._DeleteAction.USELESS_BRANCH:
-            _, new_root = info
-            self._root = new_root
-
-    def get_proof_of_inclusion(self, encoded_key: bytes) -> bytes:
+    @_traced("delete_batch")
+    @_exclusive
+    def delete_batch(self, encoded_keys: List[bytes]) -> ...:
         """
-        This method returns a proof of inclusion for a key.
+        This method removes many keys with one root recomputation.
 
-        Proof is a list of nodes that are necessary to reconstruct the trie.
+        The keys are removed one by one from in-memory nodes, the gain over
+        `delete` comes only from encoding, hashing and storing every modified
+        node once, after all keys are removed (in deferred mode on the next
+        `commit`). If one of the keys is not in the trie an error is raised and
+        the trie is left unchanged.
 
-        .. attention::
-            This method does not RLP-encode the key.
-            If you use encoded keys, you should encode it yourself.
+        This method does not RLP-encode the keys.
+        If you use encoded keys, you should encode them yourself.
 
         Parameters
         ----------
-        encoded_key: bytes
-            Key or RLP-encoded key.
+        encoded_keys: iterable of bytes
+            Keys or RLP-encoded keys.
+
+        Raises
+        ------
+        ValueError
+            ValueError is raised if the trie is (or becomes) empty while
+            there are still keys left to remove.
+        KeyNotFoundError, LeafPathError, ExtensionPathError, BranchPathError
+            Raised if one of the keys is not in the trie.
+        """
+        self._check_writable()
+        encoded_keys = list(encoded_keys)
+        if self._secure:
+            encoded_keys = self._hash_keys(encoded_keys)
+
+        deferred = self._deferred
+        self._deferred = True
+        try:
+            root = self._root
+            for encoded_key in encoded_keys:
+                if root is None:
+                    raise ValueError("Trie is empty")
+                root = self._delete_from_root(root, NibblePath(encoded_key))
+        finally:
+            self._deferred = deferred
+
+        if not self._deferred:
+            # Commit before publishing, readers never see in-memory nodes.
+            with self._storage_batch():
+                root = self._commit_node(root)
+        self._root = root
+        self._after_write()
+
+    @_traced("get_proof_of_inclusion", path_operation=True)
+    def get_proof_of_inclusion(self, encoded_key: bytes) -> bytes:
+        """
+        This method returns a proof of inclusion for a key.
+
+        Proof is a list of nodes that are necessary to reconstruct the trie.
+
+        .. attention::
+            This method does not RLP-encode the key.
+            If you use encoded keys, you should encode it yourself.
+
+        Parameters
+        ----------
+        encoded_key: bytes
+            Key or RLP-encoded key.
 
         Returns
         -------
@@ -268,11 +1113,15 @@ class MerklePatriciaTrie:
         if self._root is None:
             raise ValueError("Cannot generate a proof for empty trie")
 
+        # Proofs consist of encoded nodes, so pending nodes need their hashes.
+        self.commit()
+
         if self._secure:
-            encoded_key = keccak_hash(encoded_key)
+            encoded_key = self._hash_key(encoded_key)
 
         return self._get_proof_of_inclusion(self._root, NibblePath(encoded_key), [])
 
+    @_traced("verify_proof_of_inclusion")
     def verify_proof_of_inclusion(self, encoded_key: bytes, proof: List[bytes]) -> bool:
         """
         This method verifies a proof of inclusion for a key.
@@ -301,23 +1150,9 @@ class MerklePatriciaTrie:
         if self._root is None:
             raise ValueError("Cannot verify a proof for empty trie")
 
-        # Compare the root hashes
-        if self.root_hash() != keccak_hash(proof[0]):
-            return False
-
-        if self._secure:
-            encoded_key = keccak_hash(encoded_key)
-
-        # Recreate a partial trie from the proof and walk down from root to taget
-        # node.
-        proof_storage = {}
-        for encoded_node in proof:
-            proof_storage[Node.into_reference(Node.decode(encoded_node))] = encoded_node
-
-        return self._verify_proof_of_inclusion(
-            self._root, NibblePath(encoded_key), proof_storage
-        )
+        return verify_inclusion(self.root_hash(), encoded_key, proof, secure=self._secure)
 
+    @_traced("get_proof_of_exclusion")
     def get_proof_of_exclusion(self, encoded_key: bytes) -> List[bytes]:
         """
         This method returns a proof of exclusion for a key.
@@ -349,15 +1184,18 @@ class MerklePatriciaTrie:
         if self._root is None:
             raise ValueError("Cannot generate a proof for empty trie")
 
+        # Proofs consist of encoded nodes, so pending nodes need their hashes.
+        self.commit()
+
         # Check if the key is in the trie
         if self.contains(encoded_key):
             raise PoeError("Cannot generate a proof for a key that is in the trie")
 
         if self._secure:
-            encoded_key = keccak_hash(encoded_key)
+            encoded_key = self._hash_key(encoded_key)
 
         path = NibblePath(encoded_key)
-        node, proof = self._get_proof_of_exclusion(self._root, path, [])
+        node, path, proof = self._get_proof_of_exclusion(self._root, path, [])
 
         # Add a leaf node with the key to the proof
         proof.append(Leaf(path, "null").encode())
@@ -387,6 +1225,7 @@ class MerklePatriciaTrie:
 
         raise Exception("This should never happen")
 
+    @_traced("verify_proof_of_exclusion")
     def verify_proof_of_exclusion(self, encoded_key: bytes, proof: List[bytes]) -> bool:
         """
         This method verifies a proof of exclusion for a key.
@@ -415,49 +1254,243 @@ class MerklePatriciaTrie:
         if self._root is None:
             raise ValueError("Cannot verify a proof for empty trie")
 
-        # Compare the root hashes
-        if self.root_hash() != keccak_hash(proof[0]):
+        return verify_exclusion(self.root_hash(), encoded_key, proof, secure=self._secure)
+
+    @_traced("get_multiproof")
+    def get_multiproof(self, encoded_keys: List[bytes]) -> List[bytes]:
+        """
+        This method returns one proof of inclusion for many keys.
+
+        The proof holds every node on the paths to the keys exactly once, the
+        root node first. Nodes that are referenced in place (shorter than 32
+        bytes) are part of their parent and are not repeated, so the size of
+        the proof grows with the number of distinct nodes, not with the number
+        of keys times the depth.
+
+        .. attention::
+            This method does not RLP-encode the keys.
+            If you use encoded keys, you should encode them yourself.
+
+        Parameters
+        ----------
+        encoded_keys: list of bytes
+            Keys or RLP-encoded keys.
+
+        Returns
+        -------
+        list of bytes
+            Encoded nodes of the proof.
+
+        Raises
+        ------
+        ValueError
+            ValueError is raised if the trie is empty.
+        LeafPathError, ExtensionPathError, BranchPathError
+            Raised if one of the keys is not in the trie.
+        """
+        if self._root is None:
+            raise ValueError("Cannot generate a proof for empty trie")
+
+        # Proofs consist of encoded nodes, so pending nodes need their hashes.
+        self.commit()
+
+        proof = []
+        if len(self._root) != 32:
+            # The root is always part of the proof, even if it is small.
+            proof.append(self._root)
+        self._get_multiproof(self._root, self._multiproof_paths(encoded_keys), proof, set())
+        return proof
+
+    @_traced("verify_multiproof")
+    def verify_multiproof(
+        self, encoded_keys: List[bytes], proof: List[bytes], root_hash: Optional[bytes] = None
+    ) -> bool:
+        """
+        This method verifies a proof of inclusion for many keys.
+
+        Every node of the proof is hashed and decoded at most once, the paths
+        to all keys are walked together over these nodes.
+
+        .. attention::
+            This method does not RLP-encode the keys.
+            If you use encoded keys, you should encode them yourself.
+
+        Parameters
+        ----------
+        encoded_keys: list of bytes
+            Keys or RLP-encoded keys.
+        proof: list of bytes
+            Encoded nodes as returned by `get_multiproof`.
+        root_hash: bytes
+            (Optional) Root hash the proof is checked against, the root hash
+            of this trie if not provided.
+
+        Returns
+        -------
+        bool
+            True if all keys are in the trie with the given root hash, False otherwise.
+        """
+        if root_hash is None:
+            root_hash = self.root_hash()
+
+        proof_storage = {keccak_hash(encoded_node): encoded_node for encoded_node in proof}
+        if root_hash not in proof_storage:
             return False
 
-        if Node.decode(proof[-1]).data != b"null":
+        paths = self._multiproof_paths(encoded_keys)
+        try:
+            return self._verify_multiproof(root_hash, paths, proof_storage)
+        except _INVALID_PROOF_ERRORS + (KeyError, ValueError):
+            # A node of the proof is malformed.
             return False
 
-        if self._secure:
-            encoded_key = keccak_hash(encoded_key)
+    @_traced("get_range_proof")
+    def get_range_proof(
+        self, start_key: Optional[bytes] = None, end_key: Optional[bytes] = None
+    ) -> Tuple[List[Tuple[bytes, bytes]], List[bytes]]:
+        """
+        This method returns the pairs in a key range and a proof that they are complete.
 
-        # Recreate a partial trie from the proof and walk down from root to taget
-        # node.
-        proof_storage = {}
-        for encoded_node in proof[:-1]:  # Remove the null leaf.
-            # print(type(encoded_node))
-            proof_storage[Node.into_reference(Node.decode(encoded_node))] = encoded_node
+        The proof holds every node the range walk of `iter_range` reads, the root
+        node first: the nodes on the paths to both bounds and the subtrees in
+        between. Subtrees outside the range are only present as references in
+        their parents, which is enough to show that they hold no key of the range.
 
-        path = NibblePath(encoded_key)
-        node, keys_left = self._verify_proof_of_exclusion(
-            self.root(), NibblePath(encoded_key), proof_storage
-        )
+        In secure mode the bounds are compared with the hashed keys.
 
-        # Check if the result node is valid
-        # If the node is a branch check if it has a value
-        if isinstance(node, Branch):
-            if node.data == None:
-                return False
+        Parameters
+        ----------
+        start_key: bytes
+            (Optional) Smallest key of the range, no lower bound if not provided.
+        end_key: bytes
+            (Optional) Key after the last key of the range, no upper bound if not provided.
 
-        # If the node is a leaf the key is in the trie
-        if isinstance(node, Leaf):
-            if node.path == path:
-                return False
+        Returns
+        -------
+        tuple
+            List of (key, value) pairs with start_key <= key < end_key, ordered by key,
+            and the list of encoded nodes of the proof.
 
-        # There should be no keys left in the proof
-        if len(keys_left.keys()) != 0:
+        Raises
+        ------
+        ValueError
+            ValueError is raised if the trie is empty.
+        """
+        if self._root is None:
+            raise ValueError("Cannot generate a proof for empty trie")
+
+        # Proofs consist of encoded nodes, so pending nodes need their hashes.
+        self.commit()
+
+        visited = []
+        pairs = [
+            (path.to_bytes(), value)
+            for path, value in self._iterate(
+                self._root,
+                NibblePath([]),
+                None if start_key is None else NibblePath(start_key),
+                None if end_key is None else NibblePath(end_key),
+                visited,
+            )
+        ]
+
+        proof = []
+        if len(self._root) != 32:
+            # The root is always part of the proof, even if it is small.
+            proof.append(self._root)
+        seen = set()
+        for reference in visited:
+            if reference not in seen:
+                seen.add(reference)
+                proof.append(self._storage[reference])
+
+        return pairs, proof
+
+    @_traced("verify_range_proof")
+    def verify_range_proof(
+        self,
+        start_key: Optional[bytes],
+        end_key: Optional[bytes],
+        pairs: List[Tuple[bytes, bytes]],
+        proof: List[bytes],
+        root_hash: Optional[bytes] = None,
+    ) -> bool:
+        """
+        This method verifies a range proof.
+
+        The range walk is repeated over the nodes of the proof, starting at the
+        root hash. The proof is valid if every node the walk needs is in the proof
+        and the walk finds exactly the given pairs, so no pair of the range can be
+        left out or added.
+
+        Parameters
+        ----------
+        start_key: bytes or None
+            Smallest key of the range, None for no lower bound.
+        end_key: bytes or None
+            Key after the last key of the range, None for no upper bound.
+        pairs: list of (bytes, bytes)
+            Pairs of the range as returned by `get_range_proof`.
+        proof: list of bytes
+            Encoded nodes as returned by `get_range_proof`.
+        root_hash: bytes
+            (Optional) Root hash the proof is checked against, the root hash
+            of this trie if not provided.
+
+        Returns
+        -------
+        bool
+            True if the pairs are exactly the pairs of the range, False otherwise.
+        """
+        if root_hash is None:
+            root_hash = self.root_hash()
+
+        if len(proof) == 0 or keccak_hash(proof[0]) != root_hash:
             return False
 
-        # Proof passed
-        return True
+        proof_storage = {keccak_hash(encoded_node): encoded_node for encoded_node in proof}
+        root_ref = root_hash if len(proof[0]) >= 32 else proof[0]
+        proof_trie = MerklePatriciaTrie(proof_storage, root_ref, cache_size=0)
+        try:
+            found = [
+                (path.to_bytes(), value)
+                for path, value in proof_trie._iterate(
+                    root_ref,
+                    NibblePath([]),
+                    None if start_key is None else NibblePath(start_key),
+                    None if end_key is None else NibblePath(end_key),
+                )
+            ]
+        except _INVALID_PROOF_ERRORS + (KeyError, ValueError):
+            # A node the walk needs is missing or malformed.
+            return False
+
+        return found == [tuple(pair) for pair in pairs]
+
+    def _get_node(self, node_ref: bytes, cached: bool = True) -> Node:
+        """
+        This method gets a node from storage.
+
+        Decoded nodes are shared through the node cache, nodes are never
+        changed in place. Set `cached` to False to decode the node without
+        adding it to the cache, e.g. to walk the whole trie without filling
+        the cache with nodes that are read only once.
+
+        Parameters
+        ----------
+        node_ref: bytes
+            Reference to the node, or the in-memory node itself.
+        cached: bool
+            (Optional) Use the decoded node cache.
 
-    def _get_node(self, node_ref: bytes) -> Node:
-        """This method gets a node from storage."""
-        raw_node = None
+        Returns
+        -------
+        Node
+            The decoded node.
+        """
+        stats = self._stats
+        if stats is not None:
+            stats.node_visits += 1
 
         # Okey maybe it is alright like this because an RLP encoded node will
         # still get decoded
@@ -469,22 +1502,239 @@ class MerklePatriciaTrie:
         ):
             return node_ref
 
+        if cached:
+            node = self._node_cache.get(node_ref)
+            if stats is not None:
+                if node is None:
+                    stats.cache_misses += 1
+                else:
+                    stats.cache_hits += 1
+            if node is not None:
+                return node
+
         # Otherwise try to get it from storage or decode it from RLP
         if len(node_ref) == 32:
             raw_node = self._storage[node_ref]
+            if stats is not None:
+                stats.storage_reads += 1
             if isinstance(raw_node, Node):
                 return raw_node
         else:
             raw_node = node_ref
 
         decoded_node = Node.decode(raw_node)
+        if stats is not None:
+            stats.decodes += 1
         if not (
             isinstance(decoded_node, Extension)
             or isinstance(decoded_node, Leaf)
             or isinstance(decoded_node, Branch)
         ):
             raise InvalidNodeError("Invalid node type {}".format(type(decoded_node)))
-        return Node.decode(raw_node)
+
+        if cached:
+            self._node_cache.put(node_ref, decoded_node)
+        return decoded_node
+
+    def _reachable_references(self, roots: List[bytes]) -> set:
+        """
+        Collect the references of all stored nodes reachable from the roots.
+
+        Parameters
+        ----------
+        roots: list of bytes
+            References to the root nodes, None for an empty trie.
+
+        Returns
+        -------
+        set
+            References of the reachable nodes that are kept in the storage.
+        """
+        reachable = set()
+        stack = [root for root in roots if not _is_empty_reference(root)]
+
+        while stack:
+            node_ref = stack.pop()
+            if len(node_ref) == 32:
+                if node_ref in reachable:
+                    continue
+                reachable.add(node_ref)
+
+            # Walking the whole trie would evict the hot nodes, skip the cache.
+            node = self._get_node(node_ref, cached=False)
+            if type(node) is Extension:
+                stack.append(node.next_ref)
+            elif type(node) is Branch:
+                stack.extend(ref for ref in node.branches if not _is_empty_reference(ref))
+
+        return reachable
+
+    def _build_sorted(self, items) -> Union[bytes, None]:
+        """
+        Write the nodes of a trie built from sorted pairs and return its root.
+
+        Nodes are written in storage batches of `_BUILD_BATCH_SIZE` pairs so
+        buffering storages don't have to hold the whole trie.
+
+        Parameters
+        ----------
+        items: iterable of (bytes, bytes)
+            Pairs of key and value ordered by (hashed in secure mode) key.
+
+        Returns
+        -------
+        bytes or None
+            Reference to the root node, None if there were no pairs.
+        """
+        builder = SortedTrieBuilder(self._write_node)
+        items = iter(items)
+        while True:
+            chunk = list(islice(items, _BUILD_BATCH_SIZE))
+            if not chunk:
+                break
+
+            if self._secure:
+                keys = self._hash_keys([key for key, _ in chunk])
+                chunk = [(key, value) for key, (_, value) in zip(keys, chunk)]
+
+            with self._storage_batch():
+                for encoded_key, encoded_value in chunk:
+                    builder.add(encoded_key, encoded_value)
+
+        with self._storage_batch():
+            return builder.finish()
+
+    def _build_parallel(self, items, workers: Optional[int]) -> Union[bytes, None]:
+        """
+        Write the nodes of a trie built in worker processes and return its root.
+
+        Parameters
+        ----------
+        items: iterable of (bytes, bytes)
+            Pairs of key and value in any order.
+        workers: int or None
+            Number of worker processes, the number of CPUs if None.
+
+        Returns
+        -------
+        bytes or None
+            Reference to the root node, None if there were no pairs.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        # Pairs by the first nibble of the key, the empty key is stored in the root branch.
+        partitions = [[] for _ in range(16)]
+        root_value = None
+        items = iter(items)
+        while True:
+            chunk = list(islice(items, _BUILD_BATCH_SIZE))
+            if not chunk:
+                break
+            if self._secure:
+                keys = self._hash_keys([key for key, _ in chunk])
+                chunk = [(key, value) for key, (_, value) in zip(keys, chunk)]
+
+            for encoded_key, encoded_value in chunk:
+                if len(encoded_key) == 0:
+                    root_value = encoded_value
+                else:
+                    partitions[encoded_key[0] >> 4].append((encoded_key, encoded_value))
+
+        slots = [idx for idx in range(16) if partitions[idx]]
+        if workers < 2 or len(slots) + (root_value is not None) < 2:
+            # The root is not a branch over several slots, build it in one go.
+            pairs = [pair for partition in partitions for pair in partition]
+            pairs.sort(key=lambda item: item[0])
+            if root_value is not None:
+                pairs.insert(0, (b"", root_value))
+            # Secure keys are already hashed.
+            secure = self._secure
+            self._secure = False
+            try:
+                return self._build_sorted(pairs)
+            finally:
+                self._secure = secure
+
+        branches = [b""] * 16
+        with ProcessPoolExecutor(max_workers=min(workers, len(slots))) as executor:
+            results = executor.map(_build_partition, [partitions[idx] for idx in slots])
+            for idx, (reference, nodes) in zip(slots, results):
+                partitions[idx] = None
+                branches[idx] = reference
+                with self._storage_batch():
+                    for key, encoded_node in nodes.items():
+                        self._storage[key] = encoded_node
+                        if self._journal is not None:
+                            self._journal.add(key)
+
+        with self._storage_batch():
+            return self._write_node(Branch(branches, b"" if root_value is None else root_value))
+
+    def _storage_batch(self):
+        """
+        Return a context that groups the storage writes in one transaction.
+
+        Storages with a `batch` method (like `SQLiteStorage`) write everything
+        at the end of the context, other storages get a no-op context.
+        """
+        batch = getattr(self._storage, "batch", None)
+        if batch is None:
+            return nullcontext()
+        return batch()
+
+    def _after_write(self) -> ...:
+        """Count a write operation and prune the trie when automatic pruning is due."""
+        self._record_version()
+        if self._auto_prune == 0:
+            return
+
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= self._auto_prune:
+            self.prune()
+
+    def _record_version(self) -> ...:
+        """Add the current root to the retained versions if it is stored and new."""
+        if self._versions.maxlen == 0 or isinstance(self._root, Node):
+            return
+        if len(self._versions) == 0 or self._versions[-1] != self._root:
+            self._versions.append(self._root)
+
+    def _hash_key(self, key: bytes) -> bytes:
+        """Hash a key in secure mode, counting the hash if statistics are collected."""
+        stats = self._stats
+        if stats is not None:
+            stats.hashes += 1
+            stats.bytes_hashed += len(key)
+        return keccak_hash(key)
+
+    def _hash_keys(self, keys: List[bytes]) -> List[bytes]:
+        """Hash keys in secure mode in one batch, counting the hashes for the statistics."""
+        stats = self._stats
+        if stats is not None:
+            stats.hashes += len(keys)
+            stats.bytes_hashed += sum(map(len, keys))
+        return keccak_hash_many(keys)
+
+    def _add_view(self, root: Optional[bytes]) -> "MerklePatriciaTrie":
+        """
+        Create a read-only view pinned to the root and register it.
+
+        The caller must hold `_views_lock`, see `snapshot` and `prune`.
+        """
+        view = object.__new__(type(self))
+        view.__dict__.update(self.__dict__)
+        view._root = root
+        view._deferred = False
+        view._journal = None
+        view._read_only = True
+        self._views.add(view)
+        return view
+
+    def _check_writable(self) -> ...:
+        """Raise an error if the trie is a read-only view."""
+        if self._read_only:
+            raise ReadOnlyError("Cannot modify a read-only snapshot of the trie")
 
     def _get(self, node_ref: bytes, path: NibblePath) -> bytes:
         """
@@ -543,7 +1793,7 @@ class MerklePatriciaTrie:
         elif type(node) is Branch:
             # If we've found a branch node, go to the appropriate branch.
             branch = node.branches[path.at(0)]
-            if len(branch) > 0:
+            if not _is_empty_reference(branch):
                 return self._get(branch, path.consume(1))
             else:
                 raise BranchPathError(
@@ -553,11 +1803,291 @@ class MerklePatriciaTrie:
 
         raise InvalidNodeError("Invalid node type {}".format(type(node)))
 
-    def _contains(self, node_ref: bytes, path: NibblePath) -> bool:
+    def _iterate(
+        self,
+        node_ref: bytes,
+        prefix: NibblePath,
+        start: Optional[NibblePath] = None,
+        end: Optional[NibblePath] = None,
+        visited: Optional[list] = None,
+    ) -> Iterator[Tuple[NibblePath, bytes]]:
+        """
+        Iterate support method.
+
+        Walks the subtree of the node depth-first in nibble order. The stack of
+        the walk holds at most 16 references per level of the trie. Subtrees
+        outside the bounds are skipped without being read, and the bounds are
+        no longer checked in subtrees that are completely inside them.
+
+        Parameters
+        ----------
+        node_ref: bytes
+            Reference to the root of the subtree.
+        prefix: NibblePath
+            Path from the root of the trie to the node.
+        start: NibblePath
+            (Optional) Smallest path to return.
+        end: NibblePath
+            (Optional) Path after the last path to return.
+        visited: list
+            (Optional) List the references of the read stored nodes are added to.
+
+        Yields
+        ------
+        tuple of (NibblePath, bytes)
+            Full path and value of every value in the subtree.
+        """
+        stack = [(node_ref, prefix, start, end)]
+        while stack:
+            node_ref, path, start, end = stack.pop()
+            node = self._get_node(node_ref)
+            if visited is not None and len(node_ref) == 32:
+                visited.append(node_ref)
+
+            if type(node) is Leaf:
+                key_path = path.combine(node.path)
+                if self._in_range(key_path, start, end):
+                    yield key_path, node.data
+
+            elif type(node) is Extension:
+                self._push_in_range(stack, node.next_ref, path.combine(node.path), start, end)
+
+            elif type(node) is Branch:
+                # Push the slots in reverse so the lowest nibble is walked first.
+                for idx in range(15, -1, -1):
+                    branch = node.branches[idx]
+                    if not _is_empty_reference(branch):
+                        self._push_in_range(
+                            stack, branch, path.combine(_SLOT_PATHS[idx]), start, end
+                        )
+
+                # The value of a branch belongs to the shortest key, it comes first.
+                if node.data and self._in_range(path, start, end):
+                    yield path, node.data
+
+            else:
+                raise InvalidNodeError("Invalid node type {}".format(type(node)))
+
+    def _diff(
+        self, ref_a: Optional[bytes], ref_b: Optional[bytes]
+    ) -> Iterator[Tuple[NibblePath, Optional[bytes], Optional[bytes]]]:
+        """
+        Diff support method.
+
+        Walks both tries depth-first in nibble order. Where the tries have
+        different node types at the same path, the nodes are compared as
+        branches (see `_expand`) one nibble at a time until the structures
+        line up again.
+
+        Parameters
+        ----------
+        ref_a: bytes or None
+            Reference to the old root.
+        ref_b: bytes or None
+            Reference to the new root.
+
+        Yields
+        ------
+        tuple of (NibblePath, bytes or None, bytes or None)
+            Full path, old value and new value of every changed key.
+        """
+        stack = [(ref_a, ref_b, NibblePath([]))]
+        while stack:
+            ref_a, ref_b, path = stack.pop()
+            if _same_reference(ref_a, ref_b):
+                continue
+
+            if _is_empty_reference(ref_a):
+                for key_path, value in self._iterate(ref_b, path):
+                    yield key_path, None, value
+                continue
+            if _is_empty_reference(ref_b):
+                for key_path, value in self._iterate(ref_a, path):
+                    yield key_path, value, None
+                continue
+
+            node_a = self._get_node(ref_a)
+            node_b = self._get_node(ref_b)
+
+            if type(node_a) is Leaf and type(node_b) is Leaf:
+                key_a = path.combine(node_a.path)
+                key_b = path.combine(node_b.path)
+                if key_a == key_b:
+                    if node_a.data != node_b.data:
+                        yield key_a, node_a.data, node_b.data
+                elif key_a.to_bytes() < key_b.to_bytes():
+                    yield key_a, node_a.data, None
+                    yield key_b, None, node_b.data
+                else:
+                    yield key_b, None, node_b.data
+                    yield key_a, node_a.data, None
+                continue
+
+            if (
+                type(node_a) is Extension
+                and type(node_b) is Extension
+                and node_a.path == node_b.path
+            ):
+                stack.append((node_a.next_ref, node_b.next_ref, path.combine(node_a.path)))
+                continue
+
+            value_a, branches_a = self._expand(node_a)
+            value_b, branches_b = self._expand(node_b)
+            # Push the slots in reverse so the lowest nibble is walked first.
+            for idx in range(15, -1, -1):
+                if not _same_reference(branches_a[idx], branches_b[idx]):
+                    stack.append(
+                        (branches_a[idx], branches_b[idx], path.combine(_SLOT_PATHS[idx]))
+                    )
+
+            if value_a != value_b:
+                yield path, value_a, value_b
+
+    @staticmethod
+    def _expand(node: Node) -> Tuple[Optional[bytes], list]:
+        """
+        Return the value and the 16 child references of a node seen as a branch.
+
+        Extensions and leaves become a branch with one child, which is the
+        same node with the first nibble of its path moved into the slot.
+
+        Parameters
+        ----------
+        node: Node
+            Node to expand.
+
+        Returns
+        -------
+        tuple
+            Value stored at the node (None if there is none) and the references
+            (or in-memory nodes) of the 16 slots.
+        """
+        if type(node) is Branch:
+            return (node.data if node.data else None), node.branches
+
+        branches = [b""] * 16
+        if type(node) is Extension:
+            rest_path = node.path.consume(1)
+            if len(rest_path) == 0:
+                branches[node.path.at(0)] = node.next_ref
+            else:
+                branches[node.path.at(0)] = Extension(rest_path, node.next_ref)
+            return None, branches
+
+        if type(node) is Leaf:
+            if len(node.path) == 0:
+                return node.data, branches
+            branches[node.path.at(0)] = Leaf(node.path.consume(1), node.data)
+            return None, branches
+
+        raise InvalidNodeError("Invalid node type {}".format(type(node)))
+
+    @staticmethod
+    def _push_in_range(
+        stack: list,
+        node_ref: bytes,
+        path: NibblePath,
+        start: Optional[NibblePath],
+        end: Optional[NibblePath],
+    ) -> ...:
+        """
+        Add a subtree to the iteration stack unless it is outside the bounds.
+
+        A bound is replaced by None for the subtree if all its keys are on the
+        right side of it.
+        """
+        if start is not None:
+            order = _compare_to_bound(path, start)
+            if order < 0:
+                return
+            if order > 0:
+                start = None
+
+        if end is not None:
+            order = _compare_to_bound(path, end)
+            if order > 0:
+                return
+            if order < 0:
+                end = None
+
+        stack.append((node_ref, path, start, end))
+
+    @staticmethod
+    def _in_range(
+        key_path: NibblePath, start: Optional[NibblePath], end: Optional[NibblePath]
+    ) -> bool:
+        """Check if start <= key < end, None bounds are not checked."""
+        if start is not None:
+            order = _compare_to_bound(key_path, start)
+            if order < 0 or (order == 0 and len(key_path) < len(start)):
+                return False
+
+        if end is not None:
+            order = _compare_to_bound(key_path, end)
+            if order > 0 or (order == 0 and len(key_path) == len(end)):
+                return False
+
+        return True
+
+    def _seek(
+        self, node_ref: bytes, path: NibblePath
+    ) -> Optional[Tuple[bytes, NibblePath]]:
+        """
+        Find the subtree that holds the keys starting with the path.
+
+        Parameters
+        ----------
+        node_ref: bytes
+            Reference to a node.
+        path: NibblePath
+            Rest of the prefix.
+
+        Returns
+        -------
+        tuple of (bytes, NibblePath) or None
+            Reference to the subtree and the path from the root of the trie
+            to it, None if no key starts with the prefix.
+        """
+        walked = NibblePath([])
+        while True:
+            if len(path) == 0:
+                return node_ref, walked
+
+            node = self._get_node(node_ref)
+
+            if type(node) is Leaf:
+                if node.path.starts_with(path):
+                    return node_ref, walked
+                return None
+
+            elif type(node) is Extension:
+                if path.starts_with(node.path):
+                    walked = walked.combine(node.path)
+                    path = path.consume(len(node.path))
+                    node_ref = node.next_ref
+                elif node.path.starts_with(path):
+                    # The prefix ends inside the extension, the whole subtree matches.
+                    return node_ref, walked
+                else:
+                    return None
+
+            elif type(node) is Branch:
+                branch = node.branches[path.at(0)]
+                if _is_empty_reference(branch):
+                    return None
+                walked = walked.combine(_SLOT_PATHS[path.at(0)])
+                path = path.consume(1)
+                node_ref = branch
+
+            else:
+                raise InvalidNodeError("Invalid node type {}".format(type(node)))
+
+    def _contains(self, node_ref: bytes, path: NibblePath) -> tuple:
         """
         contains support method.
 
-        Only returns the node as close to the end of the path as possible.
+        Only returns the node as close to the end of the path as possible
+        together with the part of the path that is left at that node.
         The main contains method will check if this node has a value, and
         if this value is the one we're looking for.
         """
@@ -566,13 +2096,13 @@ class MerklePatriciaTrie:
         # If path is empty, our travel is over. Main `get` method
         # will check if this node has a value.
         if len(path) == 0:
-            return node
+            return node, path
 
         if type(node) is Leaf:
             # If we've found a leaf, it's either the leaf we're
             # looking for or wrong leaf.(we hope its the wrong leaf but
             # that is up to the main method).
-            return node
+            return node, path
 
         elif type(node) is Extension:
             # If we've found an extension, we need to go deeper.
@@ -580,16 +2110,16 @@ class MerklePatriciaTrie:
                 rest_path = path.consume(len(node.path))
                 return self._contains(node.next_ref, rest_path)
             else:
-                return node
+                return node, path
 
         elif type(node) is Branch:
             # If we've found a branch node, go to the appropriate branch.
             branch = node.branches[path.at(0)]
-            if len(branch) > 0:
+            if not _is_empty_reference(branch):
                 return self._contains(branch, path.consume(1))
             else:
                 # This is the furthest node we can go.
-                return node
+                return node, path
 
         raise InvalidNodeError("Invalid node type {}".format(type(node)))
 
@@ -625,141 +2155,44 @@ class MerklePatriciaTrie:
         # Get the node from the reference
         node = self._get_node(node_ref)
 
-        # print(type(node))
-
-        if len(path) == 0:
-            # If path is empty, we've found the node.
-            # The node doesnt have to be a leaf.
-            proof.append(node.encode())
-            return proof
-
-        if isinstance(node, Leaf):
-            # If we've found a leaf, it's either the leaf we're
-            # looking for or wrong leaf.
-            if node.path == path:
-                proof.append(node.encode())
-                return proof
-            else:
-                raise LeafPathError(
-                    "The leaf key and search key do not match"
-                    " Leaf key: {}, search key: {}".format(node.path, path)
-                )
-
-        elif type(node) is Extension:
-            # If we've found an extension, we need to go deeper.
-            if path.starts_with(node.path):
-                rest_path = path.consume(len(node.path))
-                proof.append(node.encode())
-                return self._get_proof_of_inclusion(node.next_ref, rest_path, proof)
-            else:
-                raise ExtensionPathError(
-                    "Something wrong with the path in the extension"
-                    " Extension path: {}, search path: {}".format(node.path, path)
-                )
-
-        elif type(node) is Branch:
-            # If we've found a branch node, go to the appropriate branch.
-            branch = node.branches[path.at(0)]
-            if len(branch) > 0:
-                proof.append(node.encode())
-                return self._get_proof_of_inclusion(branch, path.consume(1), proof)
-            else:
-                raise BranchPathError(
-                    "Branch slot is empty."
-                    " Branch: {}, search path: {}".format(node.branches, path)
-                )
-
-        raise InvalidNodeError("Unknown node type {}".format(node))
-
-    def _verify_proof_of_inclusion(
-        self, node_ref: bytes, path: NibblePath, proof_storage: dict
-    ) -> bool:
-        """
-        Verify proof of inclusion support method.
-
-        Used to verify a proof of inclusion for a node ref.
-
-        Parameters
-        ----------
-        node_ref: bytes
-            Reference to a node.
-        path: NibblePath
-            Path to a value.
-        proof: dict
-            Dictionary with nodes. (empty in the beginning)
-
-        Returns
-        -------
-        bool
-            True if the proof is valid, False otherwise.
-
-        Raises
-        ------
-        KeyError
-            KeyError is raised if there is no node assotiated with provided key.
-        ExtensionPathError, InvalidNodeError, LeafPathError, BranchPathError, InvalidNodeError
-            Raised if the path is not valid.
-        """
-        # Get the right node from the proof storage
-        if not (
-            isinstance(node_ref, Leaf)
-            or isinstance(node_ref, Extension)
-            or isinstance(node_ref, Branch)
-        ):
-            # Otherwise try to get it from storage or decode it from RLP
-            if len(node_ref) == 32:
-                try:
-                    raw_node = proof_storage[node_ref]
-                except KeyError:
-                    return False
-            else:
-                raw_node = node_ref
-            node = Node.decode(raw_node)
-        else:
-            node = node_ref
-
-        # If path is empty, our travel is over. Main `get` method
-        # will check if this node has a value.
+        # print(type(node))
+
         if len(path) == 0:
-            # check extension and node, leaf already handeled
-            if isinstance(node, Extension):
-                return False
-            if isinstance(node, Branch):
-                # Check if the branch has data
-                if node.data != None:
-                    return True
-                else:
-                    return False
-            return True
+            # If path is empty, we've found the node.
+            # The node doesnt have to be a leaf.
+            proof.append(node.encode())
+            return proof
 
-        if type(node) is Leaf:
+        if isinstance(node, Leaf):
             # If we've found a leaf, it's either the leaf we're
             # looking for or wrong leaf.
             if node.path == path:
-                return True
+                proof.append(node.encode())
+                return proof
             else:
-                return False
+                raise LeafPathError(
+                    "The leaf key and search key do not match"
+                    " Leaf key: {}, search key: {}".format(node.path, path)
+                )
 
         elif type(node) is Extension:
             # If we've found an extension, we need to go deeper.
             if path.starts_with(node.path):
                 rest_path = path.consume(len(node.path))
-                return self._verify_proof_of_inclusion(
-                    node.next_ref, rest_path, proof_storage
-                )
+                proof.append(node.encode())
+                return self._get_proof_of_inclusion(node.next_ref, rest_path, proof)
             else:
                 raise ExtensionPathError(
-                    "Something wrong with the path in the extension."
+                    "Something wrong with the path in the extension"
                     " Extension path: {}, search path: {}".format(node.path, path)
                 )
 
         elif type(node) is Branch:
             # If we've found a branch node, go to the appropriate branch.
             branch = node.branches[path.at(0)]
-            if len(branch) > 0:
-                return self._verify_proof_of_inclusion(
-                    branch, path.consume(1), proof_storage
-                )
+            if not _is_empty_reference(branch):
+                proof.append(node.encode())
+                return self._get_proof_of_inclusion(branch, path.consume(1), proof)
             else:
                 raise BranchPathError(
                     "Branch slot is empty."
@@ -770,7 +2203,7 @@ class MerklePatriciaTrie:
 
     def _get_proof_of_exclusion(
         self, node_ref: bytes, path: NibblePath, proof: dict
-    ) -> dict:
+    ) -> tuple:
         """
         Get proof of exclusion support method.
 
@@ -787,8 +2220,9 @@ class MerklePatriciaTrie:
 
         Returns
         -------
-        dict
-            Dictionary with nodes. (empty in the beginning)
+        tuple
+            The furthest node on the path, the rest of the path at that node
+            and the list of encoded nodes.
 
         Raises
         ------
@@ -803,14 +2237,14 @@ class MerklePatriciaTrie:
         # will check if this node has a value.
         if len(path) == 0:
             proof.append(node.encode())
-            return node, proof
+            return node, path, proof
 
         if type(node) is Leaf:
             # If we've found a leaf, it's either the leaf we're
             # looking for or wrong leaf.(we hope its the wrong leaf but
             # that is up to the main method).
             proof.append(node.encode())
-            return node, proof
+            return node, path, proof
 
         elif type(node) is Extension:
             # If we've found an extension, we need to go deeper.
@@ -819,117 +2253,185 @@ class MerklePatriciaTrie:
                 proof.append(node.encode())
                 return self._get_proof_of_exclusion(node.next_ref, rest_path, proof)
             else:
-                return node, proof
+                # The diverging extension is what proves the key is missing.
+                proof.append(node.encode())
+                return node, path, proof
 
         elif type(node) is Branch:
             # If we've found a branch node, go to the appropriate branch.
             branch = node.branches[path.at(0)]
             proof.append(node.encode())
-            if len(branch) > 0:
+            if not _is_empty_reference(branch):
                 return self._get_proof_of_exclusion(branch, path.consume(1), proof)
             else:
                 # This is the furthest node we can go.
-                return node, proof
+                return node, path, proof
 
         raise InvalidNodeError("Invalid node type {}".format(type(node)))
 
-    def _verify_proof_of_exclusion(
-        self,
-        node_ref: Union[bytes, Leaf, Branch, Extension],
-        path: NibblePath,
-        proof_storage: dict,
-    ) -> Tuple[bool, dict]:
+    def _multiproof_paths(self, encoded_keys: List[bytes]) -> List[NibblePath]:
+        """
+        Return the sorted paths of the distinct keys of a multiproof.
+
+        Parameters
+        ----------
+        encoded_keys: list of bytes
+            Keys or RLP-encoded keys, hashed in secure mode.
+
+        Returns
+        -------
+        list of NibblePath
+            Paths to the keys.
         """
-        Verify proof of exclusion support method.
+        if self._secure:
+            encoded_keys = self._hash_keys(list(encoded_keys))
+        return [NibblePath(key) for key in sorted(set(encoded_keys))]
 
-        Used to verify a proof of exclusion for a node ref.
+    @staticmethod
+    def _group_by_nibble(paths: List[NibblePath]) -> Tuple[bool, Dict[int, list]]:
+        """
+        Split paths at a branch node.
 
         Parameters
         ----------
-        node_ref: bytes, Leaf, Branch, Extension
-            Reference to a node or the node itself.
-        path: NibblePath
-            Path to a value.
-        proof: dict
-            Dictionary with nodes. (empty in the beginning)
+        paths: list of NibblePath
+            Paths that go through the branch node.
 
         Returns
         -------
-        bool, node_ref
-            True if this the last node in the proof, the next node ref otherwise.
-        proof_storage: dict
-            Dictionary with nodes.
+        tuple
+            True if one of the paths ends in the branch, and the rest of the other
+            paths by the nibble of the branch they continue in.
+        """
+        ends_here = False
+        groups = {}
+        for path in paths:
+            if len(path) == 0:
+                ends_here = True
+            else:
+                groups.setdefault(path.at(0), []).append(path.consume(1))
+        return ends_here, groups
+
+    def _get_multiproof(
+        self, node_ref: bytes, paths: List[NibblePath], proof: List[bytes], seen: set
+    ) -> ...:
+        """
+        Get multiproof support method.
+
+        Adds the nodes on the paths below the node to the proof, every node is
+        visited once no matter how many paths go through it.
+
+        Parameters
+        ----------
+        node_ref: bytes
+            Reference to a node.
+        paths: list of NibblePath
+            Sorted paths to the keys below the node.
+        proof: list of bytes
+            Encoded nodes of the proof up until now.
+        seen: set
+            Hashes of the nodes that are already in the proof.
 
         Raises
         ------
-        PoeError
-            PoeError when there is something wrong with the proof.
-        InvalidNodeError
-            InvalidNodeError when there is an invalid node in the proof.
+        LeafPathError, ExtensionPathError, BranchPathError, InvalidNodeError
+            Raised if one of the paths is not in the trie.
         """
-        # Get the right node from the proof storage
-        if not (
-            isinstance(node_ref, Leaf)
-            or isinstance(node_ref, Extension)
-            or isinstance(node_ref, Branch)
-        ):
-            # Otherwise try to get it from storage or decode it from RLP
-            if len(node_ref) == 32:
-                try:
-                    raw_node = proof_storage[node_ref]
-                except KeyError:
-                    # TODO: Figure out in wich cases this shouldnt be True
-                    # I still dont really trust this statement,
-                    # but it is necessary for the tests to pass
-                    # By checking the proof_dict at the end of the function
-                    # there should be 1 node left in the dict, the null leaf
-                    return True, proof_storage
-            else:
-                raw_node = node_ref
-            node = Node.decode(raw_node)
+        if len(node_ref) == 32 and node_ref not in seen:
+            seen.add(node_ref)
+            proof.append(self._storage[node_ref])
+
+        node = self._get_node(node_ref)
+
+        if type(node) is Leaf:
+            for path in paths:
+                if node.path != path:
+                    raise LeafPathError(
+                        "The leaf key and search key do not match"
+                        " Leaf key: {}, search key: {}".format(node.path, path)
+                    )
+
+        elif type(node) is Extension:
+            rest_paths = []
+            for path in paths:
+                if not path.starts_with(node.path):
+                    raise ExtensionPathError(
+                        "Something wrong with the path in the extension"
+                        " Extension path: {}, search path: {}".format(node.path, path)
+                    )
+                rest_paths.append(path.consume(len(node.path)))
+            self._get_multiproof(node.next_ref, rest_paths, proof, seen)
+
+        elif type(node) is Branch:
+            ends_here, groups = self._group_by_nibble(paths)
+            if ends_here and not node.data:
+                raise BranchPathError(
+                    "A key ends in a branch without value."
+                    " Branch: {}".format(node.branches)
+                )
+            for idx, rest_paths in groups.items():
+                branch = node.branches[idx]
+                if _is_empty_reference(branch):
+                    raise BranchPathError(
+                        "Branch slot is empty."
+                        " Branch: {}, search path: {}".format(node.branches, rest_paths[0])
+                    )
+                self._get_multiproof(branch, rest_paths, proof, seen)
+
         else:
-            node = node_ref
+            raise InvalidNodeError("Unknown node type {}".format(node))
 
-        # Remove the used reference and node from the dictionary
-        if proof_storage.pop(node_ref, None) == None:
-            raise PoeError(
-                "The proof storage returned a node with value None,"
-                " this should not be possible."
-            )
+    def _verify_multiproof(
+        self, node_ref: bytes, paths: List[NibblePath], proof_storage: dict
+    ) -> bool:
+        """
+        Verify multiproof support method.
 
-        # If path is empty, our travel is over. Main `get` method
-        # will check if this node has a value.
-        if len(path) == 0:
-            return node, proof_storage
+        Parameters
+        ----------
+        node_ref: bytes
+            Reference to a node.
+        paths: list of NibblePath
+            Sorted paths to the keys below the node.
+        proof_storage: dict
+            Encoded nodes of the proof by their hash.
+
+        Returns
+        -------
+        bool
+            True if all paths lead to a value, False otherwise.
+        """
+        if len(node_ref) == 32:
+            try:
+                raw_node = proof_storage[node_ref]
+            except KeyError:
+                return False
+        else:
+            raw_node = node_ref
+        node = Node.decode(raw_node)
 
         if type(node) is Leaf:
-            # If we've found a leaf, it's either the leaf we're
-            # looking for or wrong leaf.(we hope its the wrong leaf but
-            # that is up to the main method).
-            return node, proof_storage
+            return all(node.path == path for path in paths)
 
         elif type(node) is Extension:
-            # If we've found an extension, we need to go deeper.
-            if path.starts_with(node.path):
-                rest_path = path.consume(len(node.path))
-                return self._verify_proof_of_exclusion(
-                    node.next_ref, rest_path, proof_storage
-                )
-            else:
-                return node, proof_storage
+            if not all(path.starts_with(node.path) for path in paths):
+                return False
+            rest_paths = [path.consume(len(node.path)) for path in paths]
+            return self._verify_multiproof(node.next_ref, rest_paths, proof_storage)
 
         elif type(node) is Branch:
-            # If we've found a branch node, go to the appropriate branch.
-            branch = node.branches[path.at(0)]
-            if len(branch) > 0:
-                return self._verify_proof_of_exclusion(
-                    branch, path.consume(1), proof_storage
-                )
-            else:
-                # This is the furthest node we can go.
-                return node, proof_storage
+            ends_here, groups = self._group_by_nibble(paths)
+            if ends_here and not node.data:
+                return False
+            for idx, rest_paths in groups.items():
+                branch = node.branches[idx]
+                if _is_empty_reference(branch):
+                    return False
+                if not self._verify_multiproof(branch, rest_paths, proof_storage):
+                    return False
+            return True
 
-        raise InvalidNodeError("Invalid node type {}".format(type(node)))
+        return False
 
     def _update(self, node_ref: bytes, path: NibblePath, value: bytes) -> bytes:
         """
@@ -959,6 +2461,8 @@ class MerklePatriciaTrie:
         if not node_ref:
             return self._store_node(Leaf(path, value))
 
+        # Nodes are never changed in place, every change creates new nodes
+        # (copy-on-write), so readers of older roots are not affected.
         node = self._get_node(node_ref)
 
         if type(node) == Leaf:
@@ -969,8 +2473,7 @@ class MerklePatriciaTrie:
 
             if node.path == path:
                 # Path is the same. Just change the value.
-                node.data = value
-                return self._store_node(node)
+                return self._store_node(Leaf(node.path, value))
 
             # If we are here, we have to split the node.
 
@@ -978,12 +2481,12 @@ class MerklePatriciaTrie:
             common_prefix = path.common_prefix(node.path)
 
             # Cut off the common part.
-            path.consume(len(common_prefix))
-            node.path.consume(len(common_prefix))
+            path = path.consume(len(common_prefix))
+            node_path = node.path.consume(len(common_prefix))
 
             # Create branch node to split paths.
             branch_reference = self._create_branch_node(
-                path, value, node.path, node.data
+                path, value, node_path, node.data
             )
 
             # If common part isn't empty, we have to create an extension node before branch node.
@@ -1012,8 +2515,8 @@ class MerklePatriciaTrie:
             common_prefix = path.common_prefix(node.path)
 
             # Cut off the common part.
-            path.consume(len(common_prefix))
-            node.path.consume(len(common_prefix))
+            path = path.consume(len(common_prefix))
+            node_path = node.path.consume(len(common_prefix))
 
             # Create an empty branch node. It may have or have not the value depending on the length
             # of the rest of the key.
@@ -1023,7 +2526,7 @@ class MerklePatriciaTrie:
             # If needed, create leaf branch for the value we're inserting.
             self._create_branch_leaf(path, value, branches)
             # If needed, create an extension node for the rest of the extension's path.
-            self._create_branch_extension(node.path, node.next_ref, branches)
+            self._create_branch_extension(node_path, node.next_ref, branches)
 
             branch_reference = self._store_node(Branch(branches, branch_value))
 
@@ -1045,9 +2548,143 @@ class MerklePatriciaTrie:
             idx = path.at(0)
             new_reference = self._update(node.branches[idx], path.consume(1), value)
 
-            node.branches[idx] = new_reference
+            branches = list(node.branches)
+            branches[idx] = new_reference
+
+            return self._store_node(Branch(branches, node.data))
+
+    def _update_many(
+        self, node_ref: bytes, pairs: List[Tuple[NibblePath, bytes]]
+    ) -> bytes:
+        """
+        Batch update support method.
+
+        Applies all pairs below a node at once: the pairs are split by nibble at
+        every branch, like `_get_multiproof` splits paths, so every node on their
+        paths is read and rebuilt once.
+
+        Parameters
+        ----------
+        node_ref: bytes
+            Reference to a node.
+        pairs: list of (NibblePath, bytes)
+            Paths (all different) and values to be stored.
+
+        Returns
+        -------
+        bytes
+            New reference to the node.
+        """
+        if len(pairs) == 1:
+            path, value = pairs[0]
+            return self._update(node_ref, path, value)
+
+        if not node_ref:
+            return self._build_subtree(pairs)
+
+        node = self._get_node(node_ref)
+
+        if type(node) == Leaf:
+            # The leaf is one more pair, unless one of the pairs replaces its value.
+            if all(path != node.path for path, _ in pairs):
+                pairs = pairs + [(node.path, node.data)]
+            return self._build_subtree(pairs)
+
+        elif type(node) == Extension:
+            common_length = min(
+                path.common_prefix_length(node.path) for path, _ in pairs
+            )
+            rest_pairs = [(path.consume(common_length), value) for path, value in pairs]
+
+            if common_length == len(node.path):
+                # All paths go through the extension.
+                new_reference = self._update_many(node.next_ref, rest_pairs)
+                return self._store_node(Extension(node.path, new_reference))
+
+            # Split the extension like `_update` does, then apply the pairs to
+            # the new (in-memory) branch.
+            branches = [b""] * 16
+            self._create_branch_extension(
+                node.path.consume(common_length), node.next_ref, branches
+            )
+            branch_reference = self._update_many(Branch(branches, b""), rest_pairs)
+
+            if common_length != 0:
+                prefix = node.path.prefix(common_length)
+                return self._store_node(Extension(prefix, branch_reference))
+            else:
+                return branch_reference
+
+        elif type(node) == Branch:
+            branches = list(node.branches)
+            value, groups = self._group_pairs_by_nibble(pairs)
+            for idx, rest_pairs in groups.items():
+                branches[idx] = self._update_many(branches[idx], rest_pairs)
+
+            return self._store_node(Branch(branches, node.data if value is None else value))
 
-            return self._store_node(node)
+    def _build_subtree(self, pairs: List[Tuple[NibblePath, bytes]]) -> bytes:
+        """
+        Create the nodes of a subtree holding exactly the given pairs.
+
+        Parameters
+        ----------
+        pairs: list of (NibblePath, bytes)
+            Paths (all different) and values to be stored.
+
+        Returns
+        -------
+        bytes
+            Reference to the root of the subtree.
+        """
+        if len(pairs) == 1:
+            path, value = pairs[0]
+            return self._store_node(Leaf(path, value))
+
+        first_path = pairs[0][0]
+        common_length = min(
+            first_path.common_prefix_length(path) for path, _ in pairs[1:]
+        )
+        if common_length != 0:
+            rest_pairs = [(path.consume(common_length), value) for path, value in pairs]
+            branch_reference = self._build_subtree(rest_pairs)
+            prefix = first_path.prefix(common_length)
+            return self._store_node(Extension(prefix, branch_reference))
+
+        branches = [b""] * 16
+        value, groups = self._group_pairs_by_nibble(pairs)
+        for idx, rest_pairs in groups.items():
+            branches[idx] = self._build_subtree(rest_pairs)
+
+        return self._store_node(Branch(branches, b"" if value is None else value))
+
+    @staticmethod
+    def _group_pairs_by_nibble(
+        pairs: List[Tuple[NibblePath, bytes]]
+    ) -> Tuple[Optional[bytes], Dict[int, list]]:
+        """
+        Split pairs at a branch node, see `_group_by_nibble`.
+
+        Parameters
+        ----------
+        pairs: list of (NibblePath, bytes)
+            Paths that go through the branch node and their values.
+
+        Returns
+        -------
+        tuple
+            The value of the path that ends in the branch (None if there is no
+            such path), and the rest of the other pairs by the nibble of the
+            branch they continue in.
+        """
+        value = None
+        groups = {}
+        for path, path_value in pairs:
+            if len(path) == 0:
+                value = path_value
+            else:
+                groups.setdefault(path.at(0), []).append((path.consume(1), path_value))
+        return value, groups
 
     def _create_branch_node(
         self, path_a: NibblePath, value_a: bytes, path_b: NibblePath, value_b: bytes
@@ -1152,16 +2789,167 @@ class MerklePatriciaTrie:
         node: Node
             Node to be stored.
 
+        Returns
+        -------
+        bytes or Node
+            Reference to the node, or the node itself if it is kept in memory.
+        """
+        if self._deferred:
+            return node
+
+        return self._write_node(node)
+
+    def _commit_node(self, node_ref: Union[bytes, Node, None]) -> Union[bytes, None]:
+        """
+        Store a node that is kept in memory together with its in-memory children.
+
+        The in-memory nodes are written level by level from the bottom, so
+        children are stored before their parent, every node is encoded and
+        hashed exactly once and the nodes of a level are hashed in one batch.
+        References that are already bytes are returned as is.
+
+        Parameters
+        ----------
+        node_ref: bytes, Node or None
+            Reference to a node or the in-memory node itself.
+
+        Returns
+        -------
+        bytes or None
+            Reference to the stored node.
+        """
+        if not isinstance(node_ref, Node):
+            return node_ref
+
+        levels = []
+        self._node_height(node_ref, levels, {})
+
+        references = {}
+
+        def reference(child):
+            return references[id(child)] if isinstance(child, Node) else child
+
+        for level in levels:
+            nodes = []
+            for node in level:
+                if type(node) is Extension:
+                    node = Extension(node.path, reference(node.next_ref))
+                elif type(node) is Branch:
+                    node = Branch([reference(child) for child in node.branches], node.data)
+                nodes.append(node)
+            for node, node_reference in zip(level, self._write_nodes(nodes)):
+                references[id(node)] = node_reference
+
+        return references[id(node_ref)]
+
+    def _node_height(self, node: Node, levels: List[List[Node]], heights: Dict[int, int]) -> int:
+        """
+        Add an in-memory node and its in-memory children to their level.
+
+        Parameters
+        ----------
+        node: Node
+            Node kept in memory.
+        levels: list of list of Node
+            Nodes by height, a node is one level above its highest in-memory child.
+        heights: dict
+            Heights of the nodes already added, by id of the node.
+
+        Returns
+        -------
+        int
+            Height of the node.
+        """
+        height = heights.get(id(node))
+        if height is not None:
+            return height
+
+        if type(node) is Extension:
+            children = (node.next_ref,)
+        elif type(node) is Branch:
+            children = node.branches
+        else:
+            children = ()
+
+        height = 0
+        for child in children:
+            if isinstance(child, Node):
+                height = max(height, self._node_height(child, levels, heights) + 1)
+
+        heights[id(node)] = height
+        while len(levels) <= height:
+            levels.append([])
+        levels[height].append(node)
+        return height
+
+    def _write_node(self, node: Node) -> bytes:
+        """
+        Encode the node and, if it is not referenced in place, write it to the storage.
+
+        Parameters
+        ----------
+        node: Node
+            Node to be written, its children must be references.
+
         Returns
         -------
         bytes
             Reference to the node.
         """
-        reference = Node.into_reference(node)
-        if len(reference) == 32:
-            self._storage[reference] = node.encode()
+        encoded_node = node.encode()
+        stats = self._stats
+        if stats is not None:
+            stats.encodes += 1
+        if len(encoded_node) < 32:
+            return encoded_node
+
+        reference = keccak_hash(encoded_node)
+        self._storage[reference] = encoded_node
+        if stats is not None:
+            stats.hashes += 1
+            stats.bytes_hashed += len(encoded_node)
+            stats.storage_writes += 1
+        if self._journal is not None:
+            self._journal.add(reference)
         return reference
 
+    def _write_nodes(self, nodes: List[Node]) -> List[bytes]:
+        """
+        Encode the nodes, hash them in one batch and write them like `_write_node`.
+
+        Parameters
+        ----------
+        nodes: list of Node
+            Nodes to be written, their children must be references.
+
+        Returns
+        -------
+        list of bytes
+            References to the nodes.
+        """
+        encoded_nodes = [node.encode() for node in nodes]
+        hashed_nodes = [encoded_node for encoded_node in encoded_nodes if len(encoded_node) >= 32]
+        hashes = iter(keccak_hash_many(hashed_nodes))
+
+        references = []
+        for encoded_node in encoded_nodes:
+            if len(encoded_node) < 32:
+                references.append(encoded_node)
+                continue
+            reference = next(hashes)
+            self._storage[reference] = encoded_node
+            if self._journal is not None:
+                self._journal.add(reference)
+            references.append(reference)
+
+        stats = self._stats
+        if stats is not None:
+            stats.encodes += len(encoded_nodes)
+            stats.hashes += len(hashed_nodes)
+            stats.bytes_hashed += sum(map(len, hashed_nodes))
+            stats.storage_writes += len(hashed_nodes)
+        return references
+
     class _DeleteAction(Enum):
         """
         Enum that shows which action was performed on the previous step of the deletion.
@@ -1175,6 +2963,33 @@ class MerklePatriciaTrie:
         # (_DeleteAction, (path_to_new_reference, new_node_reference))
         USELESS_BRANCH = 3
 
+    def _delete_from_root(self, root: bytes, path: NibblePath) -> Union[bytes, None]:
+        """
+        Delete a path starting at the root and return the new root.
+
+        Parameters
+        ----------
+        root: bytes
+            Reference to the root node.
+        path: NibblePath
+            Path to the value that should be removed.
+
+        Returns
+        -------
+        bytes or None
+            Reference to the new root, None if the trie became empty.
+        """
+        action, info = self._delete(root, path)
+
+        if action == MerklePatriciaTrie._DeleteAction.DELETED:
+            # Trie is empty
+            return None
+        elif action == MerklePatriciaTrie._DeleteAction.UPDATED:
+            return info
+        elif action == MerklePatriciaTrie._DeleteAction.USELESS_BRANCH:
+            _, new_root = info
+            return new_root
+
     def _delete(
         self, node_ref: bytes, path: NibblePath
     ) -> Tuple[_DeleteAction, Optional[bytes]]:
@@ -1195,6 +3010,7 @@ class MerklePatriciaTrie:
 
         """
 
+        # Nodes are never changed in place, see `_update`.
         node = self._get_node(node_ref)
 
         if type(node) == Leaf:
@@ -1267,66 +3083,68 @@ class MerklePatriciaTrie:
             action = None
             idx = None
             info = None
+            branches = list(node.branches)
+            value = node.data
 
             assert (
-                len(path) != 0 or len(node.data) != 0
+                len(path) != 0 or len(value) != 0
             ), "Empty path or empty branch node in _delete"
 
             # Decide if we need to remove value of this node or go deeper.
-            if len(path) == 0 and len(node.data) == 0:
+            if len(path) == 0 and len(value) == 0:
                 # This branch node has no value thus we can't delete it.
                 raise BranchPathError("Branch node has no value so cannot be deleted")
-            elif len(path) == 0 and len(node.data) != 0:
-                node.data = b""
+            elif len(path) == 0 and len(value) != 0:
+                value = b""
                 action = MerklePatriciaTrie._DeleteAction.DELETED
             else:
                 # Store idx of the branch we're working with.
                 idx = path.at(0)
 
-                if len(node.branches[idx]) == 0:
+                if _is_empty_reference(branches[idx]):
                     raise BranchPathError(
                         "Empty branch in _delete, could not delete the value."
                     )
 
-                action, info = self._delete(node.branches[idx], path.consume(1))
-                node.branches[idx] = b""
+                action, info = self._delete(branches[idx], path.consume(1))
+                branches[idx] = b""
 
             if action == MerklePatriciaTrie._DeleteAction.DELETED:
                 non_empty_count = sum(
-                    map(lambda x: 1 if len(x) > 0 else 0, node.branches)
+                    map(lambda x: 0 if _is_empty_reference(x) else 1, branches)
                 )
 
-                if non_empty_count == 0 and len(node.data) == 0:
+                if non_empty_count == 0 and len(value) == 0:
                     # Branch node is empty, just delete it.
                     return MerklePatriciaTrie._DeleteAction.DELETED, None
-                elif non_empty_count == 0 and len(node.data) != 0:
+                elif non_empty_count == 0 and len(value) != 0:
                     # No branches, just value.
                     path = NibblePath([])
-                    reference = self._store_node(Leaf(path, node.data))
+                    reference = self._store_node(Leaf(path, value))
 
                     return MerklePatriciaTrie._DeleteAction.USELESS_BRANCH, (
                         path,
                         reference,
                     )
-                elif non_empty_count == 1 and len(node.data) == 0:
+                elif non_empty_count == 1 and len(value) == 0:
                     # No value and one branch
-                    return self._build_new_node_from_last_branch(node.branches)
+                    return self._build_new_node_from_last_branch(branches)
                 else:
                     # Branch has value and 1+ branches or no value and 2+ branches.
                     # It isn't useless, so action is `UPDATED`.
-                    reference = self._store_node(node)
+                    reference = self._store_node(Branch(branches, value))
                     return MerklePatriciaTrie._DeleteAction.UPDATED, reference
             elif action == MerklePatriciaTrie._DeleteAction.UPDATED:
                 # Just update reference.
                 next_ref = info
-                node.branches[idx] = next_ref
-                reference = self._store_node(node)
+                branches[idx] = next_ref
+                reference = self._store_node(Branch(branches, value))
                 return MerklePatriciaTrie._DeleteAction.UPDATED, reference
             elif action == MerklePatriciaTrie._DeleteAction.USELESS_BRANCH:
                 # Just update reference.
                 _, next_ref = info
-                node.branches[idx] = next_ref
-                reference = self._store_node(node)
+                branches[idx] = next_ref
+                reference = self._store_node(Branch(branches, value))
                 return MerklePatriciaTrie._DeleteAction.UPDATED, reference
 
     def _build_new_node_from_last_branch(
@@ -1355,7 +3173,7 @@ class MerklePatriciaTrie:
         # Find the index of the only stored branch.
         idx = 0
         for i in range(len(branches)):
-            if len(branches[i]) > 0:
+            if not _is_empty_reference(branches[i]):
                 idx = i
                 break
 
@@ -1,6 +1,20 @@
+import binascii
+
+# Translation tables between hex digits (as produced by hexlify) and nibble values.
+_HEX_TO_NIBBLE = bytes.maketrans(b"0123456789abcdef", bytes(range(16)))
+_NIBBLE_TO_HEX = bytes.maketrans(bytes(range(16)), b"0123456789abcdef")
+
+
 class NibblePath:
     """
-    Class to represent the nibble path as a linked list.
+    Class to represent the nibble path.
+
+    The path is stored as an immutable `bytes` buffer with one nibble per byte
+    and an offset into that buffer. Comparing and slicing paths is done on the
+    buffer directly instead of nibble by nibble.
+
+    Paths are immutable: `consume` returns a new view that shares the buffer
+    of the original path, so paths of cached nodes can be handed out freely.
 
     Class variables
     ----------------
@@ -21,15 +35,23 @@ class NibblePath:
         Checks if two paths are equal.
     at(idx)
         Returns nibble at the certain position.
+    __hash__()
+        Returns the hash of the path.
     consume(amount)
-        Cuts off nibbles at the beginning of the path.
+        Returns a view of the path without the first nibbles.
+    prefix(length)
+        Returns a path with the first `length` nibbles.
     combine(other)
         Combines two paths.
+    to_bytes()
+        Returns the nibbles of an even length path as raw bytes.
     starts_with(other)
         Checks if `other` is prefix of `self`.
-    common_prefix_with(other)
+    common_prefix(other)
         Returns the common prefix of two paths.
-    
+    common_prefix_length(other)
+        Returns the length of the common prefix of two paths.
+
     Static methods
     --------------
     encode(path)
@@ -40,6 +62,8 @@ class NibblePath:
         Decodes NibblePath without its type from raw bytes.
 
     """
+    __slots__ = ("_nibbles", "_offset")
+
     ODD_FLAG = 0x10
     LEAF_FLAG = 0x20
 
@@ -49,43 +73,71 @@ class NibblePath:
 
         Offset is the number of nibbles that are skipped at the beginning of the path.
         If offset is odd, first nibble is skipped. If offset is even, first two nibbles are skipped.
-        If offset is 0, no nibbles are skipped, if the offset is -1, the last nibble is skipped, etc.
-        
+
         Parameters
         ----------
         data : bytes
-            Raw bytes of the path.
+            Raw bytes of the path (a list of byte values is accepted too).
         offset : int
             Offset of the path.
 
         """
-        self._data = data
+        self._nibbles = binascii.hexlify(bytes(data)).translate(_HEX_TO_NIBBLE)
         self._offset = offset
 
+    @staticmethod
+    def _from_nibbles(nibbles):
+        """
+        Create a NibblePath from a buffer with one nibble per byte.
+
+        Parameters
+        ----------
+        nibbles : bytes
+            Nibble values, one per byte.
+
+        Returns
+        -------
+        NibblePath
+            Path over the given buffer.
+
+        """
+        path = NibblePath.__new__(NibblePath)
+        path._nibbles = nibbles
+        path._offset = 0
+        return path
+
+    def _view(self):
+        """Return the nibbles of the path, one per byte."""
+        if self._offset == 0:
+            return self._nibbles
+        return self._nibbles[self._offset:]
+
     def __len__(self):
         """Return the length of the path."""
-        return len(self._data) * 2 - self._offset
+        return len(self._nibbles) - self._offset
 
     def __repr__(self):
         """
         Return a string representation of the path.
-        
-        Returns the data in hex format and the offset.
+
+        Returns the nibbles in hex format and the offset.
         """
-        return "<NibblePath: Data: 0x{}, Offset: {}>".format(self._data.hex(), self._offset)
+        return "<NibblePath: Data: 0x{}, Offset: {}>".format(
+            self._nibbles.translate(_NIBBLE_TO_HEX).decode(), self._offset
+        )
 
     def __str__(self):
         """
         Return a string representation of the path.
-        
-        Returns the data in hex format and the raw data.
+
+        Returns the nibbles of the path in hex format.
         """
-        return '<Hex 0x{} | Raw {}>'.format(self._data.hex(), self._data)
+        return "<Hex 0x{}>".format(self._view().translate(_NIBBLE_TO_HEX).decode())
 
     def __eq__(self, other):
-        """ 
+        """
         Check if two paths are equal.
-        
+
         Parameters
         ----------
         other : NibblePath
@@ -97,20 +149,23 @@ class NibblePath:
             True if paths are equal, False otherwise.
 
         """
+        if not isinstance(other, NibblePath):
+            return NotImplemented
+
         if len(self) != len(other):
             return False
 
-        for i in range(len(self)):
-            if self.at(i) != other.at(i):
-                return False
+        return self._view() == other._view()
 
-        return True
+    def __hash__(self):
+        """Return the hash of the path, equal paths have equal hashes."""
+        return hash(self._view())
 
     @staticmethod
     def decode_with_type(data):
         """
         Decode the NibblePath and its type from raw bytes.
-        
+
         Parameters
         ----------
         data : bytes
@@ -126,7 +181,7 @@ class NibblePath:
         is_leaf = data[0] & NibblePath.LEAF_FLAG == NibblePath.LEAF_FLAG
 
         if is_odd_len:
-            offset = 1 
+            offset = 1
         else:
             offset = 2
 
@@ -136,144 +191,142 @@ class NibblePath:
     def decode(data):
         """
         Decodes NibblePath without its type from raw bytes.
-        
+
         Parameters
         ----------
         data : bytes
             Raw bytes of the path.
-            
+
         Returns
         -------
         NibblePath
             Decoded path.
-                
+
         """
         return NibblePath.decode_with_type(data)[0]
 
     def starts_with(self, other):
         """
         Checks if `other` is prefix of `self`.
-        
+
         Parameters
         ----------
         other : NibblePath
             Prefix to check.
-            
+
         Returns
         -------
         bool
             True if `other` is prefix of `self`, False otherwise.
         """
-        if len(other) > len(self):
-            return False
-
-        for i in range(len(other)):
-            if self.at(i) != other.at(i):
-                return False
-
-        return True
+        return self._nibbles.startswith(other._view(), self._offset)
 
     def at(self, idx):
         """
         Returns nibble at the certain position.
-        
+
         Parameters
         ----------
         idx : int
             Position of the nibble.
-            
+
         Returns
         -------
         int
             Nibble at the certain position.
-            
-        """
-        idx = idx + self._offset
-
-        byte_idx = idx // 2
-        nibble_idx = idx % 2
-
-        byte = self._data[byte_idx]
-
-        nibble = byte >> 4 if nibble_idx == 0 else byte & 0x0F
 
-        return nibble
+        """
+        return self._nibbles[self._offset + idx]
 
     def consume(self, amount):
         """
-        Cuts off nibbles at the beginning of the path.
-        
+        Returns a view of the path without the first `amount` nibbles.
+
+        The path itself is not changed, the returned path shares its buffer
+        so nothing is copied.
+
         Parameters
         ----------
         amount : int
             Number of nibbles to cut off.
-            
+
         Returns
         -------
         NibblePath
             New path with cut off nibbles.
-        
+
         """
-        self._offset += amount
-        return self
+        if amount == 0:
+            return self
 
-    def _create_new(path, length):
+        path = NibblePath.__new__(NibblePath)
+        path._nibbles = self._nibbles
+        path._offset = self._offset + amount
+        return path
+
+    def prefix(self, length):
         """
-        Creates a new NibblePath from a given object with a certain length.
-        
+        Returns a path with the first `length` nibbles of the path.
+
         Parameters
         ----------
-        path : object
-            Object to create a new NibblePath from.
         length : int
-            Length of the new NibblePath.
-            
+            Number of nibbles to keep.
+
         Returns
         -------
         NibblePath
-            New NibblePath.
-        
+            Path with the first `length` nibbles.
+
         """
-        data = []
+        return NibblePath._from_nibbles(self._nibbles[self._offset:self._offset + length])
 
-        is_odd_len = length % 2 == 1
-        pos = 0
+    def common_prefix_length(self, other):
+        """
+        Returns the length of the common part at the beginning of both paths.
 
-        if is_odd_len:
-            data.append(path.at(pos))
-            pos += 1
+        The first differing nibble is found by XOR-ing both paths as one integer,
+        so there is no loop over the nibbles.
 
-        while pos < length:
-            data.append(path.at(pos) * 16 + path.at(pos + 1))
-            pos += 2
+        Parameters
+        ----------
+        other : NibblePath
+            Other path to compare with.
+
+        Returns
+        -------
+        int
+            Number of equal nibbles at the beginning of both paths.
 
-        offset = 1 if is_odd_len else 0
+        """
+        least_len = min(len(self), len(other))
+        own = self._nibbles[self._offset:self._offset + least_len]
+        others = other._nibbles[other._offset:other._offset + least_len]
+        if own == others:
+            return least_len
 
-        return NibblePath(data, offset)
+        diff = int.from_bytes(own, "big") ^ int.from_bytes(others, "big")
+        return least_len - 1 - (diff.bit_length() - 1) // 8
 
     def common_prefix(self, other):
         """
         Returns common part at the beginning of both paths.
-        
+
         Parameters
         ----------
         other : NibblePath
             Other path to compare with.
-        
+
         Returns
         -------
         NibblePath
             Common part at the beginning of both paths.
-        
-        """
-        least_len = min(len(self), len(other))
-        common_len = 0
-        for i in range(least_len):
-            if self.at(i) != other.at(i):
-                break
-            common_len += 1
 
-        return NibblePath._create_new(self, common_len)
+        """
+        common_len = self.common_prefix_length(other)
+        return NibblePath._from_nibbles(
+            self._nibbles[self._offset:self._offset + common_len]
+        )
 
     def encode(self, is_leaf):
         """
@@ -293,84 +346,47 @@ class NibblePath:
             Encoded path.
 
         """
-        output = []
-
-        nibbles_len = len(self)
-        is_odd = nibbles_len % 2 == 1
-
-        prefix = 0x00
-        prefix += self.ODD_FLAG + self.at(0) if is_odd else 0x00
-        prefix += self.LEAF_FLAG if is_leaf else 0x00
-
-        output.append(prefix)
+        nibbles = self._view()
 
-        pos = nibbles_len % 2
+        prefix = self.LEAF_FLAG if is_leaf else 0x00
+        if len(nibbles) % 2 == 1:
+            prefix += self.ODD_FLAG + nibbles[0]
+            nibbles = nibbles[1:]
 
-        while pos < nibbles_len:
-            byte = self.at(pos) * 16 + self.at(pos + 1)
-            output.append(byte)
-            pos += 2
-
-        return bytes(output)
-
-    class _Chained:
-        """
-        Class that chains two paths.
-        """
-
-        def __init__(self, first, second):
-            """
-            Initializes the chained paths.
-
-            Parameters
-            ----------
-            first : NibblePath
-                First path.
-            second : NibblePath
-                Second path.
-
-            """
-            self.first = first
-            self.second = second
-
-        def __len__(self):
-            """Return the length of the chained paths."""
-            return len(self.first) + len(self.second)
-
-        def at(self, idx):
-            """
-            Return the nibble at the certain position.
-            
-            Parameters
-            ----------
-            idx : int
-                Position of the nibble.
-
-            Returns
-            -------
-            int
-                Nibble at the certain position.
-
-            """
-            if idx < len(self.first):
-                return self.first.at(idx)
-            else:
-                return self.second.at(idx - len(self.first))
+        return bytes((prefix,)) + binascii.unhexlify(nibbles.translate(_NIBBLE_TO_HEX))
 
     def combine(self, other):
         """
         Merges two paths into one.
-        
+
         Parameters
         ----------
         other : NibblePath
             Other path to merge with.
-            
+
         Returns
         -------
         NibblePath
             Merged path.
-        
+
+        """
+        return NibblePath._from_nibbles(self._view() + other._view())
+
+    def to_bytes(self):
+        """
+        Returns the nibbles of the path as raw bytes.
+
+        Returns
+        -------
+        bytes
+            Two nibbles per byte, the first nibble in the high half.
+
+        Raises
+        ------
+        ValueError
+            If the path has an odd length.
+
         """
-        chained = NibblePath._Chained(self, other)
-        return NibblePath._create_new(chained, len(chained))
+        if len(self) % 2 == 1:
+            raise ValueError("Path with odd length can't be converted to bytes")
+        return binascii.unhexlify(self._view().translate(_NIBBLE_TO_HEX))
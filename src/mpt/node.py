@@ -45,6 +45,30 @@ def _prepare_reference_for_encoding(ref):
     return ref
 
 
+def _is_empty_reference(ref):
+    """
+    Check if the reference points to nothing.
+
+    References are either bytes (hash or in-place encoded node) or, while
+    nodes are kept in memory, the node object itself.
+
+    Parameters
+    ----------
+    ref : bytes, bytearray or Node
+        Reference to check.
+
+    Returns
+    -------
+    bool
+        True if the reference is empty, False otherwise.
+
+    """
+    if isinstance(ref, Node):
+        return False
+
+    return ref is None or len(ref) == 0
+
+
 class Node():
     """
     Node class.
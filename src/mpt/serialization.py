@@ -0,0 +1,300 @@
+import rlp
+import struct
+
+# Every stream starts a snapshot with a header record holding this magic.
+STREAM_MAGIC = b"MPTS"
+# Version 1 records only hold the encoded node, version 2 records start with
+# the 32 byte node key so loading doesn't have to hash every node.
+STREAM_VERSION = 2
+_SUPPORTED_VERSIONS = (1, 2)
+_KEY_SIZE = 32
+
+# Length prefix of a record, a zero length record ends a snapshot.
+_LENGTH_SIZE = 4
+
+# Memory-mapped snapshot files start with this magic.
+MAPPED_MAGIC = b"MPTM"
+MAPPED_VERSION = 1
+# Header: magic, version, node count, offset of the fanout table, root length and root.
+MAPPED_HEADER = struct.Struct(">4sIQQB32s")
+# Fanout table: for every first key byte the number of keys up to and including it.
+MAPPED_FANOUT = struct.Struct(">256Q")
+# Index entry: node key, offset and length of the encoded node.
+MAPPED_ENTRY = struct.Struct(">32sQI")
+# Number of index entries packed per write.
+_MAPPED_WRITE_SIZE = 4096
+
+
+def write_record(fileobj, payload):
+    """
+    Write a length-prefixed record to a file object.
+
+    Parameters
+    ----------
+    fileobj : file-like
+        Binary file object opened for writing.
+    payload : bytes
+        Content of the record.
+
+    """
+    fileobj.write(len(payload).to_bytes(_LENGTH_SIZE, "big"))
+    fileobj.write(payload)
+
+
+def read_record(fileobj):
+    """
+    Read a length-prefixed record from a file object.
+
+    Parameters
+    ----------
+    fileobj : file-like
+        Binary file object opened for reading.
+
+    Returns
+    -------
+    bytes or None
+        Content of the record, b'' for the end of a snapshot and None at the
+        end of the stream.
+
+    Raises
+    ------
+    ValueError
+        If the stream ends in the middle of a record.
+
+    """
+    prefix = fileobj.read(_LENGTH_SIZE)
+    if len(prefix) == 0:
+        return None
+    if len(prefix) != _LENGTH_SIZE:
+        raise ValueError("Stream ends in the middle of a record length")
+
+    length = int.from_bytes(prefix, "big")
+    payload = fileobj.read(length)
+    if len(payload) != length:
+        raise ValueError("Stream ends in the middle of a record")
+    return payload
+
+
+def write_snapshot(fileobj, trie_type, root, nodes, incremental=False):
+    """
+    Write a snapshot (header, node records and end record) to a file object.
+
+    The nodes are written one by one, so only one node has to be in memory
+    at a time.
+
+    Parameters
+    ----------
+    fileobj : file-like
+        Binary file object opened for writing.
+    trie_type : str
+        Type of the trie (for example 'FULL MMPT').
+    root : bytes or None
+        Root of the trie as returned by `MerklePatriciaTrie.root`.
+    nodes : iterable of (bytes, bytes)
+        Pairs of node key (hash) and RLP encoded node.
+    incremental : bool
+        True if the snapshot only holds the nodes added since the previous one.
+
+    Returns
+    -------
+    int
+        Number of written nodes.
+
+    """
+    header = rlp.encode(
+        [
+            STREAM_MAGIC,
+            STREAM_VERSION,
+            trie_type.encode(),
+            b"" if root is None else root,
+            1 if incremental else 0,
+        ]
+    )
+    write_record(fileobj, header)
+
+    count = 0
+    for key, encoded_node in nodes:
+        write_record(fileobj, key + encoded_node)
+        count += 1
+
+    write_record(fileobj, b"")
+    return count
+
+
+def read_snapshots(fileobj):
+    """
+    Lazily read the snapshots from a file object.
+
+    For every snapshot a header dict and an iterator over its (key, encoded node)
+    pairs are yielded, version 1 snapshots don't store the keys so their key
+    is None. The node iterator reads from the file object, so it has to be
+    consumed before the next snapshot is requested.
+
+    Parameters
+    ----------
+    fileobj : file-like
+        Binary file object opened for reading.
+
+    Yields
+    ------
+    tuple
+        Header dict (type, root, incremental) and an iterator over the
+        (key, encoded node) pairs.
+
+    Raises
+    ------
+    ValueError
+        If the stream is not a snapshot stream or is cut off.
+
+    """
+    while True:
+        header = read_record(fileobj)
+        if header is None:
+            return
+
+        try:
+            magic, version, trie_type, root, incremental = rlp.decode(header)
+        except (rlp.DecodingError, ValueError):
+            raise ValueError("Invalid snapshot header")
+        if magic != STREAM_MAGIC:
+            raise ValueError("Stream is not a trie snapshot")
+        version = int.from_bytes(version, "big")
+        if version not in _SUPPORTED_VERSIONS:
+            raise ValueError("Unsupported snapshot version {}".format(version))
+
+        nodes = _read_nodes(fileobj, keyed=version >= 2)
+        yield {
+            "type": trie_type.decode(),
+            "root": root if len(root) > 0 else None,
+            "incremental": incremental == b"\x01",
+        }, nodes
+
+        # Skip the nodes the caller didn't read.
+        for _ in nodes:
+            pass
+
+
+def _read_nodes(fileobj, keyed):
+    """Yield the (key, node) pairs of a snapshot up to its end record."""
+    while True:
+        payload = read_record(fileobj)
+        if payload is None:
+            raise ValueError("Stream ends in the middle of a snapshot")
+        if len(payload) == 0:
+            return
+        if keyed:
+            yield payload[:_KEY_SIZE], payload[_KEY_SIZE:]
+        else:
+            yield None, payload
+
+
+def write_mapped_snapshot(path, root, nodes):
+    """
+    Write a snapshot file that can be read through a memory map.
+
+    The file holds a header, the encoded nodes one after another, a fanout
+    table and an index of (key, offset, length) entries sorted by key. A
+    lookup reads the fanout table to narrow the range and binary searches
+    the index, so opening the file doesn't read the nodes (see `MappedStorage`).
+    The nodes are written as they come, only the index entries are kept in
+    memory to sort them.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file, an existing file is replaced.
+    root : bytes or None
+        Root of the trie as returned by `MerklePatriciaTrie.root`.
+    nodes : iterable of (bytes, bytes)
+        Pairs of 32 byte node key (hash) and RLP encoded node.
+
+    Returns
+    -------
+    int
+        Number of written nodes.
+
+    Raises
+    ------
+    ValueError
+        If a node key is not 32 bytes long.
+
+    """
+    root = b"" if root is None else root
+    with open(path, "wb") as fileobj:
+        # The header is written last, when the offset of the index is known.
+        fileobj.write(bytes(MAPPED_HEADER.size))
+
+        entries = []
+        offset = MAPPED_HEADER.size
+        for key, encoded_node in nodes:
+            if len(key) != _KEY_SIZE:
+                raise ValueError("Node keys must be {} bytes".format(_KEY_SIZE))
+            fileobj.write(encoded_node)
+            entries.append((key, offset, len(encoded_node)))
+            offset += len(encoded_node)
+        entries.sort()
+
+        fanout = [0] * 256
+        for key, _, _ in entries:
+            fanout[key[0]] += 1
+        for byte in range(1, 256):
+            fanout[byte] += fanout[byte - 1]
+        fileobj.write(MAPPED_FANOUT.pack(*fanout))
+
+        for start in range(0, len(entries), _MAPPED_WRITE_SIZE):
+            fileobj.write(
+                b"".join(
+                    MAPPED_ENTRY.pack(*entry)
+                    for entry in entries[start : start + _MAPPED_WRITE_SIZE]
+                )
+            )
+
+        fileobj.seek(0)
+        fileobj.write(
+            MAPPED_HEADER.pack(
+                MAPPED_MAGIC, MAPPED_VERSION, len(entries), offset, len(root), root
+            )
+        )
+
+    return len(entries)
+
+
+def read_mapped_header(buffer):
+    """
+    Read and check the header of a memory-mapped snapshot file.
+
+    Parameters
+    ----------
+    buffer : bytes-like
+        Content of the file, for example an `mmap`.
+
+    Returns
+    -------
+    dict
+        Dictionary with the root, the number of nodes (count) and the
+        offset of the fanout table (index_offset).
+
+    Raises
+    ------
+    ValueError
+        If the buffer is not a snapshot file or is cut off.
+
+    """
+    if len(buffer) < MAPPED_HEADER.size:
+        raise ValueError("File is too short for a snapshot header")
+
+    magic, version, count, index_offset, root_length, root = MAPPED_HEADER.unpack_from(
+        buffer
+    )
+    if magic != MAPPED_MAGIC:
+        raise ValueError("File is not a memory-mapped trie snapshot")
+    if version != MAPPED_VERSION:
+        raise ValueError("Unsupported snapshot version {}".format(version))
+    if len(buffer) < index_offset + MAPPED_FANOUT.size + count * MAPPED_ENTRY.size:
+        raise ValueError("Snapshot file is cut off")
+
+    return {
+        "root": root[:root_length] if root_length > 0 else None,
+        "count": count,
+        "index_offset": index_offset,
+    }
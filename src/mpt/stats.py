@@ -0,0 +1,105 @@
+class TrieStats:
+    """
+    Counters of the work done by a trie.
+
+    The trie only collects the counters when it is created with
+    `collect_stats`, see `MerklePatriciaTrie.stats`.
+
+    Attributes
+    ----------
+    operations : int
+        Number of traced operations (get, update, delete, proofs, ...).
+    storage_reads : int
+        Number of nodes read from the storage.
+    storage_writes : int
+        Number of nodes written to the storage.
+    decodes : int
+        Number of decoded nodes.
+    encodes : int
+        Number of nodes encoded to be stored.
+    hashes : int
+        Number of keccak256 hashes of nodes and keys.
+    bytes_hashed : int
+        Number of bytes passed to keccak256.
+    node_visits : int
+        Number of nodes the trie looked up (in the cache, the storage or memory).
+    cache_hits : int
+        Number of nodes found in the decoded node cache.
+    cache_misses : int
+        Number of nodes not found in the decoded node cache.
+    traversals : int
+        Number of operations that follow the path of one key.
+    total_depth : int
+        Number of nodes visited by these operations.
+    max_depth : int
+        Most nodes visited by one of these operations.
+
+    Methods
+    -------
+    reset()
+        Set all counters to zero.
+    record_traversal(depth)
+        Count an operation that visited `depth` nodes on the path of one key.
+    as_dict()
+        Return the counters and the mean depth as a dict.
+
+    """
+
+    FIELDS = (
+        "operations",
+        "storage_reads",
+        "storage_writes",
+        "decodes",
+        "encodes",
+        "hashes",
+        "bytes_hashed",
+        "node_visits",
+        "cache_hits",
+        "cache_misses",
+        "traversals",
+        "total_depth",
+        "max_depth",
+    )
+
+    __slots__ = FIELDS
+
+    def __init__(self):
+        """Initialize all counters to zero."""
+        self.reset()
+
+    def reset(self):
+        """Set all counters to zero."""
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    def record_traversal(self, depth):
+        """
+        Count an operation that visited `depth` nodes on the path of one key.
+
+        Parameters
+        ----------
+        depth : int
+            Number of nodes the operation visited.
+
+        """
+        self.traversals += 1
+        self.total_depth += depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def as_dict(self):
+        """
+        Return the counters and the mean depth as a dict.
+
+        Returns
+        -------
+        dict
+            The counters by name and `mean_depth`, the mean number of nodes
+            visited by the operations that follow the path of one key.
+
+        """
+        counters = {field: getattr(self, field) for field in self.FIELDS}
+        counters["mean_depth"] = (
+            self.total_depth / self.traversals if self.traversals else 0.0
+        )
+        return counters
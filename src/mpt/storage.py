@@ -0,0 +1,451 @@
+from .cache import LRUCache
+from .serialization import (
+    MAPPED_ENTRY,
+    MAPPED_FANOUT,
+    read_mapped_header,
+)
+from collections.abc import Mapping, MutableMapping
+from contextlib import contextmanager
+import asyncio
+import mmap
+import sqlite3
+import threading
+
+# Rows fetched at a time by the iterators of `SQLiteStorage`.
+_FETCH_SIZE = 1024
+# Marks a key that has no buffered write in `SQLiteStorage`.
+_NOT_PENDING = object()
+
+
+class SQLiteStorage(MutableMapping):
+    """
+    Dict-like node storage that keeps the nodes in an SQLite database.
+
+    The storage can be passed to `MerklePatriciaTrie` as `storage`. Nodes are
+    only read from disk when the trie visits them, so a trie can be reopened
+    from a stored root without loading every node into memory.
+
+    Writes done inside `batch()` are buffered and written in one transaction
+    when the batch ends. Writes outside a batch are committed right away.
+
+    The storage can be read from several threads while one thread writes
+    (see `MerklePatriciaTrie.snapshot`), the connection is shared and its
+    use is serialized with a lock.
+
+    Attributes
+    ----------
+    path : str
+        Path of the database file (':memory:' for an in-memory database).
+
+    Methods
+    -------
+    batch()
+        Context manager that writes all changes in one transaction.
+    save_root(root)
+        Store the root of the trie in the database.
+    load_root()
+        Return the stored root of the trie.
+    cache_info()
+        Return the counters of the read cache.
+    close()
+        Flush pending writes and close the database.
+
+    """
+
+    def __init__(self, path, cache_size=4096):
+        """
+        Open (or create) the database.
+
+        Parameters
+        ----------
+        path : str
+            Path of the database file (':memory:' for an in-memory database).
+        cache_size : int
+            Maximum number of encoded nodes kept in the read cache, 0 disables it.
+
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS nodes "
+            "(key BLOB PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value BLOB)"
+        )
+        self._connection.commit()
+
+        self._cache = LRUCache(cache_size)
+        # Writes of the running batch, a value of None marks a delete.
+        self._pending = {}
+        self._batch_depth = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getitem__(self, key):
+        """Return the encoded node stored under the key."""
+        value = self._pending.get(key, _NOT_PENDING)
+        if value is not _NOT_PENDING:
+            if value is None:
+                raise KeyError(key)
+            return value
+
+        value = self._cache.get(key)
+        if value is not None:
+            return value
+
+        row = self._fetchone("SELECT value FROM nodes WHERE key = ?", (key,))
+        if row is None:
+            raise KeyError(key)
+
+        self._cache.put(key, row[0])
+        return row[0]
+
+    def __setitem__(self, key, value):
+        """Store the encoded node under the key."""
+        self._cache.put(key, value)
+        if self._batch_depth > 0:
+            self._pending[key] = value
+            return
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO nodes (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def __delitem__(self, key):
+        """Remove the node stored under the key."""
+        if key not in self:
+            raise KeyError(key)
+
+        self._cache.invalidate(key)
+        if self._batch_depth > 0:
+            self._pending[key] = None
+            return
+
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM nodes WHERE key = ?", (key,))
+
+    def __contains__(self, key):
+        """Check if a node is stored under the key."""
+        value = self._pending.get(key, _NOT_PENDING)
+        if value is not _NOT_PENDING:
+            return value is not None
+        if key in self._cache:
+            return True
+
+        return self._fetchone("SELECT 1 FROM nodes WHERE key = ?", (key,)) is not None
+
+    def __iter__(self):
+        """Iterate over the stored keys, pending writes are flushed first."""
+        self._flush()
+        for row in self._rows("SELECT key FROM nodes"):
+            yield row[0]
+
+    def __len__(self):
+        """Return the number of stored nodes, pending writes are flushed first."""
+        self._flush()
+        return self._fetchone("SELECT COUNT(*) FROM nodes")[0]
+
+    def values(self):
+        """Iterate over the stored nodes without a lookup per key."""
+        self._flush()
+        for row in self._rows("SELECT value FROM nodes"):
+            yield row[0]
+
+    def items(self):
+        """Iterate over the stored (key, node) pairs without a lookup per key."""
+        self._flush()
+        for row in self._rows("SELECT key, value FROM nodes"):
+            yield row[0], row[1]
+
+    def update(self, other=(), **kwargs):
+        """Store many nodes in one transaction."""
+        with self.batch():
+            super().update(other, **kwargs)
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager that writes all changes in one transaction.
+
+        Batches can be nested, the changes are written when the outermost
+        batch ends. If the batch raises, the buffered changes are discarded.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._pending = {}
+                self._cache.clear()
+            raise
+
+        self._batch_depth -= 1
+        if self._batch_depth == 0:
+            self._flush()
+
+    def save_root(self, root):
+        """
+        Store the root of the trie in the database.
+
+        Parameters
+        ----------
+        root : bytes or None
+            Root of the trie as returned by `MerklePatriciaTrie.root`.
+
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('root', ?)", (root,)
+            )
+
+    def load_root(self):
+        """
+        Return the stored root of the trie.
+
+        Returns
+        -------
+        bytes or None
+            The stored root, None if no root was stored or the trie was empty.
+
+        """
+        row = self._fetchone("SELECT value FROM meta WHERE name = 'root'")
+        return None if row is None else row[0]
+
+    def cache_info(self):
+        """
+        Return the counters of the read cache.
+
+        Returns
+        -------
+        dict
+            Dictionary with hits, misses, size and max_size.
+
+        """
+        return self._cache.info()
+
+    def close(self):
+        """Flush pending writes and close the database."""
+        self._flush()
+        with self._lock:
+            self._connection.close()
+
+    def _flush(self):
+        """Write the buffered changes in one transaction."""
+        if not self._pending:
+            return
+
+        writes = [(key, value) for key, value in self._pending.items() if value is not None]
+        deletes = [(key,) for key, value in self._pending.items() if value is None]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO nodes (key, value) VALUES (?, ?)", writes
+            )
+            self._connection.executemany("DELETE FROM nodes WHERE key = ?", deletes)
+        # Readers find the nodes in the database before they leave the buffer.
+        self._pending = {}
+
+    def _fetchone(self, query, parameters=()):
+        """Run a query and return its first row, None if there is none."""
+        with self._lock:
+            return self._connection.execute(query, parameters).fetchone()
+
+    def _rows(self, query):
+        """Run a query and yield its rows, fetched in chunks under the lock."""
+        with self._lock:
+            cursor = self._connection.execute(query)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(_FETCH_SIZE)
+            if not rows:
+                return
+            yield from rows
+
+
+class MappedStorage(Mapping):
+    """
+    Read-only node storage on a memory-mapped snapshot file.
+
+    The file is written by `MerklePatriciaTrie.to_mapped` (or
+    `write_mapped_snapshot`). Opening it only reads the header and the
+    fanout table, a lookup binary searches the sorted index in the mapped
+    file and copies the one node out of it. Processes that map the same
+    file share its pages in the page cache.
+
+    The storage can't be changed, wrap it in `collections.ChainMap({}, storage)`
+    to keep the nodes of updates in memory.
+
+    Attributes
+    ----------
+    path : str
+        Path of the snapshot file.
+    root : bytes or None
+        Root of the trie stored in the file.
+
+    Methods
+    -------
+    close()
+        Close the memory map.
+
+    """
+
+    def __init__(self, path):
+        """
+        Open and map the snapshot file.
+
+        Parameters
+        ----------
+        path : str
+            Path of the snapshot file.
+
+        Raises
+        ------
+        ValueError
+            If the file is not a snapshot file or is cut off.
+
+        """
+        self.path = path
+        with open(path, "rb") as fileobj:
+            self._map = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            header = read_mapped_header(self._map)
+        except ValueError:
+            self._map.close()
+            raise
+
+        self.root = header["root"]
+        self._count = header["count"]
+        # The range of a first key byte is fanout[byte] up to fanout[byte + 1].
+        self._fanout = (0,) + MAPPED_FANOUT.unpack_from(self._map, header["index_offset"])
+        self._index = header["index_offset"] + MAPPED_FANOUT.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getitem__(self, key):
+        """Return the encoded node stored under the key."""
+        # Only nodes of 32 bytes and more are stored, under their keccak hash.
+        if len(key) != 32:
+            raise KeyError(key)
+
+        buffer = self._map
+        low = self._fanout[key[0]]
+        high = self._fanout[key[0] + 1]
+        while low < high:
+            middle = (low + high) // 2
+            position = self._index + middle * MAPPED_ENTRY.size
+            probe = buffer[position : position + 32]
+            if probe < key:
+                low = middle + 1
+            elif probe > key:
+                high = middle
+            else:
+                _, offset, length = MAPPED_ENTRY.unpack_from(buffer, position)
+                return buffer[offset : offset + length]
+
+        raise KeyError(key)
+
+    def __iter__(self):
+        """Iterate over the keys in sorted order."""
+        for number in range(self._count):
+            position = self._index + number * MAPPED_ENTRY.size
+            yield self._map[position : position + 32]
+
+    def __len__(self):
+        """Return the number of nodes."""
+        return self._count
+
+    def close(self):
+        """Close the memory map."""
+        self._map.close()
+
+
+class AsyncDictStorage:
+    """
+    In-process node storage with the async storage interface.
+
+    `AsyncMerklePatriciaTrie` reads and writes its nodes through two
+    coroutines, `get_many` and `set_many`, so a networked key/value store can
+    serve a whole batch of nodes per round trip. This storage keeps the nodes
+    in a dict and can add a delay to every request to stand in for such a store
+    in tests.
+
+    Attributes
+    ----------
+    data : dict
+        The stored nodes by key.
+    latency : float
+        Seconds every request waits before it is served.
+    requests : int
+        Number of served requests.
+
+    Methods
+    -------
+    get_many(keys)
+        Return the nodes stored under the keys.
+    set_many(items)
+        Store the nodes under their keys.
+
+    """
+
+    def __init__(self, data=None, latency=0.0):
+        """
+        Initialize the storage.
+
+        Parameters
+        ----------
+        data : dict
+            Nodes to start with, a new dict if not provided.
+        latency : float
+            Seconds every request waits before it is served.
+
+        """
+        self.data = {} if data is None else data
+        self.latency = latency
+        self.requests = 0
+
+    async def get_many(self, keys):
+        """
+        Return the nodes stored under the keys.
+
+        Parameters
+        ----------
+        keys : list of bytes
+            Keys of the nodes.
+
+        Returns
+        -------
+        list
+            The encoded nodes in the order of the keys, None for missing keys.
+
+        """
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self.data.get(key) for key in keys]
+
+    async def set_many(self, items):
+        """
+        Store the nodes under their keys.
+
+        Parameters
+        ----------
+        items : iterable of (bytes, bytes)
+            Pairs of key and encoded node.
+
+        """
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.data.update(items)
@@ -0,0 +1,439 @@
+from concurrent.futures import ProcessPoolExecutor
+from .hash import keccak_hash, keccak_hash_many
+from .nibble_path import NibblePath
+from .node import Node, Leaf, Extension, Branch, _is_empty_reference
+from .exceptions import (
+    ExtensionPathError,
+    LeafPathError,
+    BranchPathError,
+    PoeError,
+    InvalidNodeError,
+)
+from typing import Callable, List, Optional, Tuple
+import rlp
+
+# Errors raised for malformed proofs, `verify_proofs` reports these proofs as invalid.
+_INVALID_PROOF_ERRORS = (
+    ExtensionPathError,
+    LeafPathError,
+    BranchPathError,
+    PoeError,
+    InvalidNodeError,
+    rlp.DecodingError,
+    AssertionError,
+    IndexError,
+    TypeError,
+)
+
+
+class _ProofNodes:
+    """
+    References and decoded nodes of the encoded nodes of proofs.
+
+    Nodes are content addressed, so a node that is in many proofs (like the
+    root) is hashed and decoded once for all of them. The nodes are kept in
+    plain dicts that live for one call, there is no size limit and no lock.
+    Decoded nodes are shared and must not be modified.
+    """
+
+    def __init__(self):
+        # References by encoded node and encoded nodes by reference.
+        self._references = {}
+        self._encoded = {}
+        # Decoded nodes by reference.
+        self._decoded = {}
+
+    def add(self, encoded_nodes):
+        """Compute the references of the encoded nodes that are not known yet."""
+        new_nodes = [node for node in encoded_nodes if node not in self._references]
+        hashed_nodes = [node for node in new_nodes if len(node) >= 32]
+        for encoded_node, reference in zip(hashed_nodes, keccak_hash_many(hashed_nodes)):
+            self._references[encoded_node] = reference
+            self._encoded[reference] = encoded_node
+        for encoded_node in new_nodes:
+            if len(encoded_node) < 32:
+                self._references[encoded_node] = encoded_node
+                self._encoded[encoded_node] = encoded_node
+
+    def is_root(self, root_hash, encoded_node):
+        """Check if the encoded node hashes to the root hash."""
+        if len(encoded_node) < 32:
+            # Small roots are referenced in place, but the root hash is still a hash.
+            return keccak_hash(encoded_node) == root_hash
+        if self._encoded.get(root_hash) == encoded_node:
+            return True
+        self.add([encoded_node])
+        return self._references[encoded_node] == root_hash
+
+    def find(self, node_ref, proof):
+        """Return the decoded node with the reference if it is in the proof, None otherwise."""
+        encoded_node = self._encoded.get(node_ref)
+        if encoded_node is None or encoded_node not in proof:
+            self.add(proof)
+            encoded_node = self._encoded.get(node_ref)
+            if encoded_node is None or encoded_node not in proof:
+                return None
+        return self.decode(node_ref, encoded_node)
+
+    def decode(self, node_ref, encoded_node):
+        """Return the decoded node with the reference."""
+        node = self._decoded.get(node_ref)
+        if node is None:
+            node = Node.decode(encoded_node)
+            self._decoded[node_ref] = node
+        return node
+
+
+def verify_inclusion(
+    root_hash: bytes, encoded_key: bytes, proof: List[bytes], secure: bool = True
+) -> bool:
+    """
+    Verify a proof of inclusion for a key against a root hash.
+
+    Only the root hash and the proof are needed, no trie or storage.
+
+    .. attention::
+        This function does not RLP-encode the key.
+        If you use encoded keys, you should encode it yourself.
+
+    Parameters
+    ----------
+    root_hash: bytes
+        Hash of the root of the trie the proof was created for.
+    encoded_key: bytes
+        Key or RLP-encoded key.
+    proof: list of bytes
+        Proof of inclusion for the key.
+    secure: bool
+        (Optional) True if the keys of the trie are hashed (secure mode).
+
+    Returns
+    -------
+    bool
+        True if the proof is valid, False otherwise.
+    """
+    return _verify_inclusion(root_hash, encoded_key, proof, secure, _ProofNodes())
+
+
+def verify_exclusion(
+    root_hash: bytes, encoded_key: bytes, proof: List[bytes], secure: bool = True
+) -> bool:
+    """
+    Verify a proof of exclusion for a key against a root hash.
+
+    Only the root hash and the proof are needed, no trie or storage.
+
+    .. attention::
+        This function does not RLP-encode the key.
+        If you use encoded keys, you should encode it yourself.
+
+    Parameters
+    ----------
+    root_hash: bytes
+        Hash of the root of the trie the proof was created for.
+    encoded_key: bytes
+        Key or RLP-encoded key.
+    proof: list of bytes
+        Proof of exclusion for the key.
+    secure: bool
+        (Optional) True if the keys of the trie are hashed (secure mode).
+
+    Returns
+    -------
+    bool
+        True if the proof is valid, False otherwise.
+    """
+    return _verify_exclusion(root_hash, encoded_key, proof, secure, _ProofNodes())
+
+
+def verify_proofs(
+    proofs, root_hash: bytes, secure: bool = True, workers: Optional[int] = None
+) -> List[bool]:
+    """
+    Verify many proofs of inclusion and exclusion against one root hash.
+
+    Nodes shared by the proofs are hashed and decoded once for the whole
+    batch and secure keys are hashed together. With several workers the
+    proofs are split into chunks that are verified in worker processes.
+
+    Parameters
+    ----------
+    proofs: iterable of Proof
+        Proofs of inclusion ('POI') and exclusion ('POE').
+    root_hash: bytes
+        Hash of the root of the trie the proofs were created for.
+    secure: bool
+        (Optional) True if the keys of the trie are hashed (secure mode).
+    workers: int
+        (Optional) Number of worker processes, the proofs are verified in
+        this process if not provided.
+
+    Returns
+    -------
+    list of bool
+        For every proof True if it is valid, False otherwise.
+
+    Raises
+    ------
+    ValueError
+        If a proof has an unknown type.
+    """
+    batch = []
+    for proof in proofs:
+        if proof.type not in ("POI", "POE"):
+            raise ValueError("Unknown proof type {}".format(proof.type))
+        batch.append((proof.type == "POI", proof.target, proof.proof))
+
+    if workers is None or workers < 2 or len(batch) < 2:
+        return _verify_batch(batch, root_hash, secure)
+
+    chunk_size = -(-len(batch) // workers)
+    chunks = [batch[i:i + chunk_size] for i in range(0, len(batch), chunk_size)]
+    results = []
+    with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+        for chunk_results in executor.map(
+            _verify_batch, chunks, [root_hash] * len(chunks), [secure] * len(chunks)
+        ):
+            results.extend(chunk_results)
+    return results
+
+
+def _verify_batch(batch: List[tuple], root_hash: bytes, secure: bool) -> List[bool]:
+    """Verify (inclusion, key, proof) tuples with shared proof nodes, used by `verify_proofs`."""
+    nodes = _ProofNodes()
+    encoded_keys = [encoded_key for _, encoded_key, _ in batch]
+    if secure:
+        encoded_keys = keccak_hash_many(encoded_keys)
+
+    results = []
+    for (inclusion, _, proof), encoded_key in zip(batch, encoded_keys):
+        verify = _verify_inclusion if inclusion else _verify_exclusion
+        try:
+            results.append(verify(root_hash, encoded_key, proof, False, nodes))
+        except _INVALID_PROOF_ERRORS:
+            results.append(False)
+    return results
+
+
+def _verify_inclusion(root_hash, encoded_key, proof, secure, nodes):
+    """Verify a proof of inclusion with the given proof nodes."""
+    if len(proof) == 0 or not nodes.is_root(root_hash, proof[0]):
+        return False
+
+    if secure:
+        encoded_key = keccak_hash(encoded_key)
+
+    def find(node_ref):
+        # Small nodes are referenced in place and don't have to be in the proof.
+        if len(node_ref) < 32:
+            return nodes.decode(node_ref, node_ref)
+        return nodes.find(node_ref, proof)
+
+    return _verify_proof_of_inclusion(
+        _root_reference(root_hash, proof), NibblePath(encoded_key), find
+    )
+
+
+def _verify_exclusion(root_hash, encoded_key, proof, secure, nodes):
+    """Verify a proof of exclusion with the given proof nodes."""
+    if len(proof) < 2 or not nodes.is_root(root_hash, proof[0]):
+        return False
+
+    if Node.decode(proof[-1]).data != b"null":
+        return False
+
+    if secure:
+        encoded_key = keccak_hash(encoded_key)
+
+    # Every node of the path must be in the proof, the null leaf excluded.
+    path_nodes = proof[:-1]
+    used = set()
+    node, path = _verify_proof_of_exclusion(
+        _root_reference(root_hash, proof),
+        NibblePath(encoded_key),
+        lambda node_ref: nodes.find(node_ref, path_nodes),
+        used,
+    )
+
+    # A node on the path is missing from the proof
+    if node is None:
+        return False
+
+    # Check if the result node is valid
+    # If the path ends at a branch the branch must not have a value
+    if isinstance(node, Branch):
+        if len(path) == 0 and node.data:
+            return False
+
+    # If the node is a leaf with the rest of the path the key is in the trie
+    if isinstance(node, Leaf):
+        if node.path == path:
+            return False
+
+    # There should be no nodes left in the proof
+    if len(used) != len(set(path_nodes)):
+        return False
+
+    # Proof passed
+    return True
+
+
+def _root_reference(root_hash: bytes, proof: List[bytes]) -> bytes:
+    """Return the reference to the root node, small roots are referenced in place."""
+    if len(proof[0]) < 32:
+        return proof[0]
+    return root_hash
+
+
+def _verify_proof_of_inclusion(
+    node_ref: bytes, path: NibblePath, find: Callable[[bytes], Optional[Node]]
+) -> bool:
+    """
+    Verify proof of inclusion support method.
+
+    Used to verify a proof of inclusion for a node ref.
+
+    Parameters
+    ----------
+    node_ref: bytes
+        Reference to a node.
+    path: NibblePath
+        Path to a value.
+    find: callable
+        Function that returns the decoded node of the proof with a
+        reference, None if the node is not in the proof.
+
+    Returns
+    -------
+    bool
+        True if the proof is valid, False otherwise (also if the path leaves
+        the nodes of the proof).
+
+    Raises
+    ------
+    InvalidNodeError
+        Raised if there is a node of unknown type in the proof.
+    """
+    # Get the right node from the proof
+    node = find(node_ref)
+    if node is None:
+        return False
+
+    # If path is empty, our travel is over, the key is only in the trie
+    # if the node holds a value for it.
+    if len(path) == 0:
+        if isinstance(node, Leaf):
+            # The leaf holds the value of a longer key
+            return len(node.path) == 0
+        if isinstance(node, Branch):
+            # Check if the branch has data, an empty value is decoded as b""
+            return bool(node.data)
+        return False
+
+    if type(node) is Leaf:
+        # If we've found a leaf, it's either the leaf we're
+        # looking for or wrong leaf.
+        if node.path == path:
+            return True
+        else:
+            return False
+
+    elif type(node) is Extension:
+        # If we've found an extension, we need to go deeper.
+        if path.starts_with(node.path):
+            rest_path = path.consume(len(node.path))
+            return _verify_proof_of_inclusion(node.next_ref, rest_path, find)
+        else:
+            # The key leaves the path of the extension
+            return False
+
+    elif type(node) is Branch:
+        # If we've found a branch node, go to the appropriate branch.
+        branch = node.branches[path.at(0)]
+        if not _is_empty_reference(branch):
+            return _verify_proof_of_inclusion(branch, path.consume(1), find)
+        else:
+            # There is no subtree for the key
+            return False
+
+    raise InvalidNodeError("Unknown node type {}".format(node))
+
+
+def _verify_proof_of_exclusion(
+    node_ref: bytes,
+    path: NibblePath,
+    find: Callable[[bytes], Optional[Node]],
+    used: set,
+) -> Tuple[Optional[Node], NibblePath]:
+    """
+    Verify proof of exclusion support method.
+
+    Used to verify a proof of exclusion for a node ref.
+
+    Parameters
+    ----------
+    node_ref: bytes
+        Reference to a node.
+    path: NibblePath
+        Path to a value.
+    find: callable
+        Function that returns the decoded node of the proof with a
+        reference, None if the node is not in the proof.
+    used: set
+        References of the nodes used up until now (empty in the beginning).
+
+    Returns
+    -------
+    node: Node or None
+        The furthest node on the path, None if a node on the path is
+        missing from the proof.
+    path: NibblePath
+        The rest of the path at that node.
+
+    Raises
+    ------
+    PoeError
+        PoeError when there is something wrong with the proof.
+    InvalidNodeError
+        InvalidNodeError when there is an invalid node in the proof.
+    """
+    # Get the right node from the proof, a proof that stops before the end
+    # of the path proves nothing.
+    node = find(node_ref)
+    if node is None:
+        return None, path
+
+    # Every node of the proof is used once
+    if node_ref in used:
+        raise PoeError("The node {} is used twice on the path".format(node_ref))
+    used.add(node_ref)
+
+    # If path is empty, our travel is over. Main `get` method
+    # will check if this node has a value.
+    if len(path) == 0:
+        return node, path
+
+    if type(node) is Leaf:
+        # If we've found a leaf, it's either the leaf we're
+        # looking for or wrong leaf.(we hope its the wrong leaf but
+        # that is up to the main method).
+        return node, path
+
+    elif type(node) is Extension:
+        # If we've found an extension, we need to go deeper.
+        if path.starts_with(node.path):
+            rest_path = path.consume(len(node.path))
+            return _verify_proof_of_exclusion(node.next_ref, rest_path, find, used)
+        else:
+            return node, path
+
+    elif type(node) is Branch:
+        # If we've found a branch node, go to the appropriate branch.
+        branch = node.branches[path.at(0)]
+        if not _is_empty_reference(branch):
+            return _verify_proof_of_exclusion(branch, path.consume(1), find, used)
+        else:
+            # This is the furthest node we can go.
+            return node, path
+
+    raise InvalidNodeError("Invalid node type {}".format(type(node)))
@@ -1,6 +1,12 @@
 import unittest
+from test_async_mpt import *
+from test_benchmarks import *
+from test_cache import *
+from test_hash import *
 from test_mmpt import *
 from test_mpt import *
+from test_storage import *
+from test_verify import *
 from test_vectors import *
 from tests_node_nibble import *
 
@@ -0,0 +1,153 @@
+import sys, os
+try:
+    from mpt.async_mpt import AsyncMerklePatriciaTrie
+    from mpt.mpt import MerklePatriciaTrie
+    from mpt.storage import AsyncDictStorage
+    from mpt.verify import verify_inclusion, verify_exclusion
+    from mpt.exceptions import KeyNotFoundError
+except (ImportError, ModuleNotFoundError):
+    #Following lines are for assigning parent directory dynamically.
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    parent_dir_path = os.path.abspath(os.path.join(dir_path, os.pardir))
+    sys.path.insert(0, parent_dir_path)
+    from src.mpt.async_mpt import AsyncMerklePatriciaTrie
+    from src.mpt.mpt import MerklePatriciaTrie
+    from src.mpt.storage import AsyncDictStorage
+    from src.mpt.verify import verify_inclusion, verify_exclusion
+    from src.mpt.exceptions import KeyNotFoundError
+import asyncio
+import unittest
+
+
+def _pairs(count):
+    return [(str(i).encode(), "value {}".format(i).encode()) for i in range(count)]
+
+
+class TestAsyncMPT(unittest.IsolatedAsyncioTestCase):
+    """Test the async trie against the sync trie."""
+
+    async def _stored_trie(self, pairs, secure=False, **kwargs):
+        """Return a trie over a storage with committed pairs, with a cold cache."""
+        storage = AsyncDictStorage()
+        trie = AsyncMerklePatriciaTrie(storage, secure=secure)
+        await trie.update_batch(pairs)
+        await trie.commit()
+        return AsyncMerklePatriciaTrie(storage, trie.root(), secure=secure, **kwargs)
+
+    async def test_same_root_as_sync_trie(self):
+        """Test if updates and deletes give the root of the sync trie."""
+        for secure in (False, True):
+            trie = AsyncMerklePatriciaTrie(AsyncDictStorage(), secure=secure)
+            sync_trie = MerklePatriciaTrie({}, secure=secure)
+            for key, value in _pairs(100):
+                await trie.update(key, value)
+                sync_trie.update(key, value)
+            for key, _ in _pairs(30):
+                await trie.delete(key)
+                sync_trie.delete(key)
+
+            self.assertEqual(trie.root_hash(), sync_trie.root_hash())
+            self.assertEqual(await trie.get(b"50"), b"value 50")
+            self.assertFalse(await trie.contains(b"10"))
+
+    async def test_commit_and_reopen(self):
+        """Test if committed nodes are read back from the storage."""
+        storage = AsyncDictStorage()
+        trie = AsyncMerklePatriciaTrie(storage)
+        await trie.update(b"dog", b"puppy" * 10)
+        self.assertEqual(storage.data, {})
+
+        await trie.commit()
+        self.assertGreater(len(storage.data), 0)
+        self.assertEqual(trie._overlay.pending, {})
+
+        reopened = AsyncMerklePatriciaTrie(storage, trie.root())
+        self.assertEqual(await reopened.get(b"dog"), b"puppy" * 10)
+
+    async def test_get_many_batches_requests(self):
+        """Test if the nodes of many keys are fetched with one request per level."""
+        trie = await self._stored_trie(_pairs(500), secure=True)
+        storage = trie._storage
+        storage.requests = 0
+
+        values = await trie.get_many([key for key, _ in _pairs(500)])
+
+        self.assertEqual(values, [value for _, value in _pairs(500)])
+        # One request per level of the trie.
+        self.assertLessEqual(storage.requests, 10)
+
+    async def test_concurrent_gets_share_fetches(self):
+        """Test if concurrent operations wait for fetches that are in flight."""
+        trie = await self._stored_trie(_pairs(200), secure=True)
+        storage = trie._storage
+        storage.latency = 0.001
+        storage.requests = 0
+
+        values = await asyncio.gather(*(trie.get(key) for key, _ in _pairs(200)))
+
+        self.assertEqual(list(values), [value for _, value in _pairs(200)])
+        self.assertLessEqual(storage.requests, 10)
+
+    async def test_fetch_size(self):
+        """Test if large levels are split in several requests."""
+        trie = await self._stored_trie(_pairs(500), secure=True, fetch_size=4)
+        trie._storage.requests = 0
+
+        await trie.get_many([key for key, _ in _pairs(500)])
+
+        self.assertGreater(trie._storage.requests, 100)
+
+    async def test_delete_reads_sibling(self):
+        """Test deletes that merge a branch with a node beside the path."""
+        trie = await self._stored_trie(_pairs(20))
+        for key, _ in _pairs(19):
+            await trie.delete(key)
+
+        self.assertEqual(await trie.get(b"19"), b"value 19")
+        sync_trie = MerklePatriciaTrie({})
+        sync_trie.update(b"19", b"value 19")
+        self.assertEqual(trie.root_hash(), sync_trie.root_hash())
+
+    async def test_missing_key(self):
+        """Test if missing keys raise the errors of the sync trie."""
+        trie = await self._stored_trie(_pairs(10))
+        with self.assertRaises(KeyNotFoundError):
+            await trie.get(b"1000")
+
+        with self.assertRaises(ValueError):
+            await AsyncMerklePatriciaTrie(AsyncDictStorage()).get(b"dog")
+
+    async def test_missing_node(self):
+        """Test if a node missing from the storage raises a KeyError."""
+        trie = await self._stored_trie(_pairs(10))
+        trie._storage.data.clear()
+        with self.assertRaises(KeyError):
+            await trie.get(b"1")
+
+    async def test_storage_error(self):
+        """Test if an error of the storage is raised in every waiting operation."""
+        trie = await self._stored_trie(_pairs(10))
+
+        async def fail(keys):
+            raise ConnectionError("storage is down")
+
+        trie._storage.get_many = fail
+        results = await asyncio.gather(
+            trie.get(b"1"), trie.get(b"2"), return_exceptions=True
+        )
+        self.assertTrue(all(isinstance(result, ConnectionError) for result in results))
+        self.assertEqual(trie._in_flight, {})
+
+    async def test_proofs(self):
+        """Test if proofs of the async trie verify."""
+        trie = await self._stored_trie(_pairs(100), secure=True)
+        root_hash = trie.root_hash()
+
+        proof = await trie.get_proof_of_inclusion(b"42")
+        self.assertTrue(verify_inclusion(root_hash, b"42", proof))
+        proof = await trie.get_proof_of_exclusion(b"missing")
+        self.assertTrue(verify_exclusion(root_hash, b"missing", proof))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import sys, os
+#Following lines are for assigning parent directory dynamically.
+dir_path = os.path.dirname(os.path.realpath(__file__))
+parent_dir_path = os.path.abspath(os.path.join(dir_path, os.pardir))
+sys.path.insert(0, os.path.join(parent_dir_path, 'benchmarks'))
+import bench_trie
+import json
+import tempfile
+import unittest
+
+
+class TestBenchmarks(unittest.TestCase):
+    """Smoke test of the benchmark script on a small trie."""
+
+    def test_run_and_compare(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline_path = os.path.join(directory, 'baseline.json')
+            arguments = ['--sizes', '50', '--samples', '10', '--repeat', '1', '--keys', 'short']
+            status = bench_trie.main(arguments + ['--output', baseline_path])
+            self.assertEqual(status, 0)
+
+            with open(baseline_path) as fileobj:
+                results = json.load(fileobj)['results']
+            names = {result['name'] for result in results}
+            self.assertIn('update', names)
+            self.assertIn('verify_exclusion', names)
+            self.assertEqual({result['secure'] for result in results}, {False, True})
+
+            # Every result is compared with itself.
+            compared = bench_trie.compare(results, results, 1.1)
+            self.assertEqual(len(compared), len(results))
+            self.assertFalse(any(result['regression'] for result in compared))
+
+    def test_regression(self):
+        old = [{'name': 'get', 'size': 10, 'secure': False, 'keys': 'short', 'us_per_operation': 1.0}]
+        new = [dict(old[0], us_per_operation=2.0)]
+        compared = bench_trie.compare(new, old, 1.1)
+        self.assertTrue(compared[0]['regression'])
+        self.assertEqual(compared[0]['ratio'], 2.0)
+        self.assertEqual(bench_trie.compare(new, [], 1.1), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
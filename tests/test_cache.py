@@ -0,0 +1,58 @@
+import sys, os
+try:
+    from mpt.cache import LRUCache
+except (ImportError, ModuleNotFoundError):
+    #Following lines are for assigning parent directory dynamically.
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    parent_dir_path = os.path.abspath(os.path.join(dir_path, os.pardir))
+    sys.path.insert(0, parent_dir_path)
+    from src.mpt.cache import LRUCache
+import unittest
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = LRUCache(2)
+        cache.put(b'a', 1)
+
+        self.assertEqual(cache.get(b'a'), 1)
+        self.assertIsNone(cache.get(b'b'))
+        self.assertEqual(cache.info(), {'hits': 1, 'misses': 1, 'size': 1, 'max_size': 2})
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put(b'a', 1)
+        cache.put(b'b', 2)
+        cache.get(b'a')
+        cache.put(b'c', 3)
+
+        self.assertIn(b'a', cache)
+        self.assertNotIn(b'b', cache)
+        self.assertIn(b'c', cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_invalidate_and_clear(self):
+        cache = LRUCache(4)
+        cache.put(b'a', 1)
+        cache.put(b'b', 2)
+
+        cache.invalidate(b'a')
+        cache.invalidate(b'missing')
+        self.assertNotIn(b'a', cache)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled(self):
+        cache = LRUCache(0)
+        cache.put(b'a', 1)
+
+        self.assertIsNone(cache.get(b'a'))
+        self.assertEqual(len(cache), 0)
+
+        with self.assertRaises(ValueError):
+            LRUCache(-1)
+
+
+if __name__ == '__main__':
+    unittest.main()
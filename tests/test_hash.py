@@ -0,0 +1,52 @@
+import sys, os
+try:
+    from mpt import hash as mpt_hash
+except (ImportError, ModuleNotFoundError):
+    #Following lines are for assigning parent directory dynamically.
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    parent_dir_path = os.path.abspath(os.path.join(dir_path, os.pardir))
+    sys.path.insert(0, parent_dir_path)
+    from src.mpt import hash as mpt_hash
+import unittest
+
+EMPTY_HASH = "c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470"
+
+
+class TestKeccak(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(mpt_hash.keccak_hash(b"").hex(), EMPTY_HASH)
+
+    def test_hash_many(self):
+        items = [b"", b"dog", b"x" * 1000]
+        self.assertEqual(
+            mpt_hash.keccak_hash_many(items), [mpt_hash.keccak_hash(item) for item in items]
+        )
+        self.assertEqual(mpt_hash.keccak_hash_many([]), [])
+
+    def test_hash_list(self):
+        self.assertEqual(
+            mpt_hash.keccak_hash_list([b"do", b"g"]), mpt_hash.keccak_hash(b"dog")
+        )
+
+    def test_backends(self):
+        """Test if every installed backend gives the same hashes."""
+        items = [b"", b"dog", bytes(range(256)) * 10]
+        expected = mpt_hash.keccak_hash_many(items)
+        for name in mpt_hash.BACKENDS:
+            with self.subTest(backend=name):
+                try:
+                    selected, keccak_hash, keccak_hash_many = mpt_hash._select_backend(name)
+                except ImportError:
+                    continue
+                self.assertEqual(selected, name)
+                self.assertEqual([keccak_hash(item) for item in items], expected)
+                self.assertEqual(keccak_hash_many(items), expected)
+
+    def test_selected_backend(self):
+        self.assertIn(mpt_hash.BACKEND, mpt_hash.BACKENDS)
+        with self.assertRaises(ValueError):
+            mpt_hash._select_backend("md5")
+
+
+if __name__ == '__main__':
+    unittest.main()
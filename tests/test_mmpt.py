@@ -5,13 +5,14 @@ parent_dir_path = os.path.abspath(os.path.join(dir_path, os.pardir))
 sys.path.insert(0, parent_dir_path)
 from src.mpt.mmpt import ModifiedMerklePatriciaTrie
 from src.mpt.node import Node
-from src.mpt.exceptions import PoeError
+from src.mpt.exceptions import PoeError, InvalidNodeError
 from src.mpt.hash import keccak_hash
 from src.mpt.proof import Proof
 import rlp
 from rlp.exceptions import DecodingError
 import unittest
 import pickle
+import io
 
 
 class Test_proof(unittest.TestCase):
@@ -567,5 +568,197 @@ class Test_save_and_load(unittest.TestCase):
         self.assertEqual(pickle_bytes1, pickle_bytes2, 'Pickles are not identical.')
 
 
+class Test_stream(unittest.TestCase):
+    """Test saving and loading the trie as a stream of node records."""
+
+    data = [b'do', b'dog', b'doge', b'horse']
+
+    def test_save_and_load(self):
+        """Test if a streamed trie can be loaded."""
+        trie = ModifiedMerklePatriciaTrie({})
+        for kv in self.data:
+            trie.update(kv, kv)
+
+        stream = io.BytesIO()
+        count = trie.to_stream(stream)
+        self.assertEqual(count, len(trie))
+
+        stream.seek(0)
+        new_trie = ModifiedMerklePatriciaTrie({})
+        new_trie.from_stream(stream)
+
+        self.assertEqual(new_trie.root_hash(), trie.root_hash())
+        for kv in self.data:
+            self.assertEqual(new_trie.get(kv), kv)
+
+    def test_incremental(self):
+        """Test if incremental snapshots only hold the new nodes."""
+        trie = ModifiedMerklePatriciaTrie({})
+        for kv in self.data:
+            trie.update(kv, kv)
+
+        stream = io.BytesIO()
+        trie.to_stream(stream)
+        self.assertEqual(trie.to_stream(stream, incremental=True), 0)
+
+        trie.update(b'new', b'new')
+        trie.delete(b'dog')
+        size = len(trie)
+        count = trie.to_stream(stream, incremental=True)
+        self.assertGreater(count, 0)
+        self.assertLess(count, size)
+
+        stream.seek(0)
+        new_trie = ModifiedMerklePatriciaTrie({})
+        new_trie.from_stream(stream)
+
+        self.assertEqual(new_trie.root_hash(), trie.root_hash())
+        self.assertEqual(new_trie.get(b'new'), b'new')
+        self.assertFalse(new_trie.contains(b'dog'))
+
+    def test_incremental_without_snapshot(self):
+        """Test if an incremental snapshot needs a previous snapshot."""
+        trie = ModifiedMerklePatriciaTrie({})
+        trie.update(b'do', b'do')
+
+        with self.assertRaises(ValueError):
+            trie.to_stream(io.BytesIO(), incremental=True)
+
+    def test_incremental_after_pickle(self):
+        """Test if loading a pickle drops the snapshot an incremental save builds on."""
+        trie = ModifiedMerklePatriciaTrie({})
+        trie.update(b'do', b'do')
+        trie.to_stream(io.BytesIO())
+
+        other = ModifiedMerklePatriciaTrie({})
+        for kv in self.data:
+            other.update(kv, kv)
+        trie.from_pickle(other.to_pickle())
+        trie.update(b'new', b'new')
+
+        with self.assertRaises(ValueError):
+            trie.to_stream(io.BytesIO(), incremental=True)
+
+    def test_invalid_streams(self):
+        """Test loading empty and cut off streams."""
+        trie = ModifiedMerklePatriciaTrie({})
+        for kv in self.data:
+            trie.update(kv, kv)
+        stream = io.BytesIO()
+        trie.to_stream(stream)
+
+        with self.assertRaises(ValueError):
+            ModifiedMerklePatriciaTrie({}).from_stream(io.BytesIO())
+        with self.assertRaises(ValueError):
+            ModifiedMerklePatriciaTrie({}).from_stream(io.BytesIO(stream.getvalue()[:-10]))
+        with self.assertRaises(ValueError):
+            ModifiedMerklePatriciaTrie({}).from_stream(io.BytesIO(b'garbage!'))
+
+    def test_empty_trie(self):
+        """Test streaming an empty trie."""
+        stream = io.BytesIO()
+        ModifiedMerklePatriciaTrie({}).to_stream(stream)
+        stream.seek(0)
+
+        new_trie = ModifiedMerklePatriciaTrie({})
+        new_trie.from_stream(stream)
+        self.assertEqual(new_trie.root_hash(), Node.EMPTY_HASH)
+
+
+class Test_fast_load(unittest.TestCase):
+    """Test loading with stored keys and the integrity checks."""
+
+    data = [str(i).encode() for i in range(100)]
+
+    def _trie(self):
+        trie = ModifiedMerklePatriciaTrie({})
+        for kv in self.data:
+            trie.update(kv, kv)
+        return trie
+
+    def test_old_pickle_without_keys(self):
+        """Test if pickles without stored keys can still be loaded."""
+        trie = self._trie()
+        content = pickle.loads(trie.to_pickle())
+        del content['keys']
+
+        new_trie = ModifiedMerklePatriciaTrie()
+        new_trie.from_pickle(pickle.dumps(content))
+        self.assertEqual(new_trie.root_hash(), trie.root_hash())
+        self.assertEqual(new_trie.verify_storage(), [])
+
+    def test_verify_on_load(self):
+        """Test if a corrupted key is found while loading."""
+        trie = self._trie()
+        content = pickle.loads(trie.to_pickle())
+        content['keys'][0] = keccak_hash(b'corrupted')
+
+        new_trie = ModifiedMerklePatriciaTrie()
+        with self.assertRaises(InvalidNodeError):
+            new_trie.from_pickle(pickle.dumps(content), verify_sample=1.0)
+
+        # Without verification the corrupted key is loaded and found later.
+        new_trie.from_pickle(pickle.dumps(content))
+        self.assertEqual(new_trie.verify_storage(), [keccak_hash(b'corrupted')])
+        self.assertEqual(new_trie.verify_storage(sample=0.0), [])
+
+    def test_verify_in_background(self):
+        """Test running the integrity check in a background thread."""
+        trie = self._trie()
+        trie._storage[keccak_hash(b'corrupted')] = trie._storage[trie.root()]
+
+        future = trie.verify_storage(background=True)
+        self.assertEqual(future.result(), [keccak_hash(b'corrupted')])
+
+    def test_stream_verify_on_load(self):
+        """Test if a corrupted key in a stream is found while loading."""
+        trie = self._trie()
+        stream = io.BytesIO()
+        trie.to_stream(stream)
+
+        # Flip a byte of the first stored key.
+        raw = bytearray(stream.getvalue())
+        header_length = int.from_bytes(raw[:4], 'big')
+        raw[4 + header_length + 4] ^= 0xFF
+
+        new_trie = ModifiedMerklePatriciaTrie()
+        with self.assertRaises(InvalidNodeError):
+            new_trie.from_stream(io.BytesIO(bytes(raw)), verify_sample=1.0)
+
+
+class Test_mmpt_sorted_build(unittest.TestCase):
+    """Test building a MMPT from pairs sorted by hashed key."""
+
+    def test_same_root(self):
+        data = [str(i).encode() for i in range(300)]
+        trie = ModifiedMerklePatriciaTrie({})
+        for kv in data:
+            trie.update(kv, kv)
+
+        pairs = sorted(((kv, kv) for kv in data), key=lambda kv: keccak_hash(kv[0]))
+        built = ModifiedMerklePatriciaTrie.from_sorted_items(pairs)
+        self.assertIsInstance(built, ModifiedMerklePatriciaTrie)
+        self.assertEqual(built.root_hash(), trie.root_hash())
+
+        with self.assertRaises(ValueError):
+            ModifiedMerklePatriciaTrie.from_sorted_items(sorted((kv, kv) for kv in data))
+
+    def test_parallel_build(self):
+        """Test if a parallel build gives the root of sequential updates."""
+        data = [str(i).encode() for i in range(300)]
+        trie = ModifiedMerklePatriciaTrie({})
+        for kv in data:
+            trie.update(kv, kv * 2)
+
+        storage = {}
+        built = ModifiedMerklePatriciaTrie.parallel_build(
+            reversed([(kv, kv * 2) for kv in data]), storage=storage, workers=2
+        )
+        self.assertIsInstance(built, ModifiedMerklePatriciaTrie)
+        self.assertIs(built._storage, storage)
+        self.assertEqual(built.root_hash(), trie.root_hash())
+        self.assertEqual(built.get(data[42]), data[42] * 2)
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -6,6 +6,7 @@ parent_dir_path = os.path.abspath(os.path.join(dir_path, os.pardir))
 sys.path.insert(0, parent_dir_path)
 from src.mpt.mpt import MerklePatriciaTrie
 from src.mpt.node import Node
+from src.mpt.hash import keccak_hash
 from src.mpt.exceptions import (
     InvalidNodeError,
     LeafPathError,
@@ -14,14 +15,39 @@ from src.mpt.exceptions import (
     KeyNotFoundError,
     PoeError,
     PoiError,
+    ReadOnlyError,
 )
 import rlp
 import unittest
 import random
 import pickle
+import threading
 from rlp.exceptions import DecodingError
 
 
+def _random_data(amount):
+    random.seed(42)
+    rand_numbers = [random.randint(1, 1000000) for _ in range(amount)]
+    return [[str(i).encode(), str(i * 2).encode()] for i in rand_numbers]
+
+
+class CountingStorage(dict):
+    """Dict storage that counts the reads and writes of nodes."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.reads = 0
+        self.writes = 0
+
+    def __getitem__(self, key):
+        self.reads += 1
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        self.writes += 1
+        super().__setitem__(key, value)
+
+
 class TestMPT(unittest.TestCase):
     def test_insert_get_one_short(self):
         """Test inserting one short key-value pair and then getting it."""
@@ -306,6 +332,1106 @@ class TestMPT(unittest.TestCase):
         self.assertFalse(trie.contains(b"horse"))
 
 
+class Test_batch(unittest.TestCase):
+    """Test the batch update and delete functions of the MPT."""
+
+    def test_update_batch_same_root(self):
+        """Test if a batch update gives the same root as sequential updates."""
+        data = _random_data(200)
+
+        for secure in (False, True):
+            trie = MerklePatriciaTrie({}, secure=secure)
+            for kv in data:
+                trie.update(kv[0], kv[1])
+
+            batch_trie = MerklePatriciaTrie({}, secure=secure)
+            batch_trie.update_batch(data)
+
+            self.assertEqual(trie.root_hash(), batch_trie.root_hash())
+            for kv in data:
+                self.assertEqual(batch_trie.get(kv[0]), trie.get(kv[0]))
+
+    def test_update_batch_existing_trie(self):
+        """Test a batch update on a trie that already has data."""
+        data = _random_data(200)
+
+        trie = MerklePatriciaTrie({})
+        batch_trie = MerklePatriciaTrie({})
+        for kv in data[:100]:
+            trie.update(kv[0], kv[1])
+            batch_trie.update(kv[0], kv[1])
+
+        for kv in data[100:]:
+            trie.update(kv[0], kv[1])
+        batch_trie.update_batch(data[100:])
+
+        self.assertEqual(trie.root_hash(), batch_trie.root_hash())
+
+    def test_update_batch_duplicate_keys(self):
+        """Test if the last value of a duplicate key is stored."""
+        trie = MerklePatriciaTrie({})
+        trie.update_batch([(b"dog", b"puppy"), (b"do", b"verb"), (b"dog", b"doggo")])
+
+        self.assertEqual(trie.get(b"dog"), b"doggo")
+        self.assertEqual(trie.get(b"do"), b"verb")
+
+    def test_update_batch_splits_nodes(self):
+        """Test a batch update that splits leaves and extensions on the way."""
+        existing = [(b"do", b"verb"), (b"dog", b"puppy"), (b"horse", b"stallion")]
+        batch = [
+            (b"", b"empty"),
+            (b"d", b"letter"),
+            (b"doge", b"coin"),
+            (b"dot", b"point"),
+            (b"horse", b"mare"),
+            (b"hors", b"not a word"),
+            (b"house", b"home"),
+        ]
+
+        trie = MerklePatriciaTrie({})
+        batch_trie = MerklePatriciaTrie({})
+        for kv in existing:
+            trie.update(kv[0], kv[1])
+            batch_trie.update(kv[0], kv[1])
+
+        for kv in batch:
+            trie.update(kv[0], kv[1])
+        batch_trie.update_batch(batch)
+
+        self.assertEqual(trie.root_hash(), batch_trie.root_hash())
+        for kv in batch:
+            self.assertEqual(batch_trie.get(kv[0]), kv[1])
+
+    def test_update_batch_stores_only_reachable_nodes(self):
+        """Test if the intermediate versions of the nodes are not stored."""
+        data = _random_data(200)
+
+        storage = {}
+        trie = MerklePatriciaTrie(storage)
+        for kv in data:
+            trie.update(kv[0], kv[1])
+
+        batch_storage = {}
+        batch_trie = MerklePatriciaTrie(batch_storage)
+        batch_trie.update_batch(data)
+
+        self.assertLess(len(batch_storage), len(storage))
+        for key in batch_storage:
+            self.assertIn(key, storage)
+
+    def test_delete_batch_same_root(self):
+        """Test if a batch delete gives the same root as sequential deletes."""
+        data = _random_data(200)
+        keys = list(set(kv[0] for kv in data))
+
+        for secure in (False, True):
+            trie = MerklePatriciaTrie({}, secure=secure)
+            trie.update_batch(data)
+            batch_trie = MerklePatriciaTrie({}, secure=secure)
+            batch_trie.update_batch(data)
+
+            for key in keys[:50]:
+                trie.delete(key)
+            batch_trie.delete_batch(keys[:50])
+
+            self.assertEqual(trie.root_hash(), batch_trie.root_hash())
+
+            batch_trie.delete_batch(keys[50:])
+            self.assertEqual(batch_trie.root_hash(), Node.EMPTY_HASH)
+
+    def test_delete_batch_missing_key(self):
+        """Test if the trie is unchanged when a key in the batch is missing."""
+        trie = MerklePatriciaTrie({})
+        trie.update_batch([(b"do", b"verb"), (b"dog", b"puppy"), (b"horse", b"stallion")])
+        root_hash = trie.root_hash()
+
+        with self.assertRaises((KeyNotFoundError, LeafPathError, ExtensionPathError, BranchPathError)):
+            trie.delete_batch([b"dog", b"doge"])
+
+        self.assertEqual(trie.root_hash(), root_hash)
+        self.assertEqual(trie.get(b"dog"), b"puppy")
+
+    def test_delete_batch_empty_trie(self):
+        """Test deleting a batch from an empty trie."""
+        trie = MerklePatriciaTrie({})
+
+        with self.assertRaises(ValueError):
+            trie.delete_batch([b"do"])
+
+
+class Test_sorted_build(unittest.TestCase):
+    """Test building a trie from sorted pairs."""
+
+    def _sequential_root(self, data, secure=False):
+        trie = MerklePatriciaTrie({}, secure=secure)
+        for kv in data:
+            trie.update(kv[0], kv[1])
+        return trie.root_hash()
+
+    def test_same_root(self):
+        """Test if the built trie has the same root as sequential updates."""
+        data = _random_data(500)
+
+        trie = MerklePatriciaTrie.from_sorted_items(sorted(data))
+        self.assertEqual(trie.root_hash(), self._sequential_root(data))
+        for kv in data:
+            self.assertEqual(trie.get(kv[0]), kv[1])
+
+    def test_same_root_secure(self):
+        """Test the secure mode, the pairs are ordered by the hashed key."""
+        data = _random_data(500)
+        data.sort(key=lambda kv: keccak_hash(kv[0]))
+
+        trie = MerklePatriciaTrie.from_sorted_items(data, secure=True)
+        self.assertEqual(trie.root_hash(), self._sequential_root(data, secure=True))
+        for kv in data:
+            self.assertEqual(trie.get(kv[0]), kv[1])
+
+    def test_prefix_keys(self):
+        """Test keys that are prefixes of other keys (values in branches)."""
+        data = [
+            [b"", b"empty"],
+            [b"\x01", b"a"],
+            [b"\x01\x02", b"b"],
+            [b"\x01\x02\x03", b"c"],
+            [b"\x01\x03", b"d"],
+            [b"\x10\x20\x30\x40", b"e"],
+            [b"\x10\x20\x30\x41", b"f"],
+            [b"\x10\x21", b"g"],
+        ]
+
+        trie = MerklePatriciaTrie.from_sorted_items(data)
+        self.assertEqual(trie.root_hash(), self._sequential_root(data))
+
+    def test_single_and_empty(self):
+        """Test a trie with a single pair and an empty trie."""
+        trie = MerklePatriciaTrie.from_sorted_items([(b"key", b"value")])
+        self.assertEqual(trie.root_hash(), self._sequential_root([(b"key", b"value")]))
+
+        trie = MerklePatriciaTrie.from_sorted_items(iter([]))
+        self.assertEqual(trie.root(), None)
+        self.assertEqual(trie.root_hash(), Node.EMPTY_HASH)
+
+    def test_duplicate_keys(self):
+        """Test that the last value for a key wins."""
+        data = [[b"a", b"1"], [b"b", b"2"], [b"b", b"3"], [b"c", b"4"]]
+
+        trie = MerklePatriciaTrie.from_sorted_items(data)
+        self.assertEqual(trie.get(b"b"), b"3")
+        self.assertEqual(trie.root_hash(), self._sequential_root(data))
+
+    def test_unsorted_keys(self):
+        """Test if unsorted keys raise an error."""
+        with self.assertRaises(ValueError):
+            MerklePatriciaTrie.from_sorted_items([(b"b", b"1"), (b"a", b"2")])
+
+    def test_generator_and_storage(self):
+        """Test building from a generator into a given storage."""
+        data = sorted(_random_data(5000))
+        storage = {}
+
+        trie = MerklePatriciaTrie.from_sorted_items((kv for kv in data), storage=storage)
+        self.assertEqual(trie.root_hash(), self._sequential_root(data))
+        # Every node is written once and no stale nodes are left behind.
+        self.assertEqual(trie.prune(), 0)
+        self.assertIs(trie._storage, storage)
+
+    def test_parallel_build(self):
+        """Test if a parallel build gives the same root as sequential updates."""
+        data = _random_data(500) + [[b"", b"root"]]
+
+        for secure in (False, True):
+            trie = MerklePatriciaTrie.parallel_build(data, secure=secure, workers=2)
+            self.assertEqual(trie.root_hash(), self._sequential_root(data, secure=secure))
+            self.assertEqual(trie.prune(), 0)
+            for kv in data:
+                self.assertEqual(trie.get(kv[0]), kv[1])
+
+    def test_parallel_build_single_slot(self):
+        """Test a parallel build where all keys start with the same nibble."""
+        data = [[bytes([0x10, i]), bytes([i])] for i in range(50)]
+
+        trie = MerklePatriciaTrie.parallel_build(reversed(data), workers=2)
+        self.assertEqual(trie.root_hash(), self._sequential_root(data))
+
+        trie = MerklePatriciaTrie.parallel_build([], workers=2)
+        self.assertEqual(trie.root(), None)
+
+
+class Test_deferred(unittest.TestCase):
+    """Test the deferred (commit/flush) mode of the MPT."""
+
+    data = [
+        [b"do", b"verb"],
+        [b"dog", b"puppy"],
+        [b"doge", b"coin"],
+        [b"horse", b"stallion"],
+    ]
+
+    def test_nothing_stored_before_commit(self):
+        """Test if the storage is untouched until the trie is committed."""
+        storage = {}
+        trie = MerklePatriciaTrie(storage, deferred=True)
+
+        for kv in self.data:
+            trie.update(kv[0], kv[1])
+
+        self.assertEqual(len(storage), 0)
+        trie.commit()
+        self.assertNotEqual(len(storage), 0)
+
+    def test_get_before_commit(self):
+        """Test reading values that are only in memory."""
+        trie = MerklePatriciaTrie({}, deferred=True)
+
+        for kv in self.data:
+            trie.update(kv[0], kv[1])
+
+        for kv in self.data:
+            self.assertEqual(trie.get(kv[0]), kv[1])
+            self.assertTrue(trie.contains(kv[0]))
+        self.assertFalse(trie.contains(b"dogi"))
+
+    def test_root_hash_commits(self):
+        """Test if the root hash matches the root hash of a normal trie."""
+        for secure in (False, True):
+            trie = MerklePatriciaTrie({}, secure=secure)
+            deferred_trie = MerklePatriciaTrie({}, secure=secure, deferred=True)
+
+            for kv in self.data:
+                trie.update(kv[0], kv[1])
+                deferred_trie.update(kv[0], kv[1])
+
+            self.assertEqual(deferred_trie.root_hash(), trie.root_hash())
+
+            trie.delete(b"doge")
+            deferred_trie.delete(b"doge")
+            self.assertEqual(deferred_trie.root_hash(), trie.root_hash())
+
+    def test_each_node_stored_once(self):
+        """Test if only the nodes of the final trie are written."""
+        random.seed(42)
+        keys = [str(random.randint(1, 1000000)).encode() for _ in range(100)]
+
+        storage = {}
+        trie = MerklePatriciaTrie(storage)
+        deferred_storage = {}
+        deferred_trie = MerklePatriciaTrie(deferred_storage, deferred=True)
+        for key in keys:
+            trie.update(key, key * 2)
+            deferred_trie.update(key, key * 2)
+
+        self.assertEqual(deferred_trie.root_hash(), trie.root_hash())
+        self.assertLess(len(deferred_storage), len(storage))
+
+    def test_proof_in_deferred_mode(self):
+        """Test if proofs can be generated and verified before a commit."""
+        trie = MerklePatriciaTrie({}, deferred=True)
+
+        for kv in self.data:
+            trie.update(kv[0], kv[1])
+
+        proof = trie.get_proof_of_inclusion(b"dog")
+        self.assertTrue(trie.verify_proof_of_inclusion(b"dog", proof))
+
+
+class Test_node_cache(unittest.TestCase):
+    """Test the decoded node cache of the MPT."""
+
+    data = [
+        [b"do", b"verb"],
+        [b"dog", b"puppy"],
+        [b"doge", b"coin"],
+        [b"horse", b"stallion"],
+    ]
+
+    def test_repeated_get_hits_cache(self):
+        """Test if reading the same key twice is served from the cache."""
+        trie = MerklePatriciaTrie({})
+        for kv in self.data:
+            trie.update(kv[0], kv[1])
+
+        trie.get(b"doge")
+        misses = trie.cache_info()["misses"]
+        trie.get(b"doge")
+
+        self.assertEqual(trie.cache_info()["misses"], misses)
+        self.assertGreater(trie.cache_info()["hits"], 0)
+
+    def test_cache_size_limit(self):
+        """Test if the cache does not grow above its size."""
+        trie = MerklePatriciaTrie({}, cache_size=2)
+        for i in range(100):
+            trie.update(str(i).encode(), str(i).encode())
+        for i in range(100):
+            self.assertEqual(trie.get(str(i).encode()), str(i).encode())
+
+        self.assertLessEqual(trie.cache_info()["size"], 2)
+
+    def test_updates_after_cached_reads(self):
+        """Test if updates don't change nodes that are in the cache."""
+        trie = MerklePatriciaTrie({})
+        uncached_trie = MerklePatriciaTrie({}, cache_size=0)
+        for kv in self.data:
+            trie.update(kv[0], kv[1])
+            uncached_trie.update(kv[0], kv[1])
+            for other in self.data:
+                trie.contains(other[0])
+
+        trie.update(b"dodo", b"bird")
+        uncached_trie.update(b"dodo", b"bird")
+        trie.delete(b"dog")
+        uncached_trie.delete(b"dog")
+
+        self.assertEqual(trie.root_hash(), uncached_trie.root_hash())
+        for kv in self.data:
+            if kv[0] != b"dog":
+                self.assertEqual(trie.get(kv[0]), kv[1])
+        self.assertEqual(uncached_trie.cache_info()["size"], 0)
+
+    def test_clear_cache(self):
+        """Test clearing the cache."""
+        trie = MerklePatriciaTrie({})
+        for kv in self.data:
+            trie.update(kv[0], kv[1])
+        trie.get(b"dog")
+
+        trie.clear_cache()
+        self.assertEqual(trie.cache_info()["size"], 0)
+
+
+class Test_prune(unittest.TestCase):
+    """Test removing stale nodes from the storage."""
+
+    def _churn(self, trie, rounds):
+        random.seed(42)
+        for i in range(rounds):
+            key = str(random.randint(1, 50)).encode()
+            trie.update(key, str(i).encode())
+
+    def test_prune_keeps_current_trie(self):
+        """Test if pruning removes nodes but keeps the trie readable."""
+        storage = {}
+        trie = MerklePatriciaTrie(storage)
+        self._churn(trie, 300)
+
+        root_hash = trie.root_hash()
+        size = len(storage)
+        removed = trie.prune()
+
+        self.assertGreater(removed, 0)
+        self.assertEqual(len(storage), size - removed)
+        self.assertEqual(trie.root_hash(), root_hash)
+        self.assertEqual(len(trie._reachable_references([trie.root()])), len(storage))
+        for i in range(1, 51):
+            key = str(i).encode()
+            if trie.contains(key):
+                trie.get(key)
+
+    def test_prune_matches_fresh_trie(self):
+        """Test if a pruned trie has the same nodes as a freshly built trie."""
+        storage = {}
+        trie = MerklePatriciaTrie(storage)
+        trie.update(b"do", b"verb")
+        trie.update(b"dog", b"puppy")
+        trie.update(b"dog", b"doggo")
+        trie.update(b"horse", b"stallion")
+        trie.delete(b"horse")
+        trie.prune()
+
+        fresh_storage = {}
+        fresh_trie = MerklePatriciaTrie(fresh_storage)
+        fresh_trie.update(b"do", b"verb")
+        fresh_trie.update(b"dog", b"doggo")
+
+        self.assertEqual(set(storage.keys()), set(fresh_storage.keys()))
+
+    def test_prune_keep_roots(self):
+        """Test if older roots stay readable when they are kept."""
+        storage = {}
+        trie = MerklePatriciaTrie(storage)
+        trie.update(b"do", b"verb")
+        trie.update(b"dog", b"puppy")
+        old_root = trie.root()
+
+        trie.update(b"dog", b"doggo")
+        trie.prune(keep_roots=[old_root])
+
+        old_trie = MerklePatriciaTrie(storage, old_root)
+        self.assertEqual(old_trie.get(b"dog"), b"puppy")
+
+        trie.prune()
+        self.assertNotIn(old_root, storage)
+        with self.assertRaises(KeyError):
+            MerklePatriciaTrie(storage, old_root).get(b"dog")
+
+    def test_prune_empty_trie(self):
+        """Test pruning a trie after all keys are deleted."""
+        storage = {}
+        trie = MerklePatriciaTrie(storage)
+        self._churn(trie, 20)
+        for i in range(1, 51):
+            key = str(i).encode()
+            if trie.contains(key):
+                trie.delete(key)
+
+        trie.prune()
+        self.assertEqual(len(storage), 0)
+
+    def test_auto_prune(self):
+        """Test if automatic pruning keeps the storage bounded."""
+        storage = {}
+        trie = MerklePatriciaTrie(storage, auto_prune=10)
+        unpruned_storage = {}
+        unpruned_trie = MerklePatriciaTrie(unpruned_storage)
+
+        self._churn(trie, 500)
+        self._churn(unpruned_trie, 500)
+
+        self.assertEqual(trie.root_hash(), unpruned_trie.root_hash())
+        self.assertLess(len(storage), len(unpruned_storage))
+        trie.prune()
+        self.assertLess(len(storage), len(unpruned_storage) / 5)
+
+
+class Test_versions(unittest.TestCase):
+    """Test read-only snapshots and reads of older versions."""
+
+    def test_snapshot_keeps_old_values(self):
+        """Test if a snapshot still returns the values of its version."""
+        trie = MerklePatriciaTrie({})
+        trie.update(b"do", b"verb")
+        trie.update(b"dog", b"puppy")
+        snapshot = trie.snapshot()
+
+        trie.update(b"dog", b"doggo")
+        trie.update(b"horse", b"stallion")
+        trie.delete(b"do")
+
+        self.assertEqual(snapshot.get(b"dog"), b"puppy")
+        self.assertEqual(snapshot.get(b"do"), b"verb")
+        self.assertFalse(snapshot.contains(b"horse"))
+        self.assertEqual(dict(snapshot.items()), {b"do": b"verb", b"dog": b"puppy"})
+        self.assertEqual(trie.get(b"dog"), b"doggo")
+
+    def test_snapshot_is_read_only(self):
+        """Test if writing to a snapshot raises an error."""
+        trie = MerklePatriciaTrie({})
+        trie.update(b"dog", b"puppy")
+        snapshot = trie.snapshot()
+
+        with self.assertRaises(ReadOnlyError):
+            snapshot.update(b"dog", b"doggo")
+        with self.assertRaises(ReadOnlyError):
+            snapshot.update_batch([(b"do", b"verb")])
+        with self.assertRaises(ReadOnlyError):
+            snapshot.delete(b"dog")
+        with self.assertRaises(ReadOnlyError):
+            snapshot.delete_batch([b"dog"])
+        with self.assertRaises(ReadOnlyError):
+            snapshot.prune()
+        self.assertEqual(trie.get(b"dog"), b"puppy")
+
+    def test_snapshot_in_deferred_mode(self):
+        """Test if a snapshot commits the pending nodes of a deferred trie."""
+        trie = MerklePatriciaTrie({}, deferred=True)
+        trie.update(b"dog", b"puppy")
+        snapshot = trie.snapshot()
+        trie.update(b"dog", b"doggo")
+
+        self.assertEqual(snapshot.get(b"dog"), b"puppy")
+        self.assertEqual(trie.get(b"dog"), b"doggo")
+
+    def test_get_at_root(self):
+        """Test reading an older version by its root."""
+        trie = MerklePatriciaTrie({}, secure=True)
+        trie.update(b"dog", b"puppy")
+        old_root = trie.root()
+        trie.update(b"dog", b"doggo")
+
+        self.assertEqual(trie.get(b"dog", root=old_root), b"puppy")
+        self.assertEqual(trie.at(old_root).get(b"dog"), b"puppy")
+        self.assertEqual(trie.get(b"dog"), b"doggo")
+        with self.assertRaises(ValueError):
+            trie.get(b"dog", root=None)
+
+    def test_versions(self):
+        """Test if only the last versions are retained."""
+        trie = MerklePatriciaTrie({}, keep_versions=3)
+        roots = []
+        for i in range(5):
+            trie.update(b"dog", str(i).encode())
+            roots.append(trie.root())
+
+        self.assertEqual(trie.versions(), roots[-3:])
+        self.assertEqual(MerklePatriciaTrie({}).versions(), [])
+
+    def test_prune_keeps_versions(self):
+        """Test if pruning keeps the retained versions and removes older ones."""
+        storage = {}
+        trie = MerklePatriciaTrie(storage, keep_versions=3)
+        roots = []
+        for i in range(6):
+            trie.update_batch([(b"dog", str(i).encode()), (b"do" + str(i).encode(), b"verb")])
+            roots.append(trie.root())
+
+        trie.prune()
+
+        for i in (3, 4, 5):
+            self.assertEqual(trie.get(b"dog", root=roots[i]), str(i).encode())
+        for i in (0, 1, 2):
+            self.assertNotIn(roots[i], storage)
+
+    def test_prune_keeps_live_snapshots(self):
+        """Test if pruning keeps the nodes of snapshots that are still used."""
+        storage = {}
+        trie = MerklePatriciaTrie(storage)
+        trie.update(b"dog", b"puppy")
+        trie.update(b"do", b"verb")
+        snapshot = trie.snapshot()
+        old_root = trie.root()
+
+        trie.update(b"dog", b"doggo")
+        trie.prune()
+        self.assertEqual(snapshot.get(b"dog"), b"puppy")
+
+        del snapshot
+        trie.prune()
+        self.assertNotIn(old_root, storage)
+
+    def test_auto_prune_keeps_versions(self):
+        """Test if automatic pruning keeps the retained versions readable."""
+        storage = {}
+        trie = MerklePatriciaTrie(storage, auto_prune=5, keep_versions=10)
+        expected = {}
+        versions = []
+        random.seed(7)
+        for i in range(100):
+            key = str(random.randint(1, 30)).encode()
+            trie.update(key, str(i).encode())
+            expected[key] = str(i).encode()
+            versions.append((trie.root(), dict(expected)))
+
+        for root, pairs in versions[-10:]:
+            self.assertEqual(dict(trie.at(root).items()), pairs)
+        self.assertNotIn(versions[0][0], storage)
+
+
+class Test_concurrency(unittest.TestCase):
+    """Test one writer thread together with reader threads."""
+
+    def test_updates_dont_change_cached_nodes(self):
+        """Test if an older root reads its values from the shared node cache."""
+        trie = MerklePatriciaTrie({})
+        for i in range(100):
+            trie.update(str(i).encode(), b"old")
+        old_root = trie.root()
+        for i in range(100):
+            trie.get(str(i).encode())
+
+        for i in range(100):
+            trie.update(str(i).encode(), b"new")
+        trie.delete_batch([str(i).encode() for i in range(50)])
+
+        for i in range(100):
+            self.assertEqual(trie.get(str(i).encode(), root=old_root), b"old")
+
+    def test_readers_during_writes(self):
+        """Test if readers of a snapshot see one version while the writer goes on."""
+        storage = {}
+        trie = MerklePatriciaTrie(storage, auto_prune=20)
+        for i in range(200):
+            trie.update(str(i).encode(), b"0")
+
+        errors = []
+        done = threading.Event()
+
+        def read():
+            try:
+                while not done.is_set():
+                    snapshot = trie.snapshot()
+                    values = {snapshot.get(str(i).encode()) for i in range(0, 200, 7)}
+                    # Every round updates all keys, a version holds at most two values.
+                    if len(values) > 2:
+                        errors.append(values)
+            except Exception as error:
+                errors.append(error)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for round in range(1, 4):
+            for i in range(200):
+                trie.update(str(i).encode(), str(round).encode())
+        done.set()
+        for reader in readers:
+            reader.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(trie.get(b"199"), b"3")
+
+    def test_concurrent_writers(self):
+        """Test if writes from several threads are applied one at a time."""
+        trie = MerklePatriciaTrie({}, secure=True)
+
+        def write(thread):
+            for i in range(50):
+                trie.update("{}-{}".format(thread, i).encode(), b"value")
+
+        writers = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+
+        self.assertEqual(len(list(trie.items())), 200)
+
+
+class Test_stats(unittest.TestCase):
+    """Test the counters and the span hook."""
+
+    def test_disabled(self):
+        """Test if the counters are only available when they are collected."""
+        trie = MerklePatriciaTrie({})
+        trie.update(b"dog", b"puppy")
+        with self.assertRaises(ValueError):
+            trie.stats()
+        with self.assertRaises(ValueError):
+            trie.reset_stats()
+
+    def test_storage_counters(self):
+        """Test if storage reads and writes match the calls on the storage."""
+        storage = CountingStorage()
+        trie = MerklePatriciaTrie(storage, cache_size=0, collect_stats=True)
+        for i in range(100):
+            trie.update(str(i).encode(), b"value" * 10)
+        for i in range(100):
+            trie.get(str(i).encode())
+
+        stats = trie.stats()
+        self.assertEqual(stats["storage_writes"], storage.writes)
+        self.assertEqual(stats["storage_reads"], storage.reads)
+        self.assertEqual(stats["operations"], 200)
+        self.assertGreaterEqual(stats["encodes"], stats["storage_writes"])
+        self.assertGreaterEqual(stats["decodes"], stats["storage_reads"])
+        self.assertEqual(stats["hashes"], stats["storage_writes"])
+        self.assertEqual(stats["cache_hits"], 0)
+
+    def test_batch_hashing(self):
+        """Test if batch writes hash every key and committed node once."""
+        storage = {}
+        trie = MerklePatriciaTrie(storage, secure=True, collect_stats=True)
+        trie.update_batch([(str(i).encode(), b"value" * 10) for i in range(500)])
+
+        expected = MerklePatriciaTrie({}, secure=True)
+        for i in range(500):
+            expected.update(str(i).encode(), b"value" * 10)
+
+        stats = trie.stats()
+        self.assertEqual(trie.root_hash(), expected.root_hash())
+        self.assertEqual(stats["hashes"], 500 + stats["storage_writes"])
+        self.assertEqual(stats["encodes"], stats["storage_writes"])
+        self.assertEqual(len(storage), stats["storage_writes"])
+
+    def test_cache_and_depth(self):
+        """Test the cache counters and the traversal depth of reads."""
+        trie = MerklePatriciaTrie({}, secure=True, collect_stats=True)
+        trie.update_batch([(str(i).encode(), b"value") for i in range(1000)])
+        trie.clear_cache()
+        trie.reset_stats()
+
+        trie.get(b"42")
+        first = trie.stats()
+        trie.get(b"42")
+        second = trie.stats()
+
+        self.assertEqual(first["cache_hits"], 0)
+        self.assertGreater(first["storage_reads"], 0)
+        self.assertEqual(second["storage_reads"], first["storage_reads"])
+        self.assertEqual(second["cache_hits"], first["cache_misses"])
+        self.assertEqual(second["hashes"], 2)
+        self.assertEqual(second["bytes_hashed"], 4)
+        self.assertEqual(second["traversals"], 2)
+        self.assertGreater(second["max_depth"], 2)
+        self.assertEqual(second["mean_depth"], first["max_depth"])
+
+        trie.reset_stats()
+        self.assertEqual(set(trie.stats().values()), {0})
+
+    def test_span_hook(self):
+        """Test if the span hook gets every traced operation."""
+        spans = []
+        trie = MerklePatriciaTrie({})
+        trie.set_span_hook(lambda name, seconds: spans.append((name, seconds)))
+
+        trie.update(b"dog", b"puppy")
+        trie.get(b"dog")
+        proof = trie.get_proof_of_inclusion(b"dog")
+        trie.verify_proof_of_inclusion(b"dog", proof)
+        with self.assertRaises(KeyNotFoundError):
+            trie.get(b"cat")
+        trie.delete(b"dog")
+
+        self.assertEqual(
+            [name for name, _ in spans],
+            [
+                "update",
+                "get",
+                "get_proof_of_inclusion",
+                "verify_proof_of_inclusion",
+                "get",
+                "delete",
+            ],
+        )
+        self.assertTrue(all(seconds >= 0 for _, seconds in spans))
+
+        trie.set_span_hook(None)
+        trie.update(b"dog", b"puppy")
+        self.assertEqual(len(spans), 6)
+
+
+class Test_iteration(unittest.TestCase):
+    """Test iterating over the pairs of the trie."""
+
+    def test_items_in_order(self):
+        """Test if all pairs are returned ordered by key."""
+        random.seed(3)
+        data = {str(random.randint(1, 1000000)).encode(): str(i).encode() for i in range(300)}
+        data[b""] = b"empty"
+        data[b"1"] = b"prefix"
+        trie = MerklePatriciaTrie({})
+        for key, value in data.items():
+            trie.update(key, value)
+
+        self.assertEqual(list(trie.items()), sorted(data.items()))
+        self.assertEqual(list(trie.keys()), sorted(data))
+        self.assertEqual(list(trie.values()), [data[key] for key in sorted(data)])
+
+    def test_secure_keys(self):
+        """Test if secure tries return the hashed keys."""
+        data = [str(i).encode() for i in range(100)]
+        trie = MerklePatriciaTrie({}, secure=True)
+        for key in data:
+            trie.update(key, key)
+
+        expected = sorted((keccak_hash(key), key) for key in data)
+        self.assertEqual(list(trie.items()), expected)
+
+    def test_lazy(self):
+        """Test if the walk only reads the nodes it reaches."""
+        trie = MerklePatriciaTrie({}, cache_size=0)
+        for i in range(1000):
+            trie.update(str(i).encode(), b"value")
+        storage = CountingStorage(trie._storage)
+        lazy_trie = MerklePatriciaTrie(storage, trie.root(), cache_size=0)
+        items = lazy_trie.items()
+        self.assertEqual(storage.reads, 0)
+        next(items)
+        self.assertLess(storage.reads, 10)
+
+    def _tenant_trie(self):
+        data = {}
+        for tenant in (b"t1", b"t2", b"t22", b"t3"):
+            for i in range(50):
+                data[tenant + b"|" + str(i).encode()] = tenant + str(i).encode()
+        data[b"t2"] = b"tenant"
+        trie = MerklePatriciaTrie({})
+        for key, value in data.items():
+            trie.update(key, value)
+        return trie, sorted(data.items())
+
+    def test_iter_prefix(self):
+        """Test if only the keys with the prefix are returned."""
+        trie, items = self._tenant_trie()
+
+        for prefix in (b"t2|", b"t2", b"t", b"t22|4", b"", b"t4", b"t2|49", b"t2|499"):
+            expected = [kv for kv in items if kv[0].startswith(prefix)]
+            self.assertEqual(list(trie.iter_prefix(prefix)), expected, prefix)
+
+        self.assertEqual(list(MerklePatriciaTrie({}).iter_prefix(b"t")), [])
+
+    def test_iter_range(self):
+        """Test if only the keys in the range are returned."""
+        trie, items = self._tenant_trie()
+
+        bounds = [
+            (None, None),
+            (b"t2", b"t3"),
+            (b"t2|", b"t2|~"),
+            (b"t1|10", b"t1|30"),
+            (b"t1|25", None),
+            (None, b"t2"),
+            (b"t20", b"t21"),
+            (b"a", b"z"),
+            (b"t3", b"t2"),
+        ]
+        for start, end in bounds:
+            expected = [
+                kv for kv in items
+                if (start is None or kv[0] >= start) and (end is None or kv[0] < end)
+            ]
+            self.assertEqual(list(trie.iter_range(start, end)), expected, (start, end))
+
+    def test_iter_prefix_reads_only_subtree(self):
+        """Test if a prefix scan doesn't read the other subtrees."""
+        trie, items = self._tenant_trie()
+        storage = CountingStorage(trie._storage)
+        lazy_trie = MerklePatriciaTrie(storage, trie.root(), cache_size=0)
+        self.assertEqual(len(list(lazy_trie.iter_prefix(b"t1|"))), 50)
+        prefix_reads = storage.reads
+
+        storage.reads = 0
+        list(lazy_trie.items())
+        self.assertLess(prefix_reads * 2, storage.reads)
+
+    def test_empty_and_deferred(self):
+        """Test an empty trie and pending nodes in deferred mode."""
+        trie = MerklePatriciaTrie({}, deferred=True)
+        self.assertEqual(list(trie.items()), [])
+
+        trie.update(b"dog", b"puppy")
+        trie.update(b"do", b"verb")
+        self.assertEqual(list(trie.items()), [(b"do", b"verb"), (b"dog", b"puppy")])
+
+
+class Test_diff(unittest.TestCase):
+    """Test the diff between two roots."""
+
+    def _expected(self, old, new):
+        changes = []
+        for key in sorted(set(old) | set(new)):
+            if old.get(key) != new.get(key):
+                changes.append((key, old.get(key), new.get(key)))
+        return changes
+
+    def test_diff(self):
+        """Test if updates, inserts and deletes are found in key order."""
+        random.seed(11)
+        old = {str(random.randint(1, 100000)).encode(): b"v" for _ in range(500)}
+        trie = MerklePatriciaTrie({})
+        for key, value in old.items():
+            trie.update(key, value)
+        old_root = trie.root()
+
+        new = dict(old)
+        keys = sorted(old)
+        for key in keys[::50]:
+            new[key] = b"changed"
+        for key in keys[7::60]:
+            del new[key]
+            trie.delete(key)
+        for key in (b"1", b"12", b"123456", b"999999", keys[3] + b"0"):
+            new[key] = b"added"
+        for key, value in new.items():
+            if old.get(key) != value:
+                trie.update(key, value)
+
+        self.assertEqual(list(trie.diff(old_root, trie.root())), self._expected(old, new))
+        self.assertEqual(
+            list(trie.diff(trie.root(), old_root)),
+            [(key, b, a) for key, a, b in self._expected(old, new)],
+        )
+        self.assertEqual(list(trie.diff(old_root, old_root)), [])
+
+    def test_diff_empty(self):
+        """Test a diff with an empty trie."""
+        trie = MerklePatriciaTrie({})
+        trie.update(b"do", b"verb")
+        trie.update(b"dog", b"puppy")
+
+        self.assertEqual(
+            list(trie.diff(None, trie.root())), [(b"do", None, b"verb"), (b"dog", None, b"puppy")]
+        )
+        self.assertEqual(
+            list(trie.diff(trie.root(), None)), [(b"do", b"verb", None), (b"dog", b"puppy", None)]
+        )
+        self.assertEqual(list(trie.diff(None, None)), [])
+
+    def test_diff_structure_changes(self):
+        """Test changes that turn leaves into branches and split extensions."""
+        trie = MerklePatriciaTrie({})
+        trie.update(b"\x12\x34\x56", b"a")
+        trie.update(b"\x12\x34\x57", b"b")
+        old_root = trie.root()
+
+        trie.update(b"\x12", b"c")
+        trie.update(b"\x12\x44", b"d")
+        trie.update(b"\x12\x34\x56\x78", b"e")
+        trie.delete(b"\x12\x34\x57")
+
+        old = {b"\x12\x34\x56": b"a", b"\x12\x34\x57": b"b"}
+        new = {b"\x12\x34\x56": b"a", b"\x12": b"c", b"\x12\x44": b"d", b"\x12\x34\x56\x78": b"e"}
+        self.assertEqual(list(trie.diff(old_root, trie.root())), self._expected(old, new))
+        self.assertEqual(
+            list(trie.diff(trie.root(), old_root)),
+            [(key, b, a) for key, a, b in self._expected(old, new)],
+        )
+
+    def test_diff_skips_shared_subtrees(self):
+        """Test if only the changed part of the tries is read."""
+        trie = MerklePatriciaTrie({}, cache_size=0)
+        for i in range(2000):
+            trie.update(str(i).encode(), b"value")
+        old_root = trie.root()
+        trie.update(b"1000", b"changed")
+        storage = CountingStorage(trie._storage)
+        diff_trie = MerklePatriciaTrie(storage, cache_size=0)
+        self.assertEqual(
+            list(diff_trie.diff(old_root, trie.root())), [(b"1000", b"value", b"changed")]
+        )
+        self.assertLess(storage.reads, 20)
+
+
+class Test_multiproof(unittest.TestCase):
+    """Test proofs of inclusion for many keys."""
+
+    def _trie(self, secure=False):
+        random.seed(7)
+        trie = MerklePatriciaTrie({}, secure=secure)
+        keys = [str(random.randint(1, 1000000)).encode() for _ in range(300)]
+        for key in keys:
+            trie.update(key, key * 2)
+        return trie, keys
+
+    def test_valid_multiproof(self):
+        """Test if a multiproof for many keys is valid."""
+        for secure in (False, True):
+            trie, keys = self._trie(secure)
+            proof = trie.get_multiproof(keys[:100])
+
+            self.assertEqual(keccak_hash(proof[0]), trie.root_hash())
+            self.assertTrue(trie.verify_multiproof(keys[:100], proof))
+            self.assertTrue(trie.verify_multiproof(keys[:10], proof, trie.root_hash()))
+            self.assertTrue(trie.verify_multiproof([], proof))
+
+    def test_nodes_are_not_repeated(self):
+        """Test if every node is in the proof only once."""
+        trie, keys = self._trie()
+        proof = trie.get_multiproof(keys + keys)
+
+        self.assertEqual(len(proof), len(set(proof)))
+        separate = set()
+        for key in keys:
+            separate.update(trie.get_proof_of_inclusion(key))
+        self.assertTrue(set(proof) <= separate)
+
+    def test_invalid_multiproof(self):
+        """Test if wrong keys, roots or missing nodes are detected."""
+        trie, keys = self._trie()
+        proof = trie.get_multiproof(keys[:50])
+
+        self.assertFalse(trie.verify_multiproof(keys[:50] + [b"missing"], proof))
+        self.assertFalse(trie.verify_multiproof(keys[50:60], proof))
+        self.assertFalse(trie.verify_multiproof(keys[:50], proof, keccak_hash(b"root")))
+        self.assertFalse(trie.verify_multiproof(keys[:50], proof[:-1]))
+
+    def test_malformed_multiproof(self):
+        """Test if malformed proof nodes make the proof invalid instead of raising."""
+        trie, keys = self._trie()
+        for node in (b"\xff" * 40, rlp.encode([b"\x01"] * 17) + b"garbage", rlp.encode([[b"a"], b"b" * 40])):
+            self.assertFalse(trie.verify_multiproof(keys[:1], [node], keccak_hash(node)))
+
+    def test_missing_key(self):
+        """Test if a multiproof for a key that is not in the trie raises."""
+        trie, keys = self._trie()
+        with self.assertRaises((LeafPathError, ExtensionPathError, BranchPathError)):
+            trie.get_multiproof(keys[:5] + [b"missing"])
+
+        # The key ends in a branch without value.
+        trie = MerklePatriciaTrie({})
+        trie.update(b"\x01\x10", b"one")
+        trie.update(b"\x01\x20", b"two")
+        with self.assertRaises(BranchPathError):
+            trie.get_multiproof([b"\x01"])
+
+        with self.assertRaises(ValueError):
+            MerklePatriciaTrie({}).get_multiproof([b"key"])
+
+    def test_small_root(self):
+        """Test a multiproof for a trie whose root is referenced in place."""
+        trie = MerklePatriciaTrie({})
+        trie.update(b"a", b"b")
+
+        proof = trie.get_multiproof([b"a"])
+        self.assertEqual(proof, [trie.root()])
+        self.assertTrue(trie.verify_multiproof([b"a"], proof))
+
+
+class Test_range_proof(unittest.TestCase):
+    """Test proofs for all pairs in a key range."""
+
+    def _trie(self, secure=False):
+        trie = MerklePatriciaTrie({}, secure=secure)
+        for i in range(300):
+            key = "key{:03}".format(i).encode()
+            trie.update(key, str(i).encode())
+        return trie
+
+    def test_valid_range_proof(self):
+        """Test if range proofs for several ranges are valid."""
+        trie = self._trie()
+        root_hash = trie.root_hash()
+
+        ranges = [
+            (b"key100", b"key150"),
+            (b"key10", b"key11"),
+            (None, b"key005"),
+            (b"key290", None),
+            (None, None),
+            (b"key1000", b"key1001"),
+            (b"zzz", None),
+        ]
+        for start, end in ranges:
+            pairs, proof = trie.get_range_proof(start, end)
+            self.assertEqual(pairs, list(trie.iter_range(start, end)))
+            self.assertTrue(trie.verify_range_proof(start, end, pairs, proof, root_hash))
+            self.assertTrue(trie.verify_range_proof(start, end, pairs, proof))
+
+    def test_proof_is_compact(self):
+        """Test if the proof doesn't contain the whole trie."""
+        trie = self._trie()
+        _, proof = trie.get_range_proof(b"key100", b"key110")
+        self.assertLess(len(proof), len(trie._storage) / 4)
+        self.assertEqual(len(proof), len(set(proof)))
+
+    def test_invalid_range_proof(self):
+        """Test if missing, added or changed pairs are detected."""
+        trie = self._trie()
+        start, end = b"key100", b"key150"
+        pairs, proof = trie.get_range_proof(start, end)
+
+        self.assertFalse(trie.verify_range_proof(start, end, pairs[:-1], proof))
+        self.assertFalse(trie.verify_range_proof(start, end, pairs[1:], proof))
+        self.assertFalse(
+            trie.verify_range_proof(start, end, pairs + [(b"key149x", b"1")], proof)
+        )
+        changed = list(pairs)
+        changed[3] = (changed[3][0], b"changed")
+        self.assertFalse(trie.verify_range_proof(start, end, changed, proof))
+
+        self.assertFalse(trie.verify_range_proof(b"key100", b"key160", pairs, proof))
+        self.assertFalse(trie.verify_range_proof(start, end, pairs, proof[:-1]))
+        self.assertFalse(trie.verify_range_proof(start, end, pairs, proof, keccak_hash(b"x")))
+        self.assertFalse(trie.verify_range_proof(start, end, pairs, []))
+
+    def test_secure_and_small(self):
+        """Test secure tries (hashed bounds) and tries with a small root."""
+        trie = self._trie(secure=True)
+        start, end = bytes([0x40]), bytes([0x80])
+        pairs, proof = trie.get_range_proof(start, end)
+        self.assertTrue(all(start <= key < end for key, _ in pairs))
+        self.assertTrue(trie.verify_range_proof(start, end, pairs, proof))
+
+        small = MerklePatriciaTrie({})
+        small.update(b"a", b"b")
+        pairs, proof = small.get_range_proof()
+        self.assertEqual(pairs, [(b"a", b"b")])
+        self.assertTrue(small.verify_range_proof(None, None, pairs, proof))
+
+        with self.assertRaises(ValueError):
+            MerklePatriciaTrie({}).get_range_proof()
+
+
 class Test_proof_of_inclusion(unittest.TestCase):
     """Test the proof functions of the MPT."""
 
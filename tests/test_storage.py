@@ -0,0 +1,224 @@
+import sys, os
+try:
+    from mpt.storage import SQLiteStorage, MappedStorage
+    from mpt.serialization import write_mapped_snapshot
+    from mpt.mpt import MerklePatriciaTrie
+    from mpt.mmpt import ModifiedMerklePatriciaTrie
+except (ImportError, ModuleNotFoundError):
+    #Following lines are for assigning parent directory dynamically.
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    parent_dir_path = os.path.abspath(os.path.join(dir_path, os.pardir))
+    sys.path.insert(0, parent_dir_path)
+    from src.mpt.storage import SQLiteStorage, MappedStorage
+    from src.mpt.serialization import write_mapped_snapshot
+    from src.mpt.mpt import MerklePatriciaTrie
+    from src.mpt.mmpt import ModifiedMerklePatriciaTrie
+from collections import ChainMap
+import unittest
+import tempfile
+import threading
+
+
+class TestSQLiteStorage(unittest.TestCase):
+    def test_mapping(self):
+        storage = SQLiteStorage(':memory:')
+        storage[b'a'] = b'1'
+        storage[b'b'] = b'2'
+
+        self.assertEqual(storage[b'a'], b'1')
+        self.assertIn(b'b', storage)
+        self.assertEqual(len(storage), 2)
+        self.assertEqual(sorted(storage.keys()), [b'a', b'b'])
+        self.assertEqual(sorted(storage.values()), [b'1', b'2'])
+
+        del storage[b'a']
+        self.assertNotIn(b'a', storage)
+        with self.assertRaises(KeyError):
+            storage[b'a']
+        with self.assertRaises(KeyError):
+            del storage[b'a']
+
+    def test_batch(self):
+        storage = SQLiteStorage(':memory:')
+        with storage.batch():
+            storage[b'a'] = b'1'
+            storage[b'b'] = b'2'
+            del storage[b'b']
+            self.assertEqual(storage[b'a'], b'1')
+            self.assertNotIn(b'b', storage)
+
+        self.assertEqual(len(storage), 1)
+
+        with self.assertRaises(RuntimeError):
+            with storage.batch():
+                storage[b'c'] = b'3'
+                raise RuntimeError()
+
+        self.assertNotIn(b'c', storage)
+
+    def test_trie_on_storage(self):
+        storage = SQLiteStorage(':memory:')
+        trie = MerklePatriciaTrie(storage)
+        dict_trie = MerklePatriciaTrie({})
+
+        data = [str(i).encode() for i in range(100)]
+        for kv in data:
+            trie.update(kv, kv * 2)
+            dict_trie.update(kv, kv * 2)
+        trie.delete(data[0])
+        dict_trie.delete(data[0])
+
+        self.assertEqual(trie.root_hash(), dict_trie.root_hash())
+        self.assertEqual(len(trie), len(dict_trie))
+        trie.prune()
+        self.assertEqual(trie.get(data[1]), data[1] * 2)
+
+    def test_reopen_from_stored_root(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trie.db')
+            data = [str(i).encode() for i in range(100)]
+
+            with SQLiteStorage(path) as storage:
+                trie = ModifiedMerklePatriciaTrie(storage)
+                trie.update_batch([(kv, kv) for kv in data])
+                storage.save_root(trie.root())
+                root_hash = trie.root_hash()
+
+            with SQLiteStorage(path) as storage:
+                trie = ModifiedMerklePatriciaTrie(storage, storage.load_root())
+                self.assertEqual(trie.root_hash(), root_hash)
+                self.assertEqual(trie.get(data[42]), data[42])
+                # Only the nodes on the path to the key are read.
+                self.assertLess(storage.cache_info()['size'], len(storage) / 2)
+
+    def test_readers_on_other_threads(self):
+        """Test if snapshots are read from other threads while the trie is updated."""
+        with tempfile.TemporaryDirectory() as directory:
+            with SQLiteStorage(os.path.join(directory, 'trie.db'), cache_size=0) as storage:
+                trie = MerklePatriciaTrie(storage, cache_size=0, auto_prune=50)
+                trie.update_batch([(str(i).encode(), b'0') for i in range(100)])
+
+                errors = []
+                done = threading.Event()
+
+                def read():
+                    try:
+                        while not done.is_set():
+                            snapshot = trie.snapshot()
+                            values = {snapshot.get(str(i).encode()) for i in range(0, 100, 3)}
+                            # Every round updates all keys, a version holds at most two values.
+                            if len(values) > 2:
+                                errors.append(values)
+                    except Exception as error:
+                        errors.append(error)
+
+                readers = [threading.Thread(target=read) for _ in range(3)]
+                for reader in readers:
+                    reader.start()
+                for round in range(1, 4):
+                    for i in range(100):
+                        trie.update(str(i).encode(), str(round).encode())
+                done.set()
+                for reader in readers:
+                    reader.join()
+
+                self.assertEqual(errors, [])
+                self.assertEqual(trie.get(b'99'), b'3')
+
+    def test_load_root_empty(self):
+        storage = SQLiteStorage(':memory:')
+        self.assertIsNone(storage.load_root())
+
+
+class TestMappedStorage(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._directory.name, 'trie.mpt')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_mapping(self):
+        nodes = {bytes([i]) * 32: str(i).encode() * (i + 1) for i in range(0, 256, 3)}
+        count = write_mapped_snapshot(self.path, b'root', nodes.items())
+        self.assertEqual(count, len(nodes))
+
+        with MappedStorage(self.path) as storage:
+            self.assertEqual(storage.root, b'root')
+            self.assertEqual(len(storage), len(nodes))
+            self.assertEqual(list(storage), sorted(nodes))
+            for key, node in nodes.items():
+                self.assertEqual(storage[key], node)
+            self.assertNotIn(b'\x01' * 32, storage)
+            self.assertNotIn(b'short', storage)
+            with self.assertRaises(KeyError):
+                storage[b'\x02' * 32]
+
+    def test_trie_round_trip(self):
+        trie = MerklePatriciaTrie({}, secure=True)
+        data = [str(i).encode() for i in range(1000)]
+        trie.update_batch([(kv, kv * 2) for kv in data])
+        trie.delete(data[0])
+        count = trie.to_mapped(self.path)
+        self.assertEqual(count, len(trie._storage))
+
+        mapped_trie = MerklePatriciaTrie({}, secure=True)
+        mapped_trie.from_mapped(self.path)
+        self.assertEqual(mapped_trie.root_hash(), trie.root_hash())
+        for kv in data[1:]:
+            self.assertEqual(mapped_trie.get(kv), kv * 2)
+        self.assertFalse(mapped_trie.contains(data[0]))
+        mapped_trie._storage.close()
+
+    def test_mmpt_round_trip(self):
+        trie = ModifiedMerklePatriciaTrie({})
+        trie.update_batch([(str(i).encode(), b'value') for i in range(100)])
+        trie.to_mapped(self.path)
+
+        mapped_trie = ModifiedMerklePatriciaTrie({})
+        mapped_trie.from_mapped(self.path)
+        proof = mapped_trie.get_proof_of_inclusion(b'42')
+        self.assertTrue(trie.verify_proof_of_inclusion(proof))
+        mapped_trie._storage.close()
+
+    def test_updates_in_memory(self):
+        trie = MerklePatriciaTrie({})
+        trie.update_batch([(str(i).encode(), b'value' * 10) for i in range(100)])
+        trie.to_mapped(self.path)
+
+        with MappedStorage(self.path) as storage:
+            read_only_trie = MerklePatriciaTrie(storage, storage.root)
+            with self.assertRaises(TypeError):
+                read_only_trie.update(b'1', b'new value' * 10)
+
+            layered_trie = MerklePatriciaTrie(ChainMap({}, storage), storage.root)
+            layered_trie.update(b'1', b'new value' * 10)
+            trie.update(b'1', b'new value' * 10)
+            self.assertEqual(layered_trie.root_hash(), trie.root_hash())
+            self.assertEqual(read_only_trie.get(b'1'), b'value' * 10)
+
+    def test_empty_trie(self):
+        MerklePatriciaTrie({}).to_mapped(self.path)
+        trie = MerklePatriciaTrie({})
+        trie.from_mapped(self.path)
+        self.assertIsNone(trie.root())
+        trie._storage.close()
+
+    def test_invalid_files(self):
+        with open(self.path, 'wb') as fileobj:
+            fileobj.write(b'not a snapshot file' * 10)
+        with self.assertRaises(ValueError):
+            MappedStorage(self.path)
+
+        write_mapped_snapshot(self.path, None, [(b'\x01' * 32, b'node')])
+        with open(self.path, 'r+b') as fileobj:
+            fileobj.truncate(100)
+        with self.assertRaises(ValueError):
+            MappedStorage(self.path)
+
+        with self.assertRaises(ValueError):
+            write_mapped_snapshot(self.path, None, [(b'short', b'node')])
+
+
+if __name__ == '__main__':
+    unittest.main()
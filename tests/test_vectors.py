@@ -54,6 +54,40 @@ class TestVectors(unittest.TestCase):
                 expected_root = normalize_value(data[test]['root'])
                 self.assertEqual(trie.root_hash(), expected_root, msg='Test {} failed'.format(test))
 
+    def run_testvector_batched(self, name, secure):
+        with open_testvector(name) as f:
+            data = json.load(f)
+            for test in data:
+                input_data = data[test]['in']
+                storage = {}
+                trie = MerklePatriciaTrie(storage, secure=secure)
+
+                data_samples = input_data if isinstance(input_data, list) else input_data.items()
+
+                # Group consecutive updates and deletes so the order of the vector is kept.
+                updates, deletes = [], []
+                for k, v in data_samples:
+                    k, v = normalize_kv(k, v)
+
+                    if v:
+                        if deletes:
+                            trie.delete_batch(deletes)
+                            deletes = []
+                        updates.append((k, v))
+                    else:
+                        if updates:
+                            trie.update_batch(updates)
+                            updates = []
+                        deletes.append(k)
+
+                if updates:
+                    trie.update_batch(updates)
+                if deletes:
+                    trie.delete_batch(deletes)
+
+                expected_root = normalize_value(data[test]['root'])
+                self.assertEqual(trie.root_hash(), expected_root, msg='Test {} failed'.format(test))
+
     def test_hex_encoded_securetrie_test(self):
         test_vector_name = 'hex_encoded_securetrie_test.json'
         secure = True
@@ -84,6 +118,16 @@ class TestVectors(unittest.TestCase):
 
         self.run_testvector(test_vector_name, secure)
 
+    def test_batched(self):
+        vectors = [('hex_encoded_securetrie_test.json', True),
+                   ('trieanyorder.json', False),
+                   ('trieanyorder_secureTrie.json', True),
+                   ('trietest.json', False),
+                   ('trietest_secureTrie.json', True)]
+
+        for test_vector_name, secure in vectors:
+            self.run_testvector_batched(test_vector_name, secure)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,177 @@
+import sys, os
+try:
+    from mpt import verify_inclusion, verify_exclusion, verify_proofs
+    from mpt.mpt import MerklePatriciaTrie
+    from mpt.mmpt import ModifiedMerklePatriciaTrie
+    from mpt.proof import Proof
+    from mpt.hash import keccak_hash
+    from mpt.nibble_path import NibblePath
+    from mpt.node import Node, Leaf
+except (ImportError, ModuleNotFoundError):
+    #Following lines are for assigning parent directory dynamically.
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    parent_dir_path = os.path.abspath(os.path.join(dir_path, os.pardir))
+    sys.path.insert(0, parent_dir_path)
+    from src.mpt import verify_inclusion, verify_exclusion, verify_proofs
+    from src.mpt.mpt import MerklePatriciaTrie
+    from src.mpt.mmpt import ModifiedMerklePatriciaTrie
+    from src.mpt.proof import Proof
+    from src.mpt.hash import keccak_hash
+    from src.mpt.nibble_path import NibblePath
+    from src.mpt.node import Node, Leaf
+import unittest
+
+
+class TestStatelessVerify(unittest.TestCase):
+    def _trie(self, secure):
+        trie = MerklePatriciaTrie({}, secure=secure)
+        for i in range(100):
+            key = str(i).encode()
+            trie.update(key, key * 3)
+        return trie
+
+    def test_inclusion(self):
+        for secure in (False, True):
+            trie = self._trie(secure)
+            root_hash = trie.root_hash()
+            for i in range(0, 100, 7):
+                key = str(i).encode()
+                proof = trie.get_proof_of_inclusion(key)
+                self.assertTrue(verify_inclusion(root_hash, key, proof, secure=secure))
+                self.assertFalse(verify_inclusion(keccak_hash(b'other'), key, proof, secure=secure))
+
+            self.assertFalse(verify_inclusion(root_hash, b'1', [], secure=secure))
+
+    def test_exclusion(self):
+        for secure in (False, True):
+            trie = self._trie(secure)
+            root_hash = trie.root_hash()
+            for key in (b'wolf', b'1000', b'x'):
+                proof = trie.get_proof_of_exclusion(key)
+                self.assertTrue(verify_exclusion(root_hash, key, proof, secure=secure))
+                self.assertFalse(verify_exclusion(keccak_hash(b'other'), key, proof, secure=secure))
+
+            self.assertFalse(verify_exclusion(root_hash, b'wolf', [], secure=secure))
+
+    def test_forged_exclusion(self):
+        """Test if proofs of exclusion for keys in the trie don't verify."""
+        null_leaf = Leaf(NibblePath(b'\x00'), 'null').encode()
+        for secure in (False, True):
+            trie = self._trie(secure)
+            root_hash = trie.root_hash()
+            inclusion = trie.get_proof_of_inclusion(b'7')
+
+            # The root only, the rest of the path is missing.
+            forged = [inclusion[0], null_leaf]
+            self.assertFalse(verify_exclusion(root_hash, b'7', forged, secure=secure))
+            self.assertFalse(trie.verify_proof_of_exclusion(b'7', forged))
+            # The whole path to the leaf of the key.
+            forged = inclusion + [null_leaf]
+            self.assertFalse(verify_exclusion(root_hash, b'7', forged, secure=secure))
+
+    def test_forged_inclusion(self):
+        """Test if proofs of inclusion don't verify for keys that are not in the trie."""
+        trie = MerklePatriciaTrie({}, secure=False)
+        trie.update(b'ab\x00', b'first' * 10)
+        trie.update(b'ac\x00', b'second' * 10)
+        root_hash = trie.root_hash()
+        proof = trie.get_proof_of_inclusion(b'ab\x00')
+        self.assertFalse(trie.contains(b'ab'))
+
+        # The path ends in the leaf of a longer key.
+        self.assertFalse(verify_inclusion(root_hash, b'ab', proof, secure=False))
+        self.assertFalse(trie.verify_proof_of_inclusion(b'ab', proof))
+        self.assertEqual(verify_proofs([Proof(b'ab', root_hash, proof, 'POI')], root_hash, secure=False), [False])
+        # The path leaves the nodes of the proof.
+        for key in (b'a', b'b', b'ad\x00'):
+            self.assertFalse(verify_inclusion(root_hash, key, proof, secure=False))
+        self.assertTrue(verify_inclusion(root_hash, b'ab\x00', proof, secure=False))
+
+        # The path ends in a branch without value.
+        trie = MerklePatriciaTrie({}, secure=False)
+        trie.update(b'a\x10', b'first' * 10)
+        trie.update(b'a\x20', b'second' * 10)
+        proof = trie.get_proof_of_inclusion(b'a\x10')
+        self.assertFalse(verify_inclusion(trie.root_hash(), b'a', proof, secure=False))
+        self.assertFalse(trie.verify_proof_of_inclusion(b'a', proof))
+
+    def test_small_root(self):
+        trie = MerklePatriciaTrie({}, secure=False)
+        trie.update(b'a', b'b')
+        root_hash = trie.root_hash()
+
+        self.assertTrue(verify_inclusion(root_hash, b'a', trie.get_proof_of_inclusion(b'a'), secure=False))
+        self.assertTrue(verify_exclusion(root_hash, b'c', trie.get_proof_of_exclusion(b'c'), secure=False))
+
+    def test_default_is_secure(self):
+        trie = self._trie(True)
+        proof = trie.get_proof_of_inclusion(b'5')
+        self.assertTrue(verify_inclusion(trie.root_hash(), b'5', proof))
+
+
+class TestVerifyProofs(unittest.TestCase):
+    def _proofs(self):
+        trie = ModifiedMerklePatriciaTrie({})
+        for i in range(200):
+            key = str(i).encode()
+            trie.update(key, key * 2)
+
+        proofs = [trie.get_proof_of_inclusion(str(i).encode()) for i in range(0, 200, 3)]
+        proofs += [trie.get_proof_of_exclusion(str(i).encode()) for i in range(300, 320)]
+        return trie, proofs
+
+    def test_batch(self):
+        trie, proofs = self._proofs()
+        self.assertEqual(verify_proofs(proofs, trie.root_hash()), [True] * len(proofs))
+        self.assertEqual(
+            verify_proofs(proofs, keccak_hash(b'other')), [False] * len(proofs)
+        )
+        self.assertEqual(verify_proofs([], trie.root_hash()), [])
+
+    def test_per_proof_results(self):
+        trie, proofs = self._proofs()
+        broken = Proof(b'1', trie.root_hash(), [node + b'o' for node in proofs[1].proof], 'POI')
+        wrong_key = Proof(b'250', trie.root_hash(), proofs[2].proof, 'POI')
+
+        results = verify_proofs([proofs[0], broken, wrong_key, proofs[-1]], trie.root_hash())
+        self.assertEqual(results, [True, False, False, True])
+
+        forged = Proof(b'3', trie.root_hash(), [proofs[1].proof[0], proofs[-1].proof[-1]], 'POE')
+        self.assertEqual(verify_proofs([forged], trie.root_hash()), [False])
+
+        with self.assertRaises(ValueError):
+            verify_proofs([Proof(b'1', trie.root_hash(), proofs[0].proof, 'OTHER')], trie.root_hash())
+
+    def test_shared_nodes_decoded_once(self):
+        """Test if nodes shared by the proofs are decoded once for the batch."""
+        trie, proofs = self._proofs()
+        decode = Node.decode
+        decoded = []
+
+        def counting_decode(encoded_node, *args):
+            decoded.append(encoded_node)
+            return decode(encoded_node, *args)
+
+        Node.decode = staticmethod(counting_decode)
+        try:
+            self.assertTrue(all(verify_proofs(proofs, trie.root_hash())))
+            batch_decodes = len(decoded)
+            del decoded[:]
+            for proof in proofs:
+                verify = verify_inclusion if proof.type == 'POI' else verify_exclusion
+                self.assertTrue(verify(trie.root_hash(), proof.target, proof.proof))
+        finally:
+            Node.decode = decode
+
+        distinct_nodes = {node for proof in proofs for node in proof.proof}
+        self.assertLessEqual(batch_decodes, len(distinct_nodes))
+        self.assertLess(batch_decodes, len(decoded) / 2)
+
+    def test_workers(self):
+        trie, proofs = self._proofs()
+        results = verify_proofs(proofs, trie.root_hash(), workers=2)
+        self.assertEqual(results, [True] * len(proofs))
+
+
+if __name__ == '__main__':
+    unittest.main()
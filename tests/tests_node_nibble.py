@@ -72,6 +72,58 @@ class TestNibblePath(unittest.TestCase):
         common = nibbles_a.combine(nibbles_b)
         self.assertEqual(common, NibblePath([0x23, 0x48]))
 
+    def test_common_prefix_length(self):
+        nibbles_a = NibblePath([0x12, 0x34, 0x56])
+        self.assertEqual(nibbles_a.common_prefix_length(NibblePath([0x12, 0x35])), 3)
+        self.assertEqual(nibbles_a.common_prefix_length(NibblePath([0x12])), 2)
+        self.assertEqual(nibbles_a.common_prefix_length(NibblePath([0x92])), 0)
+        self.assertEqual(nibbles_a.common_prefix_length(NibblePath([0x01, 0x23], offset=1)), 3)
+        self.assertEqual(nibbles_a.common_prefix_length(NibblePath([])), 0)
+
+    def test_starts_with(self):
+        nibbles = NibblePath([0x12, 0x34])
+        self.assertTrue(nibbles.starts_with(NibblePath([0x12])))
+        self.assertTrue(nibbles.starts_with(NibblePath([0x01], offset=1)))
+        self.assertTrue(nibbles.starts_with(NibblePath([])))
+        self.assertFalse(nibbles.starts_with(NibblePath([0x13])))
+        self.assertFalse(nibbles.starts_with(NibblePath([0x12, 0x34, 0x56])))
+
+        nibbles = nibbles.consume(1)
+        self.assertTrue(nibbles.starts_with(NibblePath([0x23])))
+
+    def test_consume_does_not_mutate(self):
+        nibbles = NibblePath([0x12, 0x34])
+        rest = nibbles.consume(1)
+
+        self.assertEqual(len(nibbles), 4)
+        self.assertEqual(nibbles.at(0), 0x1)
+        self.assertEqual(rest, NibblePath([0x02, 0x34], offset=1))
+        self.assertEqual(rest.consume(2), NibblePath([0x04], offset=1))
+        self.assertEqual(len(rest), 3)
+
+    def test_hash(self):
+        self.assertEqual(
+            hash(NibblePath([0x12, 0x34]).consume(1)), hash(NibblePath([0x02, 0x34], offset=1))
+        )
+        self.assertEqual(len({NibblePath([0x12]), NibblePath([0x01, 0x12], offset=2)}), 1)
+
+    def test_to_bytes(self):
+        self.assertEqual(NibblePath([0x12, 0x34]).to_bytes(), b'\x12\x34')
+        self.assertEqual(NibblePath([0x12, 0x34], offset=2).to_bytes(), b'\x34')
+        self.assertEqual(NibblePath([0x01], offset=1).combine(NibblePath([0x02, 0x34], offset=1)).to_bytes(), b'\x12\x34')
+        with self.assertRaises(ValueError):
+            NibblePath([0x12], offset=1).to_bytes()
+
+    def test_equal(self):
+        self.assertEqual(NibblePath([0x12, 0x34], offset=1), NibblePath([0x02, 0x34], offset=1))
+        self.assertNotEqual(NibblePath([0x12, 0x34], offset=1), NibblePath([0x12, 0x34]))
+        self.assertNotEqual(NibblePath([0x12]), b'\x12')
+
+    def test_encode_odd_after_consume(self):
+        nibbles = NibblePath([0x12, 0x34, 0x56]).consume(3)
+        self.assertEqual(nibbles.encode(True), b'\x34\x56')
+        self.assertEqual(NibblePath.decode(nibbles.encode(True)), nibbles)
+
 
 class TestNode(unittest.TestCase):
     def assertRoundtrip(self, raw_node, expected_type):